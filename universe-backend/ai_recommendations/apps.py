@@ -1,4 +1,10 @@
+import logging
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class AiRecommendationsConfig(AppConfig):
@@ -9,25 +15,102 @@ class AiRecommendationsConfig(AppConfig):
         from django.db.models.signals import post_save, post_delete
         from housing.models import HousingListing
         from marketplace.models import MarketplaceItem
-        from study_groups.models import StudyGroup
+        from study_groups.models import StudyGroup, GroupMembership
         from user_profiles.models import UserProfile, RoommateProfile
-        from . import faiss_service
+        from . import cold_start, query_cache, result_cache, warmup
+
+        def invalidate_user_caches(user_id):
+            query_cache.invalidate_user(user_id)
+            result_cache.invalidate_user(user_id)
+
+        def user_profile_changed(sender, instance, **kwargs):
+            invalidate_user_caches(instance.user_id)
+
+        def roommate_profile_changed(sender, instance, **kwargs):
+            user_id = UserProfile.objects.filter(
+                pk=instance.user_profile_id
+            ).values_list('user_id', flat=True).first()
+            if user_id is not None:
+                invalidate_user_caches(user_id)
+
+        # The handlers below are closures, so they must be connected with
+        # weak=False or they are garbage collected when ready() returns.
+        for signal in [post_save, post_delete]:
+            signal.connect(user_profile_changed, sender=UserProfile, weak=False)
+            signal.connect(roommate_profile_changed, sender=RoommateProfile, weak=False)
+
+        # Keep cached cold-start rankings free of rows that no longer pass
+        # the hybrid filters.
+        post_save.connect(cold_start.housing_listing_saved, sender=HousingListing)
+        post_delete.connect(cold_start.housing_listing_deleted, sender=HousingListing)
+        post_save.connect(cold_start.marketplace_item_saved, sender=MarketplaceItem)
+        post_delete.connect(cold_start.marketplace_item_deleted, sender=MarketplaceItem)
+        post_save.connect(cold_start.study_group_saved, sender=StudyGroup)
+        post_delete.connect(cold_start.study_group_deleted, sender=StudyGroup)
+        post_save.connect(cold_start.group_membership_saved, sender=GroupMembership)
+        post_delete.connect(cold_start.user_profile_deleted, sender=UserProfile)
+
+        # Opt-in: load the model and indexes now so the first request is not slow.
+        if warmup.should_warm_up():
+            try:
+                warmup.warm_up()
+            except Exception:
+                logger.exception('AI recommendations warm-up failed')
+
+        if getattr(settings, 'AI_RECOMMENDATIONS_INCREMENTAL_INDEXING', True):
+            from . import indexing
+
+            post_save.connect(indexing.housing_listing_saved, sender=HousingListing)
+            post_delete.connect(indexing.housing_listing_deleted, sender=HousingListing)
+            post_save.connect(indexing.marketplace_item_saved, sender=MarketplaceItem)
+            post_delete.connect(indexing.marketplace_item_deleted, sender=MarketplaceItem)
+            post_save.connect(indexing.study_group_saved, sender=StudyGroup)
+            post_delete.connect(indexing.study_group_deleted, sender=StudyGroup)
+            for signal in [post_save, post_delete]:
+                signal.connect(indexing.group_membership_changed, sender=GroupMembership)
+            post_save.connect(indexing.user_profile_saved, sender=UserProfile)
+            post_delete.connect(indexing.user_profile_deleted, sender=UserProfile)
+            for signal in [post_save, post_delete]:
+                signal.connect(indexing.roommate_profile_changed, sender=RoommateProfile)
+            return
+
+        from . import indexing
+
+        # The indexes keep their vectors until rebuilt; only the recorded
+        # texts of changed rows are dropped, so --if-stale rebuilds them.
+        post_save.connect(indexing.housing_listing_text_saved, sender=HousingListing)
+        post_delete.connect(indexing.housing_listing_text_deleted, sender=HousingListing)
+        post_save.connect(indexing.marketplace_item_text_saved, sender=MarketplaceItem)
+        post_delete.connect(indexing.marketplace_item_text_deleted, sender=MarketplaceItem)
+        post_save.connect(indexing.study_group_text_saved, sender=StudyGroup)
+        post_delete.connect(indexing.study_group_text_deleted, sender=StudyGroup)
+        post_save.connect(indexing.user_profile_text_saved, sender=UserProfile)
+        post_delete.connect(indexing.user_profile_text_deleted, sender=UserProfile)
+        for signal in [post_save, post_delete]:
+            signal.connect(indexing.roommate_profile_text_changed, sender=RoommateProfile)
+
+        # Only processes that have searched hold cached indexes; don't import
+        # faiss just to clear an empty cache (e.g. during seed_data).
+        def invalidate(index_name):
+            faiss_service = sys.modules.get('ai_recommendations.faiss_service')
+            if faiss_service is not None:
+                faiss_service.invalidate_cache(index_name)
 
         def invalidate_housing_cache(sender, **kwargs):
-            faiss_service.invalidate_cache('housing')
+            invalidate('housing')
 
         def invalidate_marketplace_cache(sender, **kwargs):
-            faiss_service.invalidate_cache('marketplace')
+            invalidate('marketplace')
 
         def invalidate_study_groups_cache(sender, **kwargs):
-            faiss_service.invalidate_cache('study_groups')
+            invalidate('study_groups')
 
         def invalidate_roommate_cache(sender, **kwargs):
-            faiss_service.invalidate_cache('roommate')
+            invalidate('roommate')
 
         for signal in [post_save, post_delete]:
-            signal.connect(invalidate_housing_cache, sender=HousingListing)
-            signal.connect(invalidate_marketplace_cache, sender=MarketplaceItem)
-            signal.connect(invalidate_study_groups_cache, sender=StudyGroup)
-            signal.connect(invalidate_roommate_cache, sender=UserProfile)
-            signal.connect(invalidate_roommate_cache, sender=RoommateProfile)
+            signal.connect(invalidate_housing_cache, sender=HousingListing, weak=False)
+            signal.connect(invalidate_marketplace_cache, sender=MarketplaceItem, weak=False)
+            signal.connect(invalidate_study_groups_cache, sender=StudyGroup, weak=False)
+            signal.connect(invalidate_roommate_cache, sender=UserProfile, weak=False)
+            signal.connect(invalidate_roommate_cache, sender=RoommateProfile, weak=False)
@@ -0,0 +1,188 @@
+"""
+Recommendations for many users at once, for precomputing and digests.
+
+Profiles are embedded in large batches and each domain's index is searched
+once per chunk of users with the whole query matrix. Filters shared by every
+user run inside FAISS; per-user filters (housing budget, excluding the user
+from their own roommate matches) are applied to the result matrix with
+NumPy. Results match the per-user pipelines in rag_pipeline.
+"""
+import numpy as np
+
+from . import cold_start
+from . import embedding_store
+from . import faiss_service
+from .indexing import HOUSING_SHARDS
+from .rag_pipeline import (
+    PIPELINES,
+    candidate_k,
+    finish_domain,
+    housing_attribute_filter,
+    housing_shards,
+    is_cold_start_user,
+    marketplace_attribute_filter,
+    study_group_attribute_filter,
+)
+from .text_builders import build_user_profile_text
+
+# Candidates fetched per user when a per-user filter may discard some; users
+# left with fewer than top_k fall back to a filtered single-user search.
+OVERFETCH = 4
+
+
+def _housing_row_mask(labels, attrs, entries):
+    """
+    Each user's budget (rent at most 120% of max_rent_budget). Listings
+    without an attribute row pass, as the per-user search cannot filter them.
+    """
+    if attrs is None or not len(attrs):
+        return np.ones(labels.shape, dtype=bool)
+    budgets = np.array([
+        float(rp.max_rent_budget) if rp is not None and rp.max_rent_budget else np.inf
+        for _, _, rp in entries
+    ])
+    positions = np.searchsorted(attrs['ids'], labels).clip(max=len(attrs) - 1)
+    found = attrs['ids'][positions] == labels
+    return ~found | (attrs['rent_price'][positions] <= budgets[:, None] * 1.2)
+
+
+def _roommate_row_mask(labels, attrs, entries):
+    """Users are not their own roommate match."""
+    user_ids = np.array([user.id for user, _, _ in entries], dtype=np.int64)
+    return labels != user_ids[:, None]
+
+
+# domain -> (index name, filter shared by all users, per-user row mask)
+BATCH_SEARCHES = {
+    'housing': ('housing', housing_attribute_filter(), _housing_row_mask),
+    'roommates': ('roommate', None, _roommate_row_mask),
+    'marketplace': ('marketplace', marketplace_attribute_filter, None),
+    'study_groups': ('study_groups', study_group_attribute_filter, None),
+}
+
+
+def _search_domain(domain, queries, entries, top_k):
+    """Search results for each entry, as the domain's PIPELINES search returns them."""
+    if domain == 'housing' and HOUSING_SHARDS:
+        return _search_housing_shards(queries, entries, top_k)
+    return _search_index(domain, BATCH_SEARCHES[domain][0], queries, entries, top_k)
+
+
+def _search_housing_shards(queries, entries, top_k):
+    """Housing searches routed as housing_shards routes them, one batch per shard."""
+    groups = {}
+    for row, (_, profile, _) in enumerate(entries):
+        shards = housing_shards(profile)
+        groups.setdefault(None if shards is None else tuple(shards), []).append(row)
+
+    search = PIPELINES['housing'][0]
+    results = [None] * len(entries)
+    for shards, rows in groups.items():
+        if shards is not None and len(shards) > 1:
+            # Multi-city markets merge several shards; search them per user.
+            for row in rows:
+                results[row] = search(*entries[row], queries[row], top_k)
+            continue
+        index_name = 'housing' if shards is None else faiss_service.shard_index_name('housing', shards[0])
+        group_results = _search_index(
+            'housing', index_name, queries[rows], [entries[row] for row in rows], top_k
+        )
+        for row, row_results in zip(rows, group_results):
+            results[row] = row_results
+    return results
+
+
+def _search_index(domain, index_name, queries, entries, top_k):
+    _, where, row_mask = BATCH_SEARCHES[domain]
+    if faiss_service.has_attributes(index_name):
+        search_k = keep_k = top_k
+    else:
+        # FAISS cannot filter; over-fetch and leave it to ranking, as _filtered_search.
+        search_k = keep_k = top_k * 3
+    if row_mask is not None:
+        search_k *= OVERFETCH
+
+    scores, labels, attrs = faiss_service.search_batch(index_name, queries, search_k, where)
+    valid = labels >= 0
+    if row_mask is not None and labels.size:
+        valid &= row_mask(labels, attrs, entries)
+
+    search = PIPELINES[domain][0]
+    results = []
+    for row, (user, profile, roommate_profile) in enumerate(entries):
+        keep = np.flatnonzero(valid[row])[:keep_k]
+        if len(keep) < keep_k and labels.shape[1] == search_k and labels[row, -1] >= 0:
+            # The row mask discarded too many candidates; more may exist.
+            results.append(search(user, profile, roommate_profile, queries[row], top_k))
+        else:
+            results.append([(int(labels[row, i]), float(scores[row, i])) for i in keep])
+    return results
+
+
+def _cold_start(domains, cold_entries, top_k):
+    """Cold-start results per user, from rankings fetched once per chunk."""
+    results = {user.id: {} for user, _, _ in cold_entries}
+    if not cold_entries:
+        return results
+
+    rankings = cold_start.get_rankings(domains, compute_missing=True)
+    for user, profile, _ in cold_entries:
+        for domain in domains:
+            results[user.id][domain] = cold_start.recommend(
+                domain, user, profile, top_k, rankings[domain]
+            )
+    return results
+
+
+def _recommend_chunk(users, top_k, domains):
+    from user_profiles.models import UserProfile
+
+    profiles = UserProfile.objects.filter(
+        user_id__in=[user.id for user in users]
+    ).select_related('roommate_profile')
+    profiles = {profile.user_id: profile for profile in profiles}
+
+    warm, cold = [], []
+    for user in users:
+        profile = profiles.get(user.id)
+        roommate_profile = getattr(profile, 'roommate_profile', None) if profile else None
+        entry = (user, profile, roommate_profile)
+        if profile is None or is_cold_start_user(profile, roommate_profile):
+            cold.append(entry)
+        else:
+            warm.append(entry)
+
+    results = _cold_start(domains, cold, top_k)
+    if not warm:
+        return results
+
+    queries = embedding_store.embed_texts([
+        build_user_profile_text(profile, roommate_profile) for _, profile, roommate_profile in warm
+    ])
+    for domain in domains:
+        candidates = _search_domain(domain, queries, warm, candidate_k(domain, top_k))
+        for (user, profile, roommate_profile), domain_results in zip(warm, candidates):
+            results.setdefault(user.id, {})[domain] = finish_domain(
+                domain, user, profile, roommate_profile, domain_results, top_k
+            )
+    return results
+
+
+def iter_recommendations(users, top_k=10, domains=None, batch_size=1024):
+    """
+    Compute recommendations for ``users`` in chunks of ``batch_size``.
+
+    Yields:
+        (user, {domain: [(id, score), ...]}) for every user, in order
+    """
+    domains = list(domains or PIPELINES)
+    chunk = []
+    for user in users:
+        chunk.append(user)
+        if len(chunk) == batch_size:
+            results = _recommend_chunk(chunk, top_k, domains)
+            yield from ((user, results[user.id]) for user in chunk)
+            chunk = []
+    if chunk:
+        results = _recommend_chunk(chunk, top_k, domains)
+        yield from ((user, results[user.id]) for user in chunk)
@@ -0,0 +1,399 @@
+"""
+Synthetic catalogs and measurements for the ``benchmark_recommendations``
+command.
+
+Rows are drawn from N_TOPICS topics (a subject and a part of town) with a
+skewed popularity, and their text is built by the production text builders.
+By default a row's vector is its topic's centroid plus noise, so vectors
+cluster the way real embeddings do without running the model; with
+``encode=True`` the texts are embedded with the configured model instead,
+which is realistic but slow for large catalogs.
+"""
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import numpy as np
+from django.utils import timezone
+
+from . import embeddings as emb
+from . import faiss_service
+from . import query_cache
+from . import rag_pipeline
+from .indexing import (
+    collect_attributes,
+    housing_listing_attributes,
+    marketplace_item_attributes,
+    study_group_attributes,
+    user_profile_attributes,
+)
+from .text_builders import (
+    build_housing_listing_text,
+    build_marketplace_item_text,
+    build_study_group_text,
+    build_user_profile_text,
+)
+
+N_TOPICS = 240
+# Topic popularity falls off as 1 / rank**TOPIC_SKEW.
+TOPIC_SKEW = 0.8
+# Norm of the noise added to a topic centroid; at 0.8 rows of one topic
+# have a cosine similarity of about 0.6.
+TOPIC_NOISE = 0.8
+
+SUBJECTS = (
+    'Computer Science', 'Mathematics', 'Biology', 'English Literature',
+    'Business Administration', 'Physics', 'Psychology', 'Mechanical Engineering',
+    'Chemistry', 'Political Science', 'Art History', 'Economics',
+    'Electrical Engineering', 'Sociology', 'Nursing', 'Music',
+    'Philosophy', 'Environmental Science', 'Statistics', 'Architecture',
+)
+PLACES = (
+    'North Campus', 'South Campus', 'East Village', 'West End', 'Downtown',
+    'Riverside', 'University Heights', 'Old Town', 'Midtown', 'Lakeside',
+    'College Hill', 'Greek Row',
+)
+INTERESTS = (
+    'hiking', 'reading', 'gaming', 'cooking', 'photography', 'music',
+    'basketball', 'yoga', 'painting', 'coding', 'movies', 'travel',
+    'swimming', 'chess', 'dancing', 'running', 'guitar', 'anime',
+    'volunteering', 'robotics', 'debate', 'writing', 'cycling', 'soccer',
+)
+HOUSING_TYPES = ('apartment', 'house', 'condo', 'townhouse', 'studio', 'room', 'shared_room')
+LEASE_TYPES = ('yearly', 'semester', 'monthly', 'sublease')
+ITEM_TYPES = ('furniture', 'electronics', 'books', 'clothing', 'kitchen', 'groceries', 'other')
+ITEM_NAMES = {
+    'furniture': ('desk', 'bookshelf', 'futon', 'office chair', 'dresser'),
+    'electronics': ('monitor', 'laptop', 'speaker', 'graphing calculator', 'headphones'),
+    'books': ('textbook', 'lab manual', 'study guide', 'reader', 'workbook'),
+    'clothing': ('winter jacket', 'lab coat', 'hoodie', 'rain boots', 'backpack'),
+    'kitchen': ('mini fridge', 'rice cooker', 'cookware set', 'kettle', 'microwave'),
+    'groceries': ('protein bars', 'coffee beans', 'snack box', 'tea sampler', 'cereal'),
+    'other': ('bicycle', 'yoga mat', 'desk lamp', 'air purifier', 'weighted blanket'),
+}
+CONDITIONS = ('new', 'like_new', 'good', 'fair', 'poor')
+FREQUENCIES = ('daily', 'weekly', 'biweekly', 'monthly', 'as_needed')
+PREFERENCES = ('yes', 'no', 'sometimes', 'no_preference')
+SLEEP_HABITS = ('early_riser', 'night_owl', 'average')
+STUDY_HABITS = ('in_room', 'library', 'other_places')
+# Listings and profiles are up to this old.
+MAX_AGE_DAYS = 180
+
+
+def _topic(topic):
+    return SUBJECTS[topic % len(SUBJECTS)], PLACES[topic // len(SUBJECTS) % len(PLACES)]
+
+
+def _created_at(rng):
+    return timezone.now() - timedelta(days=float(rng.uniform(0, MAX_AGE_DAYS)))
+
+
+def _housing_rows(rng, topics):
+    rows = []
+    for topic in topics:
+        subject, place = _topic(topic)
+        housing_type = HOUSING_TYPES[rng.integers(len(HOUSING_TYPES))]
+        bedrooms = int(rng.integers(1, 5))
+        rows.append(SimpleNamespace(
+            title=f'{bedrooms}BR {housing_type} in {place}',
+            housing_type=housing_type,
+            address=f'{rng.integers(1, 2000)} {place} Ave',
+            city='University Town',
+            state='CA',
+            rent_price=int(rng.integers(450, 2600)),
+            bedrooms=bedrooms,
+            bathrooms=int(rng.integers(1, 3)),
+            sq_ft=int(rng.integers(250, 1800)),
+            lease_type=LEASE_TYPES[rng.integers(len(LEASE_TYPES))],
+            distance_to_campus=round(float(rng.uniform(0.1, 6.0)), 1),
+            furnished=bool(rng.random() < 0.4),
+            pets_allowed=bool(rng.random() < 0.3),
+            parking=bool(rng.random() < 0.5),
+            laundry=bool(rng.random() < 0.6),
+            wifi_included=bool(rng.random() < 0.5),
+            ac=bool(rng.random() < 0.6),
+            utilities_included=bool(rng.random() < 0.3),
+            description=(
+                f'Quiet {housing_type} in {place}, popular with {subject} students. '
+                f'Close to the {subject} building, grocery stores and bus lines.'
+            ),
+            is_available=bool(rng.random() < 0.9),
+            posted_date=_created_at(rng),
+        ))
+    return rows
+
+
+def _marketplace_rows(rng, topics):
+    rows = []
+    for topic in topics:
+        subject, place = _topic(topic)
+        item_type = ITEM_TYPES[topic % len(ITEM_TYPES)]
+        name = ITEM_NAMES[item_type][rng.integers(len(ITEM_NAMES[item_type]))]
+        rows.append(SimpleNamespace(
+            title=f'{name.capitalize()} for {subject} students',
+            item_type=item_type,
+            price=int(rng.integers(5, 800)),
+            condition=CONDITIONS[rng.integers(len(CONDITIONS))],
+            location=place,
+            description=f'Selling my {name}, used for one semester of {subject}. Pick up in {place}.',
+            is_sold=bool(rng.random() < 0.15),
+        ))
+    return rows
+
+
+def _study_group_rows(rng, topics):
+    rows = []
+    for topic in topics:
+        subject, place = _topic(topic)
+        is_online = bool(rng.random() < 0.3)
+        rows.append(SimpleNamespace(
+            name=f'{subject} study group',
+            subject_area=subject,
+            course_code=f'{subject[:4].upper()} {rng.integers(100, 500)}',
+            meeting_frequency=FREQUENCIES[rng.integers(len(FREQUENCIES))],
+            is_online=is_online,
+            meeting_location=f'{place} library',
+            meeting_schedule='Tuesdays 6pm',
+            description=f'Problem sets and exam prep for {subject}, all levels welcome.',
+            is_active=bool(rng.random() < 0.9),
+            is_full=bool(rng.random() < 0.2),
+        ))
+    return rows
+
+
+def _profile_fields(rng, topic):
+    subject, place = _topic(topic)
+    interests = rng.choice(INTERESTS, size=4, replace=False)
+    profile = SimpleNamespace(
+        first_name='Student',
+        last_name=str(rng.integers(100000)),
+        course_major=subject,
+        bio=f'{subject} student living in {place}. I keep a tidy space and love {interests[0]}.',
+        interests=', '.join(interests),
+        date_joined=_created_at(rng),
+    )
+    roommate_profile = SimpleNamespace(
+        sleep_habits=SLEEP_HABITS[rng.integers(len(SLEEP_HABITS))],
+        study_habits=STUDY_HABITS[rng.integers(len(STUDY_HABITS))],
+        smoking_preference=PREFERENCES[rng.integers(len(PREFERENCES))],
+        drinking_preference=PREFERENCES[rng.integers(len(PREFERENCES))],
+        guests_preference=PREFERENCES[rng.integers(len(PREFERENCES))],
+        cleanliness_level=int(rng.integers(1, 6)),
+        max_rent_budget=int(rng.integers(600, 1800)),
+    )
+    return profile, roommate_profile
+
+
+def _roommate_rows(rng, topics):
+    rows = []
+    for topic in topics:
+        profile, roommate_profile = _profile_fields(rng, topic)
+        profile.roommate_profile = roommate_profile
+        rows.append(profile)
+    return rows
+
+
+# index name -> (row factory, text builder, attribute function)
+CATALOGS = {
+    'housing': (_housing_rows, build_housing_listing_text, housing_listing_attributes),
+    'marketplace': (_marketplace_rows, build_marketplace_item_text, marketplace_item_attributes),
+    'study_groups': (_study_group_rows, build_study_group_text, study_group_attributes),
+    'roommate': (
+        _roommate_rows, lambda row: build_user_profile_text(row, row.roommate_profile),
+        user_profile_attributes,
+    ),
+}
+
+# Filters the recommendation pipelines search each index with; housing uses
+# a typical budget.
+SEARCH_FILTERS = {
+    'housing': rag_pipeline.housing_attribute_filter(SimpleNamespace(max_rent_budget=1000)),
+    'marketplace': rag_pipeline.marketplace_attribute_filter,
+    'study_groups': rag_pipeline.study_group_attribute_filter,
+    'roommate': None,
+}
+
+
+class Topics:
+    """Topic centroids and popularity shared by every catalog of a run."""
+
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        centroids = rng.standard_normal((N_TOPICS, emb.EMBEDDING_DIM)).astype(np.float32)
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+        weights = 1.0 / np.arange(1, N_TOPICS + 1) ** TOPIC_SKEW
+        self.weights = weights / weights.sum()
+
+    def sample(self, rng, n):
+        return rng.choice(N_TOPICS, size=n, p=self.weights)
+
+    def vectors(self, rng, topics):
+        noise = rng.standard_normal((len(topics), emb.EMBEDDING_DIM)).astype(np.float32)
+        vectors = self.centroids[topics] + noise * (TOPIC_NOISE / np.sqrt(emb.EMBEDDING_DIM))
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def iter_catalog(index_name, size, topics, chunk_size=10_000, seed=0, encode=False):
+    """
+    Generate a catalog of ``size`` rows for ``index_name`` chunk by chunk.
+
+    Yields:
+        (ids, embeddings, attributes) for each chunk, as IndexBuilder.add takes them
+    """
+    make_rows, text_for, attributes_for = CATALOGS[index_name]
+    rng = np.random.default_rng([seed, list(CATALOGS).index(index_name)])
+    for start in range(0, size, chunk_size):
+        n = min(chunk_size, size - start)
+        chunk_topics = topics.sample(rng, n)
+        rows = make_rows(rng, chunk_topics)
+        if encode:
+            embeddings = emb.embed_texts([text_for(row) for row in rows])
+        else:
+            embeddings = topics.vectors(rng, chunk_topics)
+        ids = np.arange(start + 1, start + n + 1, dtype=np.int64)
+        attributes = collect_attributes(rows, attributes_for) if attributes_for else None
+        yield ids, embeddings, attributes
+
+
+def query_vectors(n, topics, seed=0, encode=False):
+    """Embeddings of ``n`` synthetic student profiles, drawn like catalog rows."""
+    rng = np.random.default_rng([seed, len(CATALOGS)])
+    chunk_topics = topics.sample(rng, n)
+    if not encode:
+        return topics.vectors(rng, chunk_topics)
+    texts = [
+        build_user_profile_text(*_profile_fields(rng, topic)) for topic in chunk_topics
+    ]
+    return emb.embed_texts(texts)
+
+
+def create_users(n, topics, seed=0):
+    """
+    Create ``n`` users with complete profiles, so every one of them takes the
+    warm pipeline. Run inside a transaction that is rolled back afterwards.
+    """
+    from django.contrib.auth import get_user_model
+    from user_profiles.models import RoommateProfile, UserProfile
+
+    rng = np.random.default_rng([seed, len(CATALOGS) + 1])
+    suffix = f'{time.time_ns():x}'
+    users = get_user_model().objects.bulk_create(
+        get_user_model()(username=f'benchmark_{suffix}_{i}', password='!') for i in range(n)
+    )
+    profiles, roommate_profiles = [], []
+    for user, topic in zip(users, topics.sample(rng, n)):
+        profile, roommate_profile = _profile_fields(rng, topic)
+        profiles.append(UserProfile(user=user, **vars(profile)))
+        roommate_profiles.append(roommate_profile)
+    profiles = UserProfile.objects.bulk_create(profiles)
+    RoommateProfile.objects.bulk_create(
+        RoommateProfile(user_profile=profile, **vars(roommate_profile))
+        for profile, roommate_profile in zip(profiles, roommate_profiles)
+    )
+    return users
+
+
+def latency_summary(seconds):
+    """Percentiles (ms) of a list of durations in seconds."""
+    ms = np.asarray(seconds) * 1000
+    return {
+        'n': int(len(ms)),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+    }
+
+
+def benchmark_build(index_name, chunks, size, neighbors=None):
+    """
+    Build ``index_name`` from ``chunks`` (see iter_catalog) with IndexBuilder,
+    timing only the index work, not generating or embedding rows.
+    """
+    builder = faiss_service.IndexBuilder(index_name, size)
+    build_seconds = generate_seconds = 0.0
+    chunks = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        generate_seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        ids, embeddings, attributes = chunk
+        start = time.perf_counter()
+        builder.add(embeddings, ids, attributes)
+        build_seconds += time.perf_counter() - start
+        if neighbors is not None:
+            neighbors.add(embeddings, ids)
+
+    published = time.perf_counter()
+    index = builder.publish()
+    build_seconds += time.perf_counter() - published
+    return {
+        'index_type': faiss_service.describe_index(index),
+        'ntotal': int(index.ntotal),
+        'build_seconds': build_seconds,
+        'vectors_per_second': index.ntotal / build_seconds if build_seconds else None,
+        'generate_seconds': generate_seconds,
+    }
+
+
+def benchmark_search(index_name, neighbors, where=None):
+    """
+    Time search_similar on ``neighbors``' queries and compare the results
+    with exact search. With ``where``, also time the filtered search.
+    """
+    k = neighbors.ids.shape[1]
+    # The first search loads the index.
+    faiss_service.search_similar(index_name, neighbors.queries[0], top_k=k)
+
+    seconds = []
+    hits = 0
+    for query, expected in zip(neighbors.queries, neighbors.ids):
+        start = time.perf_counter()
+        results = faiss_service.search_similar(index_name, query, top_k=k)
+        seconds.append(time.perf_counter() - start)
+        hits += len(set(expected.tolist()) & {item_id for item_id, _ in results})
+
+    report = {'search_similar': latency_summary(seconds)}
+    report['search_similar'][f'recall@{k}'] = hits / (len(neighbors.queries) * k)
+
+    if where is not None:
+        seconds = []
+        for query in neighbors.queries:
+            start = time.perf_counter()
+            faiss_service.search_similar(index_name, query, top_k=k, where=where)
+            seconds.append(time.perf_counter() - start)
+        report['search_similar_filtered'] = latency_summary(seconds)
+    return report
+
+
+RECOMMENDERS = {
+    'housing': rag_pipeline.get_housing_recommendations,
+    'roommates': rag_pipeline.get_roommate_recommendations,
+    'marketplace': rag_pipeline.get_marketplace_recommendations,
+    'study_groups': rag_pipeline.get_study_group_recommendations,
+    'all': rag_pipeline.get_all_recommendations,
+}
+
+
+def benchmark_recommendations(users, top_k=10, domains=None):
+    """
+    Time each get_*_recommendations end to end for every user, with the
+    query embedding cache cleared before each call so every call embeds the
+    profile. The result cache must be disabled by the caller.
+    """
+    report = {}
+    for domain, recommend in RECOMMENDERS.items():
+        if domains is not None and domain not in domains:
+            continue
+        recommend(users[0], top_k)  # warm up
+        seconds = []
+        for user in users:
+            query_cache.clear()
+            start = time.perf_counter()
+            recommend(user, top_k)
+            seconds.append(time.perf_counter() - start)
+        report[domain] = latency_summary(seconds)
+    return report
@@ -0,0 +1,277 @@
+"""
+Precomputed cold-start rankings.
+
+Users without enough profile signal get the same popular, recent items as
+everyone else, so each domain's ranking is computed once and kept in the
+Django cache named by AI_RECOMMENDATIONS_COLD_START_CACHE. Only rows that
+pass the domain's hybrid filter are ranked (available listings, unsold
+items, active groups with room), scored by
+
+    POPULARITY_WEIGHT * popularity + (1 - POPULARITY_WEIGHT) * recency
+
+where popularity is the log-scaled count of inquiries, messages, members or
+received roommate requests, and recency halves every
+AI_RECOMMENDATIONS_RANKING_RECENCY_HALF_LIFE_DAYS.
+
+Serving a ranking reads only the cache. Rankings older than REFRESH_SECONDS,
+or missing from the cache (served as empty meanwhile), are recomputed in
+the background; ``manage.py refresh_cold_start_rankings`` refreshes them
+from cron. Rows that stop passing the filter (sold, deleted,
+full...) are dropped from the cached ranking by the signal handlers below
+rather than waiting for a refresh.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Cache alias, or None to compute the rankings on every request.
+CACHE_ALIAS = getattr(settings, 'AI_RECOMMENDATIONS_COLD_START_CACHE', 'default')
+REFRESH_SECONDS = getattr(settings, 'AI_RECOMMENDATIONS_COLD_START_REFRESH', 600)
+# Items kept per ranking; the most a cold-start request can return.
+SIZE = getattr(settings, 'AI_RECOMMENDATIONS_COLD_START_SIZE', 100)
+POPULARITY_WEIGHT = getattr(settings, 'AI_RECOMMENDATIONS_COLD_START_POPULARITY_WEIGHT', 0.5)
+
+KEY_PREFIX = 'ai_recommendations:cold_start'
+
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cold-start-refresh')
+# Domains with a refresh queued or running.
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _key(domain):
+    return f'{KEY_PREFIX}:{domain}'
+
+
+# --- Ranked rows ---
+# Each returns values_list rows of (id, created, popularity, *extra columns)
+# for the rows passing the domain's hybrid filter.
+
+def _housing_rows():
+    from django.db.models import Count
+    from housing.models import HousingListing
+
+    return HousingListing.objects.filter(is_available=True).annotate(
+        popularity=Count('inquiries')
+    ).order_by('-pk').values_list('id', 'posted_date', 'popularity', 'rent_price')
+
+
+def _roommate_rows():
+    from django.db.models import Count
+    from user_profiles.models import UserProfile
+
+    return UserProfile.objects.annotate(
+        popularity=Count('user__received_roommate_requests')
+    ).order_by('-pk').values_list('user_id', 'date_joined', 'popularity')
+
+
+def _marketplace_rows():
+    from django.db.models import Count
+    from marketplace.models import MarketplaceItem
+
+    return MarketplaceItem.objects.filter(is_sold=False).annotate(
+        popularity=Count('messages')
+    ).order_by('-pk').values_list('id', 'posted_date', 'popularity')
+
+
+def _study_group_rows():
+    from django.db.models import Count, F, Q
+    from study_groups.models import StudyGroup
+
+    return StudyGroup.objects.filter(is_active=True).annotate(
+        popularity=Count('memberships', filter=Q(memberships__is_active=True))
+    ).filter(popularity__lt=F('max_members')).order_by('-pk').values_list(
+        'id', 'created_date', 'popularity'
+    )
+
+
+# domain -> (rows, extra column names)
+SOURCES = {
+    'housing': (_housing_rows, ('rent_price',)),
+    'roommates': (_roommate_rows, ()),
+    'marketplace': (_marketplace_rows, ()),
+    'study_groups': (_study_group_rows, ()),
+}
+
+
+def _empty_ranking(domain, computed_at):
+    entry = {'ids': [], 'computed_at': computed_at}
+    entry.update((column, []) for column in SOURCES[domain][1])
+    return entry
+
+
+def compute_ranking(domain):
+    """Rank the domain's rows; returns the entry stored in the cache."""
+    import numpy as np
+
+    from .ranking import recency
+
+    rows, extra_columns = SOURCES[domain]
+    rows = list(rows())
+    entry = _empty_ranking(domain, time.time())
+    if not rows:
+        return entry
+
+    timestamps = np.array([row[1].timestamp() if row[1] else np.nan for row in rows])
+    popularity = np.log1p(np.array([row[2] for row in rows], dtype=np.float64))
+    if popularity.max() > 0:
+        popularity /= popularity.max()
+    scores = POPULARITY_WEIGHT * popularity + (1 - POPULARITY_WEIGHT) * recency(timestamps)
+
+    # One spare roommate, as a user's own profile is left out when served.
+    size = SIZE + 1 if domain == 'roommates' else SIZE
+    order = np.argsort(-scores, kind='stable')[:size]
+    entry['ids'] = [rows[i][0] for i in order]
+    for offset, column in enumerate(extra_columns, start=3):
+        entry[column] = [float(rows[i][offset]) for i in order]
+    return entry
+
+
+def refresh(domains):
+    """Recompute and cache the rankings of ``domains``; returns {domain: entry}."""
+    rankings = {domain: compute_ranking(domain) for domain in domains}
+    if CACHE_ALIAS is not None:
+        caches[CACHE_ALIAS].set_many(
+            {_key(domain): entry for domain, entry in rankings.items()}, timeout=None
+        )
+    return rankings
+
+
+def refresh_in_background(domains):
+    with _refreshing_lock:
+        domains = [domain for domain in domains if domain not in _refreshing]
+        _refreshing.update(domains)
+    if not domains:
+        return
+
+    def run():
+        try:
+            refresh(domains)
+        except Exception:
+            logger.exception('Refreshing %s cold-start rankings failed', domains)
+        finally:
+            with _refreshing_lock:
+                _refreshing.difference_update(domains)
+            close_old_connections()
+
+    _refresh_executor.submit(run)
+
+
+def get_rankings(domains, compute_missing=False):
+    """
+    {domain: ranking entry} from the cache. Stale rankings are refreshed in
+    the background, and so are missing ones, which are served empty until
+    then unless ``compute_missing`` is set (for offline callers).
+    """
+    if CACHE_ALIAS is None:
+        return refresh(domains)
+
+    entries = caches[CACHE_ALIAS].get_many([_key(domain) for domain in domains])
+    rankings = {domain: entries.get(_key(domain)) for domain in domains}
+    missing = [domain for domain, entry in rankings.items() if entry is None]
+    if missing and compute_missing:
+        rankings.update(refresh(missing))
+    else:
+        # computed_at 0 marks them stale, so the refresh below picks them up.
+        rankings.update((domain, _empty_ranking(domain, 0.0)) for domain in missing)
+    now = time.time()
+    stale = [
+        domain for domain, entry in rankings.items()
+        if now - entry['computed_at'] > REFRESH_SECONDS
+    ]
+    if stale:
+        refresh_in_background(stale)
+    return rankings
+
+
+def recommend(domain, user, profile, top_k, ranking=None):
+    """
+    Cold-start results for a user from the domain's ranking (fetched if not
+    given): housing within 120% of their budget, roommates other than
+    themselves.
+
+    Returns:
+        [(id, 0.0), ...], at most top_k and at most SIZE
+    """
+    if ranking is None:
+        ranking = get_rankings([domain])[domain]
+    ids = ranking['ids']
+
+    if domain == 'housing':
+        roommate_profile = getattr(profile, 'roommate_profile', None) if profile else None
+        if roommate_profile and roommate_profile.max_rent_budget:
+            limit = float(roommate_profile.max_rent_budget) * 1.2
+            ids = [
+                item_id for item_id, rent in zip(ids, ranking['rent_price']) if rent <= limit
+            ]
+    elif domain == 'roommates':
+        if profile is None:
+            return []
+        ids = [user_id for user_id in ids if user_id != user.id]
+    return [(item_id, 0.0) for item_id in ids[:top_k]]
+
+
+def discard(domain, item_ids):
+    """Drop ``item_ids`` from the cached ranking of ``domain``."""
+    if CACHE_ALIAS is None:
+        return
+    cache = caches[CACHE_ALIAS]
+    entry = cache.get(_key(domain))
+    if entry is None:
+        return
+    item_ids = set(item_ids)
+    keep = [i for i, item_id in enumerate(entry['ids']) if item_id not in item_ids]
+    if len(keep) == len(entry['ids']):
+        return
+    # Not atomic: a concurrent discard or refresh may win, which the next
+    # refresh corrects.
+    entry = {
+        column: [values[i] for i in keep] if isinstance(values, list) else values
+        for column, values in entry.items()
+    }
+    cache.set(_key(domain), entry, timeout=None)
+
+
+# --- Signal handlers ---
+
+def housing_listing_saved(sender, instance, **kwargs):
+    if not instance.is_available:
+        discard('housing', [instance.pk])
+
+
+def housing_listing_deleted(sender, instance, **kwargs):
+    discard('housing', [instance.pk])
+
+
+def marketplace_item_saved(sender, instance, **kwargs):
+    if instance.is_sold:
+        discard('marketplace', [instance.pk])
+
+
+def marketplace_item_deleted(sender, instance, **kwargs):
+    discard('marketplace', [instance.pk])
+
+
+def study_group_saved(sender, instance, **kwargs):
+    if not instance.is_active:
+        discard('study_groups', [instance.pk])
+
+
+def study_group_deleted(sender, instance, **kwargs):
+    discard('study_groups', [instance.pk])
+
+
+def group_membership_saved(sender, instance, **kwargs):
+    if instance.is_active and instance.group.is_full:
+        discard('study_groups', [instance.group_id])
+
+
+def user_profile_deleted(sender, instance, **kwargs):
+    discard('roommates', [instance.user_id])
@@ -0,0 +1,129 @@
+"""
+Micro-batching front end for query embeddings.
+
+Concurrent ``embed_text`` calls are queued to one background thread that
+collects them for a few milliseconds and encodes them in a single forward
+pass; on CPU a batch of 16 short texts costs little more than one.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+
+from . import embeddings as emb
+
+logger = logging.getLogger(__name__)
+
+# Set to False to encode in the calling thread, as before.
+BATCHING_ENABLED = getattr(settings, 'AI_RECOMMENDATIONS_EMBEDDING_BATCHING', True)
+# How long the first request of a batch waits for others to join it.
+BATCH_WINDOW_MS = getattr(settings, 'AI_RECOMMENDATIONS_EMBEDDING_BATCH_WINDOW_MS', 3)
+MAX_BATCH_SIZE = getattr(settings, 'AI_RECOMMENDATIONS_EMBEDDING_MAX_BATCH', 32)
+
+
+class EmbeddingBatcher:
+    """
+    Background thread that encodes queued texts in micro-batches.
+
+    The thread is started on first use and restarted in a forked child
+    process, where the parent's thread does not exist.
+    """
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE):
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # Requests queued before a fork belong to the parent.
+                self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def submit(self, text):
+        """Queue ``text`` for encoding and return a Future for its vector."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [
+                (text, future) for text, future in self._next_batch()
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            try:
+                vectors = emb.embed_texts([text for text, _ in batch])
+            except Exception as exc:
+                logger.exception('Embedding batch of %d texts failed', len(batch))
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+_batcher = EmbeddingBatcher()
+
+
+def submit(text):
+    """
+    Embed ``text`` in the background.
+
+    Returns:
+        concurrent.futures.Future resolving to an L2-normalized 384-dim vector
+    """
+    if not BATCHING_ENABLED:
+        future = Future()
+        try:
+            future.set_result(emb.embed_text(text))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+    return _batcher.submit(text)
+
+
+def embed_text(text, timeout=None):
+    """Embed a single text, sharing a forward pass with concurrent callers."""
+    if not BATCHING_ENABLED:
+        return emb.embed_text(text)
+    return _batcher.submit(text).result(timeout)
+
+
+async def aembed_text(text):
+    """Awaitable embed_text for async views; does not block the event loop."""
+    if not BATCHING_ENABLED:
+        return await asyncio.get_running_loop().run_in_executor(None, emb.embed_text, text)
+    return await asyncio.wrap_future(_batcher.submit(text))
@@ -0,0 +1,226 @@
+"""
+Persistent embedding cache used by ``rebuild_faiss_indexes``.
+
+Embeddings are keyed by a hash of the model version and the built text, so a
+rebuild only encodes rows whose text changed since the last run. Several
+processes may share a store: appends are serialized with a file lock and each
+process picks up rows the others appended. ``rebuild_faiss_indexes`` compacts
+the store afterwards, dropping rows no index uses any more.
+"""
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from . import embeddings as emb
+
+STORE_DIR = os.path.join(settings.BASE_DIR, 'faiss_indexes', 'embedding_store')
+
+# Keys are hex SHA-1 digests stored as fixed-width ASCII records.
+KEY_SIZE = 40
+
+# compact() rewrites the store once at least this share of its rows is dead.
+COMPACT_MIN_GARBAGE = getattr(settings, 'AI_RECOMMENDATIONS_EMBEDDING_STORE_COMPACT_MIN_GARBAGE', 0.25)
+# Rows copied at a time while compacting.
+COMPACT_CHUNK_ROWS = 100_000
+
+# One store per model: {model_name: EmbeddingStore}
+_stores = {}
+
+
+def text_key(text, model_name=emb.MODEL_VERSION):
+    """Return the cache key for ``text`` embedded with ``model_name``."""
+    return hashlib.sha1(f'{model_name}\n{text}'.encode('utf-8')).hexdigest().encode('ascii')
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk cache of embeddings for a single model.
+
+    Vectors live in a raw float32 file read through a memory map; a parallel
+    file of fixed-width text hashes maps each key to its row.
+    """
+
+    def __init__(self, model_name=emb.MODEL_VERSION, dim=emb.EMBEDDING_DIM, directory=STORE_DIR):
+        slug = model_name.replace('/', '__')
+        self.model_name = model_name
+        self.dim = dim
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, f'{slug}.f32')
+        self.keys_path = os.path.join(directory, f'{slug}.keys')
+        self.lock_path = os.path.join(directory, f'{slug}.lock')
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._n_rows = 0  # rows read from the files, including duplicate keys
+        self._vectors = None
+        self._keys_file_id = None  # compaction replaces the files
+
+    def _row_bytes(self):
+        return self.dim * np.dtype(np.float32).itemsize
+
+    def _map_vectors(self, n_rows):
+        if n_rows == 0:
+            self._vectors = None
+        else:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode='r', shape=(n_rows, self.dim)
+            )
+
+    def _rows_on_disk(self):
+        """Complete rows in the files; vectors are written before their keys."""
+        try:
+            n_keys = os.path.getsize(self.keys_path) // KEY_SIZE
+            n_vectors = os.path.getsize(self.vectors_path) // self._row_bytes()
+        except OSError:
+            return 0
+        return min(n_keys, n_vectors)
+
+    def _file_id(self):
+        try:
+            stat = os.stat(self.keys_path)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _load(self):
+        """
+        Read rows appended since the last call, by this or another process,
+        or every row if the store was compacted since. Must be called under
+        _locked(), as compaction replaces both files.
+        """
+        file_id = self._file_id()
+        if file_id != self._keys_file_id:
+            self._rows = {}
+            self._n_rows = 0
+            self._vectors = None
+            self._keys_file_id = file_id
+        n_rows = self._rows_on_disk()
+        if n_rows <= self._n_rows:
+            return
+
+        with open(self.keys_path, 'rb') as f:
+            f.seek(self._n_rows * KEY_SIZE)
+            keys = np.frombuffer(f.read((n_rows - self._n_rows) * KEY_SIZE), dtype=f'S{KEY_SIZE}')
+        for offset, key in enumerate(keys.tolist()):
+            self._rows[key] = self._n_rows + offset
+        self._n_rows = n_rows
+        self._map_vectors(n_rows)
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, keys, vectors):
+        with self._locked():
+            self._load()
+            # Another process may have stored some of these while we encoded.
+            new = [i for i, key in enumerate(keys) if key not in self._rows]
+            if not new:
+                return
+            with open(self.vectors_path, 'ab') as vectors_file, open(self.keys_path, 'ab') as keys_file:
+                # An interrupted append can leave either file with a partial
+                # or unmatched trailing row; cut both back to the complete
+                # rows so this append stays aligned.
+                vectors_file.truncate(self._n_rows * self._row_bytes())
+                keys_file.truncate(self._n_rows * KEY_SIZE)
+                vectors_file.write(np.ascontiguousarray(vectors[new], dtype=np.float32).tobytes())
+                vectors_file.flush()
+                keys_file.write(b''.join(keys[i] for i in new))
+            if self._keys_file_id is None:
+                self._keys_file_id = self._file_id()
+            for offset, i in enumerate(new):
+                self._rows[keys[i]] = self._n_rows + offset
+            self._n_rows += len(new)
+            self._map_vectors(self._n_rows)
+
+    def embed_texts(self, texts):
+        """
+        Embed ``texts``, reusing stored vectors and encoding only unseen texts.
+
+        Returns:
+            numpy array of shape (len(texts), dim) with L2-normalized vectors
+        """
+        with self._locked():
+            self._load()
+        result = np.empty((len(texts), self.dim), dtype=np.float32)
+
+        hit_positions = []
+        hit_rows = []
+        missing = {}  # key -> (text, [positions])
+        for position, text in enumerate(texts):
+            key = text_key(text, self.model_name)
+            row = self._rows.get(key)
+            if row is not None:
+                hit_positions.append(position)
+                hit_rows.append(row)
+            else:
+                missing.setdefault(key, (text, []))[1].append(position)
+
+        if hit_rows:
+            result[hit_positions] = self._vectors[hit_rows]
+        self.hits += len(hit_rows)
+
+        if missing:
+            keys = list(missing)
+            encoded = emb.embed_texts([missing[key][0] for key in keys])
+            for key, vector in zip(keys, encoded):
+                result[missing[key][1]] = vector
+            self._append(keys, encoded)
+            self.misses += len(keys)
+
+        return result
+
+    def compact(self, live_keys, min_garbage=COMPACT_MIN_GARBAGE):
+        """
+        Rewrite the store with only the rows of ``live_keys``, if at least
+        ``min_garbage`` of its rows are not among them.
+
+        Returns:
+            number of rows dropped
+        """
+        with self._locked():
+            self._load()
+            rows = sorted({self._rows[key] for key in live_keys if key in self._rows})
+            dropped = self._n_rows - len(rows)
+            if not dropped or dropped < min_garbage * self._n_rows:
+                return 0
+
+            row_keys = {row: key for key, row in self._rows.items()}
+            tmp_vectors_path = f'{self.vectors_path}.tmp'
+            tmp_keys_path = f'{self.keys_path}.tmp'
+            with open(tmp_vectors_path, 'wb') as vectors_file, open(tmp_keys_path, 'wb') as keys_file:
+                for start in range(0, len(rows), COMPACT_CHUNK_ROWS):
+                    chunk = rows[start:start + COMPACT_CHUNK_ROWS]
+                    vectors_file.write(np.ascontiguousarray(self._vectors[chunk]).tobytes())
+                    keys_file.write(b''.join(row_keys[row] for row in chunk))
+            # Readers take the lock too, so they never see one file replaced
+            # without the other.
+            os.replace(tmp_vectors_path, self.vectors_path)
+            os.replace(tmp_keys_path, self.keys_path)
+
+            self._rows = {row_keys[row]: i for i, row in enumerate(rows)}
+            self._n_rows = len(rows)
+            self._keys_file_id = self._file_id()
+            self._map_vectors(self._n_rows)
+        return dropped
+
+
+def get_store(model_name=emb.MODEL_VERSION):
+    if model_name not in _stores:
+        _stores[model_name] = EmbeddingStore(model_name)
+    return _stores[model_name]
+
+
+def embed_texts(texts):
+    """Embed multiple texts through the persistent store for the active model."""
+    return get_store().embed_texts(texts)
@@ -2,15 +2,84 @@ import os
 os.environ.setdefault('USE_TF', '0')
 
 import numpy as np
+from django.conf import settings
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIM = 384
+
+# Inference backend for the model:
+#   'torch'       full-precision PyTorch (reference)
+#   'torch_int8'  PyTorch with dynamic int8 quantization of the Linear layers
+#   'onnx'        ONNX Runtime, fp32
+#   'onnx_int8'   ONNX Runtime with the int8 export shipped in the model repo
+# The ONNX backends need `pip install sentence-transformers[onnx]`.
+BACKEND = getattr(settings, 'AI_RECOMMENDATIONS_EMBEDDING_BACKEND', 'torch')
+ONNX_INT8_FILE = getattr(
+    settings, 'AI_RECOMMENDATIONS_EMBEDDING_ONNX_INT8_FILE', 'onnx/model_quint8_avx2.onnx'
+)
+
+# Identifies the vectors a backend produces; quantized backends differ
+# slightly from the reference, so cached embeddings are kept apart.
+MODEL_VERSION = MODEL_NAME if BACKEND == 'torch' else f'{MODEL_NAME}@{BACKEND}'
+
+# Texts used by check_parity() when none are given.
+PARITY_SAMPLE_TEXTS = [
+    'Quiet non-smoker looking for a roommate near campus, early riser, budget $900.',
+    'Spacious 2 bedroom apartment, furnished, 5 minutes walk to the university library.',
+    'Used calculus textbook, 8th edition, good condition, some highlighting.',
+    'Weekly study group for organic chemistry midterm prep, all levels welcome.',
+    'Computer science major who likes hiking, board games and cooking.',
+    'Mini fridge for sale, barely used, pick up at north campus dorms.',
+    'Looking for a clean and social roommate, night owl, pets are fine.',
+    'Linear algebra problem-solving sessions every Tuesday evening.',
+]
 
 _model = None
 
 
+def _load_torch():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
+
+
+def _load_torch_int8():
+    import torch
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(MODEL_NAME, device='cpu')
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_onnx():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME, backend='onnx')
+
+
+def _load_onnx_int8():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(
+        MODEL_NAME, backend='onnx', model_kwargs={'file_name': ONNX_INT8_FILE}
+    )
+
+
+BACKENDS = {
+    'torch': _load_torch,
+    'torch_int8': _load_torch_int8,
+    'onnx': _load_onnx,
+    'onnx_int8': _load_onnx_int8,
+}
+
+
+def load_model(backend):
+    """Load the embedding model with the given backend (uncached)."""
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown embedding backend: {backend}')
+    return BACKENDS[backend]()
+
+
 def _get_model():
     global _model
     if _model is None:
-        from sentence_transformers import SentenceTransformer
-        _model = SentenceTransformer('all-MiniLM-L6-v2')
+        _model = load_model(BACKEND)
     return _model
 
 
@@ -26,3 +95,32 @@ def embed_texts(texts: list[str]) -> np.ndarray:
     model = _get_model()
     embeddings = model.encode(texts, normalize_embeddings=True, batch_size=32)
     return embeddings.astype(np.float32)
+
+
+def check_parity(backend=BACKEND, texts=None, tolerance=0.01):
+    """
+    Compare ``backend`` against the full-precision torch model.
+
+    Checks both that each text's vector points the same way (cosine to the
+    reference vector) and that pairwise similarity scores, which drive the
+    rankings, move by at most ``tolerance``.
+
+    Returns:
+        dict with min_self_cosine, max_score_error and passed
+    """
+    texts = texts or PARITY_SAMPLE_TEXTS
+    reference = load_model('torch').encode(texts, normalize_embeddings=True).astype(np.float32)
+    candidate = load_model(backend).encode(texts, normalize_embeddings=True).astype(np.float32)
+
+    self_cosine = np.sum(reference * candidate, axis=1)
+    score_error = np.abs(reference @ reference.T - candidate @ candidate.T)
+
+    min_self_cosine = float(self_cosine.min())
+    max_score_error = float(score_error.max())
+    return {
+        'backend': backend,
+        'texts': len(texts),
+        'min_self_cosine': min_self_cosine,
+        'max_score_error': max_score_error,
+        'passed': min_self_cosine >= 1 - tolerance and max_score_error <= tolerance,
+    }
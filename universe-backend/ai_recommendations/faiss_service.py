@@ -1,71 +1,816 @@
+import fcntl
+import heapq
+import logging
 import os
+import pickle
+import shutil
+import struct
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import numpy as np
 import faiss
 from django.conf import settings
 
-FAISS_DIR = os.path.join(settings.BASE_DIR, 'faiss_indexes')
+from . import index_paths
+from .index_paths import CURRENT_LINK, current_generation
+
+logger = logging.getLogger(__name__)
+
+# Memory-map index files and attribute arrays instead of reading them into
+# private memory, so worker processes on one host share pages through the OS
+# page cache and loading is near-instant.
+MMAP_INDEXES = getattr(settings, 'AI_RECOMMENDATIONS_FAISS_MMAP', True)
+
+# Index type and search settings, overridable per index name through
+# settings.AI_RECOMMENDATIONS_FAISS_INDEXES = {'default': {...}, 'marketplace': {...}}
+DEFAULT_INDEX_CONFIG = {
+    # 'flat', 'ivf_flat', 'ivf_pq', 'hnsw', or 'auto' to choose from the catalog size
+    'type': 'auto',
+    # IVF: number of centroids (None = 4 * sqrt(N)) and lists probed per query
+    'nlist': None,
+    'nprobe': 16,
+    # IVF: vectors k-means is trained on; streamed builds buffer this many
+    'max_training_points': 100_000,
+    # IVF-PQ: sub-quantizers (must divide the embedding dimension)
+    'pq_m': 48,
+    # HNSW: graph degree and search-time candidate list size
+    'hnsw_m': 32,
+    'ef_construction': 80,
+    'ef_search': 64,
+    # 'auto' thresholds on N
+    'auto_ivf_min': 50_000,
+    'auto_ivf_pq_min': 1_000_000,
+}
+
+# k-means needs enough points per centroid to train meaningfully.
+MIN_POINTS_PER_CENTROID = 39
+PQ_MIN_TRAINING_POINTS = 256
+
+# Each index lives in versioned generation directories under
+# FAISS_DIR/<index_name>/ (see index_paths), with a CURRENT symlink naming
+# the live one:
+#
+#   faiss_indexes/housing/CURRENT -> 00001760000000000000-4242
+#   faiss_indexes/housing/00001760000000000000-4242/index.faiss
+#   faiss_indexes/housing/00001760000000000000-4242/attrs.npy
+#
+# Rebuilds write a complete new generation and swap CURRENT atomically, so
+# every worker process picks it up on its next search by comparing the link
+# target with the generation it has cached.
+#
+# Single-row changes (upsert_vector, update_attributes, remove_ids) are not
+# written into the index. They are appended to the generation's delta log,
+#
+#   faiss_indexes/housing/00001760000000000000-4242/delta.log
+#
+# which every process reads into a DeltaOverlay on its next search (one
+# stat() when nothing changed): upserted vectors are searched exactly next
+# to the index, while their old vectors and removed rows are filtered out of
+# the index search. Once a log holds COMPACT_AFTER records it is folded into
+# a new generation in the background.
+#
+# A rebuild reads the catalog while single-row changes keep arriving, so
+# IndexBuilder notes where the live delta log ends when it starts, and
+# publish() copies the records appended after that into the new
+# generation's log. Compaction waits while a rebuild holds REBUILD_LOCK,
+# which keeps the noted log current until then.
+INDEX_FILE = 'index.faiss'
+ATTRS_FILE = 'attrs.npy'
+DELTA_FILE = 'delta.log'
+REBUILD_LOCK = '.rebuilding'
+
+# Delta log records: a little-endian uint32 length, then the pickled
+# (op, item_id, vector, attributes) tuple.
+_DELTA_HEADER = struct.Struct('<I')
+
+# Generations published by compaction are named after the full build they
+# descend from, <epoch>.<time>-<pid>, so that caches of search results can
+# be keyed on the epoch, which only a rebuild changes.
+EPOCH_SEPARATOR = '.'
+
+# An index may also be partitioned into shards, each a separate index named
+# <index_name>@<shard> (e.g. housing@austin-tx) with its own generations.
+SHARD_SEPARATOR = '@'
 
-# In-memory cache: {index_name: (faiss_index, id_list)}
+# Generations kept on disk besides the live one, for workers still reading them.
+KEEP_GENERATIONS = getattr(settings, 'AI_RECOMMENDATIONS_FAISS_KEEP_GENERATIONS', 2)
+
+# Delta log records after which the log is folded into a new generation.
+COMPACT_AFTER = getattr(settings, 'AI_RECOMMENDATIONS_FAISS_COMPACT_AFTER', 1000)
+
+# One generation of an index as loaded by this process. The index and its
+# base attribute array always come from the same directory; ``attrs`` is
+# ``base_attrs`` with the overlay's changes applied.
+IndexGeneration = namedtuple(
+    'IndexGeneration', ['generation', 'index', 'attrs', 'base_attrs', 'overlay']
+)
+
+# In-memory cache: {index_name: IndexGeneration}
+# Indexes are ID-mapped, so search results carry model PKs directly. Cached
+# generations are never modified in place (memory-mapped ones cannot be);
+# delta log records are applied to a copy that replaces the cached entry, so
+# searches need no lock.
 _index_cache = {}
 
+# Per-index locks serializing loads and updates within a process. Updates
+# from different processes are serialized by _writer_lock's file lock.
+_index_locks = {}
+_locks_guard = threading.Lock()
+
+_compact_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='faiss-compact')
+# Indexes with a compaction queued or running.
+_compacting = set()
+_compacting_lock = threading.Lock()
+
 
-def _get_index_path(index_name):
-    return os.path.join(FAISS_DIR, f'{index_name}.index')
+def _get_current_link(index_name):
+    return os.path.join(index_paths.get_index_dir(index_name), CURRENT_LINK)
 
 
-def _get_ids_path(index_name):
-    return os.path.join(FAISS_DIR, f'{index_name}_ids.npy')
+def _get_generation_dir(index_name, generation):
+    return os.path.join(index_paths.get_index_dir(index_name), generation)
 
 
-def build_index(index_name, embeddings, ids):
+def _get_lock(index_name):
+    with _locks_guard:
+        if index_name not in _index_locks:
+            _index_locks[index_name] = threading.RLock()
+        return _index_locks[index_name]
+
+
+def current_epoch(index_name):
     """
-    Build a FAISS IndexFlatIP (inner product) index and persist to disk.
+    Name of the full build the live generation descends from, or None if the
+    index was never built. Unlike the generation, compaction keeps it.
+    """
+    generation = current_generation(index_name)
+    return generation.split(EPOCH_SEPARATOR)[0] if generation else None
 
-    Args:
-        index_name: Name of the index (e.g., 'housing', 'marketplace')
-        embeddings: numpy array of shape (N, 384) with L2-normalized vectors
-        ids: list of integer IDs corresponding to embeddings
+
+@contextmanager
+def _writer_lock(index_name):
+    """Serialize index updates across threads and worker processes."""
+    index_dir = index_paths.get_index_dir(index_name)
+    os.makedirs(index_dir, exist_ok=True)
+    with _get_lock(index_name), open(os.path.join(index_dir, '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _open_rebuild_lock(index_name):
+    index_dir = index_paths.get_index_dir(index_name)
+    os.makedirs(index_dir, exist_ok=True)
+    return open(os.path.join(index_dir, REBUILD_LOCK), 'a')
+
+
+def _is_rebuilding(index_name):
+    """Whether an IndexBuilder for ``index_name`` is running in any process."""
+    with _open_rebuild_lock(index_name) as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
+
+
+def get_index_config(index_name):
+    """Return the index settings for ``index_name``, merged over the defaults."""
+    overrides = getattr(settings, 'AI_RECOMMENDATIONS_FAISS_INDEXES', {})
+    config = dict(DEFAULT_INDEX_CONFIG)
+    config.update(overrides.get('default', {}))
+    config.update(overrides.get(index_name, {}))
+    return config
+
+
+def resolve_index_type(config, n_vectors):
+    """Pick the concrete index type, falling back to flat when N is too small to train."""
+    index_type = config['type']
+    if index_type == 'auto':
+        if n_vectors >= config['auto_ivf_pq_min']:
+            index_type = 'ivf_pq'
+        elif n_vectors >= config['auto_ivf_min']:
+            index_type = 'ivf_flat'
+        else:
+            index_type = 'flat'
+
+    if index_type in ('ivf_flat', 'ivf_pq') and n_vectors < MIN_POINTS_PER_CENTROID:
+        return 'flat'
+    if index_type == 'ivf_pq' and n_vectors < PQ_MIN_TRAINING_POINTS:
+        return 'ivf_flat'
+    return index_type
+
+
+def _nlist(config, n_vectors, n_training=None):
+    nlist = config['nlist'] or int(4 * np.sqrt(n_vectors))
+    n_training = n_vectors if n_training is None else n_training
+    return max(1, min(nlist, n_training // MIN_POINTS_PER_CENTROID))
+
+
+def _new_index(dim, index_type='flat', config=None, n_vectors=0, n_training=None):
     """
-    os.makedirs(FAISS_DIR, exist_ok=True)
+    Create an empty inner-product index whose vectors are keyed by model PK.
 
-    if len(embeddings) == 0:
-        return
+    IVF indexes store ids natively; flat and HNSW are wrapped in IndexIDMap2.
+    """
+    config = config or DEFAULT_INDEX_CONFIG
+
+    if index_type == 'flat':
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    if index_type == 'hnsw':
+        inner = faiss.IndexHNSWFlat(dim, config['hnsw_m'], faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = config['ef_construction']
+        return faiss.IndexIDMap2(inner)
+
+    quantizer = faiss.IndexFlatIP(dim)
+    nlist = _nlist(config, n_vectors, n_training)
+    if index_type == 'ivf_flat':
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    if index_type == 'ivf_pq':
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, config['pq_m'], 8, faiss.METRIC_INNER_PRODUCT)
+
+    raise ValueError(f'Unknown FAISS index type: {index_type}')
+
+
+def _is_id_mapped(index):
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIVF))
+
+
+def _supports_removal(index):
+    if isinstance(index, faiss.IndexIDMap):
+        return not isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW)
+    return True
+
+
+def describe_index(index):
+    """Human-readable index type, looking through the ID map wrapper."""
+    if isinstance(index, faiss.IndexIDMap):
+        return type(faiss.downcast_index(index.index)).__name__
+    return type(index).__name__
+
+
+def _apply_search_params(index_name, index):
+    """Set query-time recall/latency knobs (nprobe, efSearch) from settings."""
+    config = get_index_config(index_name)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(config['nprobe'], ivf.nlist)
+    if isinstance(index, faiss.IndexIDMap):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = config['ef_search']
+
+
+class DeltaOverlay:
+    """
+    Single-row changes read from a generation's delta log. Never modified
+    once cached: reading new records works on a copy.
+    """
+
+    def __init__(self):
+        self.offset = 0  # bytes of complete records applied
+        self.size = 0  # log size when last read
+        self.records = 0
+        self.vectors = {}  # {id: vector} upserted since the index was built
+        self.attributes = {}  # {id: {column: value}} set since
+        self.removed = set()  # ids removed since
+        self._matrix = None
+
+    def copy(self):
+        overlay = DeltaOverlay()
+        overlay.offset, overlay.size, overlay.records = self.offset, self.size, self.records
+        overlay.vectors = dict(self.vectors)
+        overlay.attributes = dict(self.attributes)
+        overlay.removed = set(self.removed)
+        return overlay
+
+    def apply(self, op, item_id, vector, attributes):
+        if op == 'remove':
+            self.vectors.pop(item_id, None)
+            self.attributes.pop(item_id, None)
+            self.removed.add(item_id)
+        else:
+            if op == 'upsert':
+                self.removed.discard(item_id)
+                self.vectors[item_id] = vector
+            if attributes:
+                self.attributes[item_id] = {**self.attributes.get(item_id, {}), **attributes}
+        self.records += 1
+        self._matrix = None
+
+    def hidden_ids(self):
+        """Ids whose vectors in the index must not be returned: replaced or removed."""
+        return np.fromiter(
+            (*self.vectors, *self.removed), dtype=np.int64,
+            count=len(self.vectors) + len(self.removed),
+        )
+
+    def matrix(self):
+        """(ids, vectors) of the upserted rows, as arrays."""
+        if self._matrix is None:
+            ids = np.fromiter(self.vectors, dtype=np.int64, count=len(self.vectors))
+            vectors = np.array(list(self.vectors.values()), dtype=np.float32)
+            self._matrix = ids, vectors
+        return self._matrix
+
+
+def _get_delta_path(index_name, generation):
+    return os.path.join(_get_generation_dir(index_name, generation), DELTA_FILE)
+
+
+def _parse_delta(data):
+    """Yield (end offset, record) for each complete record in ``data``."""
+    pos = 0
+    while pos + _DELTA_HEADER.size <= len(data):
+        (length,) = _DELTA_HEADER.unpack_from(data, pos)
+        end = pos + _DELTA_HEADER.size + length
+        if end > len(data):
+            return
+        yield end, pickle.loads(data[pos + _DELTA_HEADER.size:end])
+        pos = end
+
+
+def _read_delta(index_name, generation, overlay):
+    """
+    Return ``overlay`` with the complete records appended to the delta log
+    since it was read: ``overlay`` itself if there are none, else a copy.
+    """
+    path = _get_delta_path(index_name, generation)
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        size = 0
+    if size == overlay.size:
+        return overlay
+
+    try:
+        with open(path, 'rb') as f:
+            f.seek(overlay.offset)
+            data = f.read(size - overlay.offset)
+    except OSError:
+        return overlay  # generation pruned; the caller will see a newer one
+
+    overlay = overlay.copy()
+    overlay.size = size
+    pos = 0
+    # A record cut short is being written (or its writer crashed, and the
+    # next writer truncates it); it is read once complete.
+    for pos, record in _parse_delta(data):
+        overlay.apply(*record)
+    overlay.offset += pos
+    return overlay
+
+
+def _overlay_attributes(base_attrs, overlay):
+    """
+    ``base_attrs`` with the overlay's removed rows dropped and attribute
+    changes applied. Rows of new ids are inserted only if every column is
+    given; values for columns the array does not have are ignored.
+    """
+    if base_attrs is None or not (overlay.removed or overlay.attributes):
+        return base_attrs
+
+    attrs = base_attrs
+    if overlay.removed:
+        attrs, _ = _drop_attribute_rows(attrs, list(overlay.removed))
+    attrs = np.array(attrs)
+
+    columns = set(attrs.dtype.names) - {'ids'}
+    ids = attrs['ids']
+    new_rows = []
+    for item_id, values in overlay.attributes.items():
+        values = {column: value for column, value in values.items() if column in columns}
+        pos = int(np.searchsorted(ids, item_id))
+        if pos < len(ids) and ids[pos] == item_id:
+            for column, value in values.items():
+                attrs[column][pos] = value
+        elif set(values) == columns:
+            row = np.zeros(1, dtype=attrs.dtype)
+            row['ids'] = item_id
+            for column, value in values.items():
+                row[column] = value
+            new_rows.append(row)
+
+    if new_rows:
+        attrs = np.concatenate([attrs, *new_rows])
+        attrs = attrs[np.argsort(attrs['ids'], kind='stable')]
+    return attrs
+
+
+def _read_generation(index_name, generation, mmap=None):
+    """
+    Load one generation from disk, with its delta log. Memory-mapped (per
+    MMAP_INDEXES) unless ``mmap`` is False, which gives a private copy that
+    can be modified.
+    """
+    mmap = MMAP_INDEXES if mmap is None else mmap
+    generation_dir = _get_generation_dir(index_name, generation)
+
+    index_path = os.path.join(generation_dir, INDEX_FILE)
+    index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP_IFC if mmap else 0)
+    _apply_search_params(index_name, index)
+
+    attrs_path = os.path.join(generation_dir, ATTRS_FILE)
+    attrs = None
+    if os.path.exists(attrs_path):
+        attrs = np.load(attrs_path, mmap_mode='r' if mmap else None)
+    overlay = _read_delta(index_name, generation, DeltaOverlay())
+    return IndexGeneration(generation, index, _overlay_attributes(attrs, overlay), attrs, overlay)
+
+
+def _refresh_overlay(index_name, loaded):
+    """``loaded`` with records appended to its delta log since, cached."""
+    overlay = _read_delta(index_name, loaded.generation, loaded.overlay)
+    if overlay is loaded.overlay:
+        return loaded
+    with _get_lock(index_name):
+        cached = _index_cache.get(index_name)
+        if cached is not None and cached.generation == loaded.generation \
+                and cached.overlay.offset >= overlay.offset:
+            return cached
+        loaded = loaded._replace(
+            attrs=_overlay_attributes(loaded.base_attrs, overlay), overlay=overlay
+        )
+        _index_cache[index_name] = loaded
+        return loaded
+
+
+def _publish_generation(index_name, index, attrs, epoch=None, delta=b''):
+    """
+    Write ``index`` and ``attrs`` as a new generation and make it current:
+    a new epoch, or a compaction of ``epoch``. ``delta`` starts its delta
+    log. Must be called under _writer_lock.
+    """
+    generation = f'{time.time_ns():020d}-{os.getpid()}'
+    if epoch is not None:
+        generation = f'{epoch}{EPOCH_SEPARATOR}{generation}'
+    generation_dir = _get_generation_dir(index_name, generation)
+    tmp_dir = f'{generation_dir}.tmp'
+    os.makedirs(tmp_dir)
+
+    faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE))
+    if attrs is not None:
+        with open(os.path.join(tmp_dir, ATTRS_FILE), 'wb') as f:
+            np.save(f, attrs)
+    if delta:
+        with open(os.path.join(tmp_dir, DELTA_FILE), 'wb') as f:
+            f.write(delta)
+    os.rename(tmp_dir, generation_dir)
+
+    current_link = _get_current_link(index_name)
+    tmp_link = f'{current_link}.tmp'
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(generation, tmp_link)
+    os.replace(tmp_link, current_link)
+
+    _prune_generations(index_name, generation)
+
+    loaded = _read_generation(index_name, generation)
+    _index_cache[index_name] = loaded
+    return loaded
+
+
+def _prune_generations(index_name, current):
+    """Delete all but the newest KEEP_GENERATIONS old generations, plus leftovers of failed writes."""
+    index_dir = index_paths.get_index_dir(index_name)
+    generations = []
+    for entry in os.listdir(index_dir):
+        path = os.path.join(index_dir, entry)
+        if entry.endswith('.tmp') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif entry[0].isdigit() and entry != current and not os.path.islink(path):
+            generations.append(entry)
+
+    for generation in sorted(generations)[:-KEEP_GENERATIONS or None]:
+        shutil.rmtree(os.path.join(index_dir, generation), ignore_errors=True)
+
+
+def _sort_attributes(ids, attributes):
+    """Pack ids and attribute columns into one structured array sorted by id."""
+    columns = {'ids': np.asarray(ids, dtype=np.int64)}
+    columns.update((column, np.asarray(values)) for column, values in attributes.items())
+
+    attrs = np.empty(len(columns['ids']), dtype=[(c, v.dtype) for c, v in columns.items()])
+    for column, values in columns.items():
+        attrs[column] = values
+    return attrs[np.argsort(attrs['ids'], kind='stable')]
+
+
+def _drop_attribute_rows(attrs, item_ids):
+    """Return ``attrs`` without the rows for ``item_ids`` and how many were dropped."""
+    keep = ~np.isin(attrs['ids'], np.asarray(item_ids, dtype=np.int64))
+    return attrs[keep], int((~keep).sum())
+
+
+def _id_selector(ids, mask, hidden=None):
+    """
+    Build a FAISS selector admitting ``ids[mask]`` (every id if ``ids`` is
+    None) except the ``hidden`` ids.
+
+    Uses whichever of an allow-list or a deny-list is smaller. Returns
+    (selector, keepalive); the keepalive objects must outlive the search.
+    """
+    hidden = np.empty(0, dtype=np.int64) if hidden is None else hidden
+    if ids is None or mask.all():
+        if not len(hidden):
+            return None, ()
+        denied = faiss.IDSelectorBatch(hidden)
+        return faiss.IDSelectorNot(denied), (denied,)
+
+    if len(hidden):
+        mask = mask & ~np.isin(ids, hidden)
+    allowed = ids[mask]
+    if len(allowed) <= len(ids) // 2:
+        return faiss.IDSelectorBatch(allowed), ()
+    denied = faiss.IDSelectorBatch(np.concatenate([ids[~mask], hidden]))
+    return faiss.IDSelectorNot(denied), (denied,)
+
+
+def _search_params(index, selector):
+    """Search parameters carrying ``selector`` plus the index's own nprobe/efSearch."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = ivf.nprobe
+    elif isinstance(index, faiss.IndexIDMap) and isinstance(
+        faiss.downcast_index(index.index), faiss.IndexHNSW
+    ):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = faiss.downcast_index(index.index).hnsw.efSearch
+    else:
+        params = faiss.SearchParameters()
+    params.sel = selector
+    return params
+
+
+def _migrate_legacy_index(index_name):
+    """
+    Move a flat ``<name>.index`` file written by older builds into the first
+    generation directory, converting positional indexes (plus their
+    ``_ids.npy`` file) to ID-mapped ones.
+
+    Returns:
+        The new current generation, or None if there is no legacy index
+    """
+    index_path = index_paths.get_legacy_path(index_name, '.index')
+    if not os.path.exists(index_path):
+        return None
+
+    with _writer_lock(index_name):
+        if current_generation(index_name) is not None:
+            return _load_generation(index_name)
+
+        index = faiss.read_index(index_path)
+        if not _is_id_mapped(index):
+            upgraded = _new_index(index.d)
+            ids_path = index_paths.get_legacy_path(index_name, '_ids.npy')
+            if index.ntotal and os.path.exists(ids_path):
+                ids = np.load(ids_path).astype(np.int64)
+                upgraded.add_with_ids(index.reconstruct_n(0, index.ntotal), ids)
+            index = upgraded
+
+        attrs_path = index_paths.get_legacy_path(index_name, '_attrs.npy')
+        attrs = np.load(attrs_path) if os.path.exists(attrs_path) else None
+        return _publish_generation(index_name, index, attrs)
+
+
+def _load_generation(index_name):
+    """
+    Return the current generation of an index, reloading it if another
+    process has published a newer one since it was cached.
+
+    The check is one readlink() per call and takes no lock when the cached
+    generation is still current.
+    """
+    generation = current_generation(index_name)
+    cached = _index_cache.get(index_name)
+    if cached is not None and cached.generation == generation:
+        return _refresh_overlay(index_name, cached)
+    if generation is None:
+        return _migrate_legacy_index(index_name)
+
+    with _get_lock(index_name):
+        cached = _index_cache.get(index_name)
+        if cached is not None and cached.generation == generation:
+            return _refresh_overlay(index_name, cached)
+        try:
+            loaded = _read_generation(index_name, generation)
+        except (OSError, RuntimeError):
+            # Pruned by a writer between readlink() and reading; the
+            # link now names a newer generation.
+            loaded = _read_generation(index_name, current_generation(index_name))
+        _index_cache[index_name] = loaded
+        return loaded
+
+
+def _delta_position(index_name):
+    """
+    (generation, bytes of complete delta records) of the live generation,
+    or None if the index was never built. Must be called under _writer_lock.
+    """
+    if current_generation(index_name) is None:
+        return None
+    loaded = _load_generation(index_name)
+    return loaded.generation, loaded.overlay.offset
+
+
+def _delta_since(index_name, position):
+    """
+    The complete delta records appended to the live generation since
+    ``position`` (see _delta_position), as bytes. Must be called under
+    _writer_lock.
+    """
+    current = _delta_position(index_name)
+    if current is None:
+        return b''
+    generation, end = current
+    start = 0
+    if position is not None:
+        if position[0] != generation:
+            # Compaction waits for rebuilds, so another rebuild published
+            # meanwhile; whatever it carried over is superseded.
+            logger.warning(
+                'FAISS index %s changed generation during a rebuild; '
+                'updates made meanwhile are not carried over', index_name,
+            )
+            return b''
+        start = position[1]
+    if end == start:
+        return b''
+    with open(_get_delta_path(index_name, generation), 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _is_empty(loaded):
+    return loaded.index.ntotal == 0 and not loaded.overlay.vectors
+
+
+class IndexBuilder:
+    """
+    Build an index from chunks of embeddings, so a rebuild never holds the
+    whole catalog's vectors at once.
+
+    IVF indexes are trained on the first ``max_training_points`` vectors,
+    which are buffered until then; after that every chunk goes straight into
+    the index. Only the index itself, ids and attribute columns grow with N.
+
+    upsert_vector, update_attributes and remove_ids calls made while it
+    builds are carried over into the published generation.
+    """
+
+    def __init__(self, index_name, n_vectors):
+        """``n_vectors`` is the expected total, used to pick the index type."""
+        self.index_name = index_name
+        self.config = get_index_config(index_name)
+        self.index_type = resolve_index_type(self.config, n_vectors)
+        self.n_vectors = n_vectors
+        self.n_training = 0
+        if self.index_type in ('ivf_flat', 'ivf_pq'):
+            self.n_training = min(n_vectors, self.config['max_training_points'])
+
+        self.index = None
+        self.ntotal = 0
+        self._pending = []  # (embeddings, ids) waiting for the index to be trained
+        self._n_pending = 0
+        self._ids = []
+        self._attributes = {}
+
+        # Held until publish(), so compaction leaves the live generation's
+        # delta log alone and the records after _base can be carried over.
+        _load_generation(index_name)  # migrates a legacy index outside the lock
+        self._rebuilding = _open_rebuild_lock(index_name)
+        fcntl.flock(self._rebuilding, fcntl.LOCK_SH)
+        with _writer_lock(index_name):
+            self._base = _delta_position(index_name)
 
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
+    def add(self, embeddings, ids, attributes=None):
+        """Add a chunk; ``attributes`` as for build_index, aligned with ``ids``."""
+        if len(ids) == 0:
+            return
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        self._ids.append(ids)
+        for column, values in (attributes or {}).items():
+            self._attributes.setdefault(column, []).append(np.asarray(values))
+        self.ntotal += len(ids)
 
-    faiss.write_index(index, _get_index_path(index_name))
-    np.save(_get_ids_path(index_name), np.array(ids))
+        if self.index is not None:
+            self.index.add_with_ids(embeddings, ids)
+            return
+        self._pending.append((embeddings, ids))
+        self._n_pending += len(ids)
+        if self._n_pending >= self.n_training:
+            self._train()
 
-    # Update cache
-    _index_cache[index_name] = (index, list(ids))
+    def _train(self):
+        embeddings = np.concatenate([chunk for chunk, _ in self._pending])
+        ids = np.concatenate([chunk_ids for _, chunk_ids in self._pending])
+        self._pending = []
+
+        index_type = self.index_type
+        if len(embeddings) < self.n_training:
+            # Fewer rows arrived than counted; IVF may no longer be trainable.
+            index_type = resolve_index_type(self.config, len(embeddings))
+        index = _new_index(
+            embeddings.shape[1], index_type, self.config, self.n_vectors, len(embeddings)
+        )
+        if not index.is_trained:
+            index.train(embeddings)
+        index.add_with_ids(embeddings, ids)
+        self.index = index
+
+    def publish(self, on_publish=None):
+        """
+        Publish the index as a new generation, with the delta records written
+        since the builder was created; None if nothing was added.
+
+        ``on_publish(carried_ids)``, if given, is called under the writer lock
+        once the generation is live, with the ids those records changed.
+        """
+        try:
+            if self.index is None:
+                if not self._pending:
+                    return None
+                self._train()
+
+            attrs = None
+            if self._attributes:
+                attrs = _sort_attributes(
+                    np.concatenate(self._ids),
+                    {column: np.concatenate(chunks) for column, chunks in self._attributes.items()},
+                )
+            with _writer_lock(self.index_name):
+                delta = _delta_since(self.index_name, self._base)
+                loaded = _publish_generation(self.index_name, self.index, attrs, delta=delta)
+                if on_publish is not None:
+                    on_publish({record[1] for _, record in _parse_delta(delta)})
+                return loaded.index
+        finally:
+            self._rebuilding.close()
+
+
+def build_index(index_name, embeddings, ids, attributes=None):
+    """
+    Build an ID-mapped FAISS inner product index and publish it as a new
+    generation.
+
+    The index type (flat, IVF-Flat, IVF-PQ or HNSW) comes from
+    get_index_config(); IVF types are trained on the embeddings being added.
+    Use IndexBuilder to build from chunks instead.
+
+    Args:
+        index_name: Name of the index (e.g., 'housing', 'marketplace')
+        embeddings: numpy array of shape (N, 384) with L2-normalized vectors
+        ids: list of integer IDs corresponding to embeddings
+        attributes: optional {column: values aligned with ids} used to filter
+            searches (see search_similar's ``where``)
+
+    Returns:
+        The built index, or None if there was nothing to index
+    """
+    builder = IndexBuilder(index_name, len(embeddings))
+    builder.add(embeddings, ids, attributes)
+    return builder.publish()
 
 
 def load_index(index_name):
     """
-    Load a FAISS index from disk, using in-memory cache.
+    Load the current generation of a FAISS index, using in-memory cache.
 
     Returns:
-        (faiss_index, id_list) or (None, None) if not found
+        ID-mapped faiss index, or None if not found
     """
-    if index_name in _index_cache:
-        return _index_cache[index_name]
+    loaded = _load_generation(index_name)
+    return loaded.index if loaded is not None else None
 
-    index_path = _get_index_path(index_name)
-    ids_path = _get_ids_path(index_name)
 
-    if not os.path.exists(index_path) or not os.path.exists(ids_path):
-        return None, None
+def load_attributes(index_name):
+    """
+    Load the filterable attribute columns of an index, using in-memory cache.
+
+    Returns:
+        Structured array with an int64 'ids' field (sorted) and one field per
+        attribute column, or None if the index was built without attributes
+    """
+    loaded = _load_generation(index_name)
+    return loaded.attrs if loaded is not None else None
 
-    index = faiss.read_index(index_path)
-    ids = np.load(ids_path).tolist()
 
-    _index_cache[index_name] = (index, ids)
-    return index, ids
+def has_attributes(index_name):
+    return load_attributes(index_name) is not None
 
 
-def search_similar(index_name, query_embedding, top_k=10, exclude_ids=None):
+def search_similar(index_name, query_embedding, top_k=10, exclude_ids=None, where=None):
     """
     Search for similar items in a FAISS index.
 
@@ -74,39 +819,520 @@ def search_similar(index_name, query_embedding, top_k=10, exclude_ids=None):
         query_embedding: numpy array of shape (384,) — L2-normalized
         top_k: Number of results to return
         exclude_ids: Set of IDs to exclude from results
+        where: Optional callable taking the index's attribute array and
+            returning a boolean mask over ``attrs['ids']``. Rows outside the
+            mask are excluded inside FAISS, so up to top_k matching results
+            are returned. Ignored if the index has no attributes.
 
     Returns:
         List of (id, score) tuples, sorted by similarity (descending)
     """
-    index, ids = load_index(index_name)
-    if index is None:
+    loaded = _load_generation(index_name)
+    if loaded is None or _is_empty(loaded):
         return []
+    index = loaded.index
 
     exclude_ids = exclude_ids or set()
 
+    query = query_embedding.reshape(1, -1).astype(np.float32)
+
     # Request more results than needed to account for exclusions
     search_k = min(top_k + len(exclude_ids) + 5, index.ntotal)
+    allowed = None
 
-    query = query_embedding.reshape(1, -1).astype(np.float32)
-    scores, indices = index.search(query, search_k)
+    attrs = loaded.attrs if where is not None else None
+    if attrs is not None:
+        mask = np.asarray(where(attrs), dtype=bool)
+        if exclude_ids:
+            mask &= ~np.isin(attrs['ids'], np.fromiter(exclude_ids, dtype=np.int64))
+        n_allowed = int(mask.sum())
+        if n_allowed == 0:
+            return []
+        selector, keepalive = _id_selector(attrs['ids'], mask, loaded.overlay.hidden_ids())
+        allowed = attrs['ids'][mask]
+        search_k = min(top_k, n_allowed, index.ntotal)
+    else:
+        selector, keepalive = _id_selector(None, None, loaded.overlay.hidden_ids())
 
     results = []
-    for score, idx in zip(scores[0], indices[0]):
-        if idx < 0 or idx >= len(ids):
-            continue
-        item_id = ids[idx]
-        if item_id in exclude_ids:
-            continue
-        results.append((item_id, float(score)))
-        if len(results) >= top_k:
-            break
+    if search_k > 0:
+        params = _search_params(index, selector) if selector is not None else None
+        scores, labels = index.search(query, search_k, params=params)
+        del keepalive
+        for score, item_id in zip(scores[0], labels[0]):
+            if item_id < 0:
+                continue
+            item_id = int(item_id)
+            if item_id in exclude_ids:
+                continue
+            results.append((item_id, float(score)))
+            if len(results) >= top_k:
+                break
+
+    overlay_ids, overlay_vectors = loaded.overlay.matrix()
+    if len(overlay_ids):
+        keep = np.ones(len(overlay_ids), dtype=bool)
+        if allowed is not None:
+            keep &= np.isin(overlay_ids, allowed)
+        if exclude_ids:
+            keep &= ~np.isin(overlay_ids, np.fromiter(exclude_ids, dtype=np.int64))
+        overlay_scores = overlay_vectors[keep] @ query[0]
+        results.extend(zip(overlay_ids[keep].tolist(), overlay_scores.tolist()))
+        results = heapq.nlargest(top_k, results, key=lambda result: result[1])
 
     return results
 
 
+def search_batch(index_name, query_embeddings, top_k=10, where=None):
+    """
+    Search many queries in one call, with an attribute filter shared by all
+    of them (see search_similar's ``where``).
+
+    Returns:
+        (scores, ids, attrs): (n, k) arrays sorted by descending score, with
+        id -1 where a query has fewer than k results, and the attribute array
+        of the index generation searched (None if it has none)
+    """
+    loaded = _load_generation(index_name)
+    n_queries = len(query_embeddings)
+    empty = (np.zeros((n_queries, 0), dtype=np.float32), np.zeros((n_queries, 0), dtype=np.int64))
+    if loaded is None or _is_empty(loaded):
+        return (*empty, None)
+    index = loaded.index
+
+    search_k = min(top_k, index.ntotal)
+    allowed = None
+    if where is not None and loaded.attrs is not None:
+        mask = np.asarray(where(loaded.attrs), dtype=bool)
+        n_allowed = int(mask.sum())
+        if n_allowed == 0:
+            return (*empty, loaded.attrs)
+        selector, keepalive = _id_selector(loaded.attrs['ids'], mask, loaded.overlay.hidden_ids())
+        allowed = loaded.attrs['ids'][mask]
+        search_k = min(search_k, n_allowed)
+    else:
+        selector, keepalive = _id_selector(None, None, loaded.overlay.hidden_ids())
+
+    queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+    scores, labels = empty
+    if search_k > 0:
+        params = _search_params(index, selector) if selector is not None else None
+        scores, labels = index.search(queries, search_k, params=params)
+        del keepalive
+
+    overlay_ids, overlay_vectors = loaded.overlay.matrix()
+    if len(overlay_ids) and allowed is not None:
+        keep = np.isin(overlay_ids, allowed)
+        overlay_ids, overlay_vectors = overlay_ids[keep], overlay_vectors[keep]
+    if len(overlay_ids):
+        scores = np.concatenate([scores, queries @ overlay_vectors.T], axis=1)
+        labels = np.concatenate(
+            [labels, np.broadcast_to(overlay_ids, (n_queries, len(overlay_ids)))], axis=1
+        )
+        # Missing results (id -1) score -inf or the float minimum, so sort last.
+        top = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+        scores = np.take_along_axis(scores, top, axis=1)
+        labels = np.take_along_axis(labels, top, axis=1)
+    return scores, labels, loaded.attrs
+
+
+def _append_delta(index_name, op, item_id, vector=None, attributes=None):
+    """
+    Append one record to the current generation's delta log and return the
+    generation with it applied. Must be called under _writer_lock.
+    """
+    loaded = _load_generation(index_name)
+    payload = pickle.dumps((op, int(item_id), vector, attributes), protocol=pickle.HIGHEST_PROTOCOL)
+    with open(_get_delta_path(index_name, loaded.generation), 'ab') as f:
+        if f.tell() > loaded.overlay.offset:
+            # A writer died mid-record; nobody else writes under the lock.
+            f.truncate(loaded.overlay.offset)
+        f.write(_DELTA_HEADER.pack(len(payload)) + payload)
+
+    loaded = _load_generation(index_name)
+    if loaded.overlay.records >= COMPACT_AFTER:
+        _compact_in_background(index_name)
+    return loaded
+
+
+def _has_row(attrs, item_id):
+    ids = attrs['ids']
+    pos = int(np.searchsorted(ids, item_id))
+    return pos < len(ids) and ids[pos] == item_id
+
+
+def upsert_vector(index_name, item_id, embedding, attributes=None, create=False):
+    """
+    Add or replace the vector (and, if given, the attribute row) stored under
+    ``item_id``, through the delta log.
+
+    Indexes that have never been built are left alone, unless ``create`` is
+    set, which starts a flat index holding just this row (e.g. the first
+    listing of a new shard); run ``rebuild_faiss_indexes`` to create the rest.
+
+    Returns:
+        True if the index was updated, False if it does not exist
+    """
+    if _load_generation(index_name) is None and not create:
+        return False
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    with _writer_lock(index_name):
+        if current_generation(index_name) is None:
+            # Start empty: the row goes into the delta log like any other,
+            # so a rebuild running meanwhile carries it over.
+            attrs = None
+            if attributes:
+                attrs = _sort_attributes(
+                    [], {column: np.asarray([value])[:0] for column, value in attributes.items()}
+                )
+            _publish_generation(index_name, _new_index(len(vector)), attrs)
+        _append_delta(index_name, 'upsert', item_id, vector, attributes or None)
+    return True
+
+
+def update_attributes(index_name, item_id, attributes):
+    """
+    Update filterable attributes of an already-indexed item without
+    re-embedding it.
+
+    Returns:
+        True if the row was updated
+    """
+    loaded = _load_generation(index_name)
+    if loaded is None or loaded.attrs is None:
+        return False
+
+    with _writer_lock(index_name):
+        loaded = _load_generation(index_name)
+        if not _has_row(loaded.attrs, item_id):
+            return False
+        _append_delta(index_name, 'attributes', item_id, attributes=attributes)
+    return True
+
+
+def get_attributes(index_name, item_id):
+    """The attribute row stored for ``item_id`` as {column: value}, or None."""
+    attrs = load_attributes(index_name)
+    if attrs is None or not _has_row(attrs, item_id):
+        return None
+    row = attrs[int(np.searchsorted(attrs['ids'], item_id))]
+    return {column: row[column].item() for column in attrs.dtype.names if column != 'ids'}
+
+
+def _in_base(loaded, item_ids):
+    """Mask of the ``item_ids`` stored in the generation's index file itself."""
+    if loaded.base_attrs is not None:
+        return np.isin(item_ids, loaded.base_attrs['ids'])
+    if isinstance(loaded.index, faiss.IndexIDMap):
+        return np.isin(item_ids, faiss.vector_to_array(loaded.index.id_map))
+    return np.ones(len(item_ids), dtype=bool)
+
+
+def _present_ids(loaded, item_ids):
+    """The ``item_ids`` that ``loaded`` holds, with its overlay applied."""
+    overlay = loaded.overlay
+    in_base = _in_base(loaded, item_ids)
+    return [
+        int(item_id) for item_id, base in zip(item_ids, in_base)
+        if item_id in overlay.vectors or (base and item_id not in overlay.removed)
+    ]
+
+
+def remove_ids(index_name, item_ids):
+    """
+    Remove vectors stored under ``item_ids``, through the delta log.
+
+    Returns:
+        Number of vectors removed
+    """
+    loaded = _load_generation(index_name)
+    if loaded is None:
+        return 0
+    item_ids = np.asarray(list(item_ids), dtype=np.int64)
+    # Many removals target rows that are not indexed (e.g. re-saving a
+    # sold item), so check before taking the lock.
+    if not _present_ids(loaded, item_ids):
+        return 0
+
+    with _writer_lock(index_name):
+        present = _present_ids(_load_generation(index_name), item_ids)
+        for item_id in present:
+            _append_delta(index_name, 'remove', item_id)
+    return len(present)
+
+
+def _without_ids(index_name, index, item_ids):
+    """
+    ``index`` without the vectors of ``item_ids``. HNSW graphs cannot drop
+    nodes, so those are rebuilt from their remaining vectors.
+    """
+    if not len(item_ids):
+        return index
+    if _supports_removal(index):
+        index.remove_ids(item_ids)
+        return index
+
+    ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(ids, item_ids)
+    vectors = index.index.reconstruct_n(0, index.ntotal)[keep]
+    rebuilt = _new_index(index.d, 'hnsw', get_index_config(index_name))
+    rebuilt.add_with_ids(vectors, ids[keep])
+    _apply_search_params(index_name, rebuilt)
+    return rebuilt
+
+
+def count_vectors(index_name):
+    """Vectors the index holds with its delta log applied; 0 if it was never built."""
+    loaded = _load_generation(index_name)
+    if loaded is None:
+        return 0
+    hidden = loaded.overlay.hidden_ids()
+    replaced = int(_in_base(loaded, hidden).sum()) if len(hidden) else 0
+    return int(loaded.index.ntotal) - replaced + len(loaded.overlay.vectors)
+
+
+def reconstruct(index_name, item_ids):
+    """
+    Vectors the live index holds for ``item_ids``, so a rebuild can reuse
+    them instead of re-embedding. Only flat and HNSW indexes keep the
+    id-to-vector mapping needed; IVF indexes give back only vectors still in
+    the delta log.
+
+    Returns:
+        {id: vector} for the ids found
+    """
+    loaded = _load_generation(index_name)
+    if loaded is None:
+        return {}
+    overlay = loaded.overlay
+    vectors = {}
+    for item_id in item_ids:
+        if item_id in overlay.vectors:
+            vectors[item_id] = overlay.vectors[item_id]
+        elif item_id not in overlay.removed and isinstance(loaded.index, faiss.IndexIDMap2):
+            try:
+                vectors[item_id] = loaded.index.reconstruct(int(item_id))
+            except RuntimeError:
+                pass  # not indexed
+    return vectors
+
+
+def compact(index_name):
+    """
+    Fold the current generation's delta log into a new generation: removed
+    and replaced vectors leave the index, upserted ones join it.
+
+    Returns:
+        True if a new generation was published
+    """
+    with _writer_lock(index_name):
+        loaded = _load_generation(index_name)
+        if loaded is None or not loaded.overlay.records or _is_rebuilding(index_name):
+            return False
+        overlay = loaded.overlay
+
+        index = _read_generation(index_name, loaded.generation, mmap=False).index
+        index = _without_ids(index_name, index, overlay.hidden_ids())
+        overlay_ids, overlay_vectors = overlay.matrix()
+        if len(overlay_ids):
+            index.add_with_ids(overlay_vectors, overlay_ids)
+        epoch = loaded.generation.split(EPOCH_SEPARATOR)[0]
+        _publish_generation(index_name, index, loaded.attrs, epoch)
+    logger.info('Compacted %d delta records into FAISS index %s', overlay.records, index_name)
+    return True
+
+
+def _compact_in_background(index_name):
+    with _compacting_lock:
+        if index_name in _compacting:
+            return
+        _compacting.add(index_name)
+
+    def run():
+        try:
+            compact(index_name)
+        except Exception:
+            logger.exception('Compacting FAISS index %s failed', index_name)
+        finally:
+            with _compacting_lock:
+                _compacting.discard(index_name)
+
+    _compact_executor.submit(run)
+
+
+def shard_index_name(index_name, shard):
+    return f'{index_name}{SHARD_SEPARATOR}{shard}'
+
+
+def list_shards(index_name):
+    """Shards of ``index_name`` that have been built, sorted."""
+    prefix = shard_index_name(index_name, '')
+    try:
+        entries = os.listdir(index_paths.FAISS_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        entry[len(prefix):] for entry in entries
+        if entry.startswith(prefix) and current_generation(entry) is not None
+    )
+
+
+def search_shards(index_name, shards, query_embedding, top_k=10, exclude_ids=None, where=None):
+    """
+    search_similar over several shards of ``index_name``, merged by score.
+
+    Only the named shards are searched; shards that were never built
+    contribute nothing. Scores are inner products of normalized vectors, so
+    they compare across shards.
+
+    Returns:
+        List of (id, score) tuples, sorted by similarity (descending)
+    """
+    if len(shards) == 1:
+        return search_similar(
+            shard_index_name(index_name, shards[0]), query_embedding, top_k, exclude_ids, where
+        )
+    results = []
+    for shard in shards:
+        results.extend(search_similar(
+            shard_index_name(index_name, shard), query_embedding, top_k, exclude_ids, where
+        ))
+    return heapq.nlargest(top_k, results, key=lambda result: result[1])
+
+
+def drop_index(index_name):
+    """
+    Unpublish an index, e.g. a shard with no rows left after a rebuild.
+
+    Searches find no index from then on; the last KEEP_GENERATIONS
+    generations stay on disk for workers still reading them.
+    """
+    if current_generation(index_name) is None:
+        return
+    with _writer_lock(index_name):
+        current_link = _get_current_link(index_name)
+        if os.path.lexists(current_link):
+            os.remove(current_link)
+        _prune_generations(index_name, None)
+        _index_cache.pop(index_name, None)
+
+
 def invalidate_cache(index_name=None):
-    """Remove cached index(es) to force reload on next search."""
+    """
+    Drop cached generation(s) so the next search re-reads from disk.
+
+    Not needed to pick up new generations, which searches detect themselves.
+    """
     if index_name:
-        _index_cache.pop(index_name, None)
+        with _get_lock(index_name):
+            _index_cache.pop(index_name, None)
     else:
         _index_cache.clear()
+
+
+def _recall_report(index, queries, truth, k):
+    """recall@k and per-query latency (ms) of ``index`` against exact ``truth`` ids."""
+    hits = 0
+    index_ms = []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, labels = index.search(query.reshape(1, -1), k)
+        index_ms.append((time.perf_counter() - start) * 1000)
+        hits += len(set(expected.tolist()) & set(labels[0].tolist()))
+
+    return {
+        'index_type': describe_index(index),
+        'ntotal': int(index.ntotal),
+        'k': k,
+        'queries': len(queries),
+        'recall': hits / (len(queries) * k),
+        'p50_ms': float(np.percentile(index_ms, 50)),
+        'p99_ms': float(np.percentile(index_ms, 99)),
+    }
+
+
+def evaluate_recall(index_name, embeddings, ids, k=10, n_queries=200, seed=0):
+    """
+    Compare the live index against exact search over the same vectors.
+
+    Queries are sampled from the indexed vectors themselves.
+
+    Returns:
+        dict with recall@k and per-query latency percentiles (ms) for the
+        index and for exact search
+    """
+    index = load_index(index_name)
+    if index is None or len(embeddings) == 0:
+        return None
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    k = min(k, len(embeddings))
+
+    exact = faiss.IndexFlatIP(embeddings.shape[1])
+    exact.add(embeddings)
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+    queries = embeddings[sample]
+
+    truth = []
+    exact_ms = []
+    for query in queries:
+        start = time.perf_counter()
+        _, labels = exact.search(query.reshape(1, -1), k)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        truth.append(ids[labels[0]])
+
+    report = _recall_report(index, queries, truth, k)
+    report['exact_p50_ms'] = float(np.percentile(exact_ms, 50))
+    report['exact_p99_ms'] = float(np.percentile(exact_ms, 99))
+    return report
+
+
+class ExactNeighbors:
+    """
+    Exact top-k neighbours of a query sample, accumulated chunk by chunk
+    alongside an IndexBuilder, for evaluating recall without keeping every
+    vector. Queries are sampled from the first chunk unless given.
+    """
+
+    def __init__(self, k=10, n_queries=200, seed=0, queries=None):
+        self.k = k
+        self.n_queries = n_queries
+        self.rng = np.random.default_rng(seed)
+        self.queries = None
+        self.scores = None
+        self.ids = None
+        if queries is not None:
+            self._set_queries(np.ascontiguousarray(queries, dtype=np.float32))
+
+    def _set_queries(self, queries):
+        self.queries = queries
+        self.scores = np.empty((len(queries), 0), dtype=np.float32)
+        self.ids = np.empty((len(queries), 0), dtype=np.int64)
+
+    def add(self, embeddings, ids):
+        if len(ids) == 0:
+            return
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.queries is None:
+            sample = self.rng.choice(len(embeddings), size=min(self.n_queries, len(embeddings)), replace=False)
+            self._set_queries(embeddings[sample])
+
+        scores = np.concatenate([self.scores, self.queries @ embeddings.T], axis=1)
+        candidates = np.concatenate(
+            [self.ids, np.broadcast_to(ids, (len(self.queries), len(ids)))], axis=1
+        )
+        top = np.argsort(-scores, axis=1, kind='stable')[:, :self.k]
+        self.scores = np.take_along_axis(scores, top, axis=1)
+        self.ids = np.take_along_axis(candidates, top, axis=1)
+
+    def evaluate(self, index_name):
+        """recall@k and latency of the live index, as evaluate_recall without exact timings."""
+        index = load_index(index_name)
+        if index is None or self.queries is None:
+            return None
+        k = self.ids.shape[1]
+        return _recall_report(index, self.queries, self.ids, k)
@@ -0,0 +1,38 @@
+"""
+Where FAISS indexes live on disk (see faiss_service for the layout).
+
+Kept apart from faiss_service so that code deciding whether an index exists,
+such as the incremental update signal handlers, does not import faiss.
+"""
+import os
+
+from django.conf import settings
+
+FAISS_DIR = os.path.join(settings.BASE_DIR, 'faiss_indexes')
+
+CURRENT_LINK = 'CURRENT'
+
+
+def get_index_dir(index_name):
+    return os.path.join(FAISS_DIR, index_name)
+
+
+def get_legacy_path(index_name, suffix):
+    """Flat file written by builds that predate generation directories."""
+    return os.path.join(FAISS_DIR, f'{index_name}{suffix}')
+
+
+def current_generation(index_name):
+    """Name of the live generation of an index, or None if it was never built."""
+    try:
+        return os.readlink(os.path.join(get_index_dir(index_name), CURRENT_LINK))
+    except OSError:
+        return None
+
+
+def index_exists(index_name):
+    """Whether ``index_name`` has been built, by any version of the rebuild."""
+    return (
+        current_generation(index_name) is not None
+        or os.path.exists(get_legacy_path(index_name, '.index'))
+    )
@@ -0,0 +1,501 @@
+"""
+Incremental FAISS index maintenance.
+
+Signal handlers here re-embed only the row that changed and update the live
+index in place, instead of waiting for ``rebuild_faiss_indexes``. Updates run
+on a background thread once the transaction commits, so saving a row never
+waits for the model.
+
+The handlers are connected in every process, so faiss, numpy and the model
+are imported only when an update actually runs, and not at all for indexes
+that have not been built.
+"""
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.text import slugify
+
+from . import index_paths
+from .text_builders import (
+    build_housing_listing_text,
+    build_marketplace_item_text,
+    build_study_group_text,
+    build_user_profile_text,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Set to False to run updates in the committing thread instead.
+IN_BACKGROUND = getattr(settings, 'AI_RECOMMENDATIONS_INCREMENTAL_INDEXING_IN_BACKGROUND', True)
+
+# One thread, so updates apply in commit order.
+_update_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='faiss-incremental')
+
+
+def _run_on_commit(func, *args):
+    """Run an index update once the surrounding transaction commits."""
+    def run():
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Incremental FAISS update %s%r failed', func.__name__, args)
+        finally:
+            if IN_BACKGROUND:
+                close_old_connections()
+
+    def submit():
+        if IN_BACKGROUND:
+            _update_executor.submit(run)
+        else:
+            run()
+
+    transaction.on_commit(submit)
+
+
+def _upsert(index_name, item_id, text, attributes=None):
+    """
+    Embed and index a row. If the index already holds it embedded from the
+    same text, only its attributes are updated; if the index was never
+    built, nothing is done.
+
+    Returns:
+        the new embedding, or None if the text was unchanged or there is no index
+    """
+    if not index_paths.index_exists(index_name):
+        return None
+
+    from . import embedding_service, faiss_service, text_store
+
+    if text_store.is_current(index_name, item_id, text) and (
+        not attributes or faiss_service.update_attributes(index_name, item_id, attributes)
+    ):
+        return None
+
+    embedding = embedding_service.embed_text(text)
+    if faiss_service.upsert_vector(index_name, item_id, embedding, attributes):
+        text_store.record(index_name, [item_id], [text])
+    return embedding
+
+
+def remove_from_index(index_name, item_ids):
+    from . import text_store
+
+    if index_paths.index_exists(index_name):
+        from . import faiss_service
+
+        faiss_service.remove_ids(index_name, item_ids)
+    text_store.forget(index_name, item_ids)
+
+
+# --- Filterable attributes ---
+# Stored next to each index so rag_pipeline can apply its hybrid filters
+# inside the FAISS search instead of post-filtering through the ORM. The
+# *_ATTRIBUTE_FIELDS tuples list the model fields each function reads.
+
+HOUSING_LISTING_ATTRIBUTE_FIELDS = ('rent_price', 'is_available', 'distance_to_campus', 'posted_date')
+MARKETPLACE_ITEM_ATTRIBUTE_FIELDS = ('price', 'is_sold')
+# is_full also needs the group's memberships, prefetched.
+STUDY_GROUP_ATTRIBUTE_FIELDS = ('is_active', 'max_members')
+
+# Roommate preferences are stored as integer codes so ranking.py can compare
+# them with NumPy; 0 is 'no_preference' and unknown values are -1.
+ROOMMATE_CHOICE_CODES = {
+    'no_preference': 0,
+    'yes': 1, 'no': 2, 'sometimes': 3,
+    'early_riser': 4, 'night_owl': 5, 'average': 6,
+    'in_room': 7, 'library': 8, 'other_places': 9,
+}
+ROOMMATE_PREFERENCE_FIELDS = (
+    'smoking_preference', 'drinking_preference', 'sleep_habits', 'study_habits', 'guests_preference',
+)
+
+
+def _timestamp(value):
+    return value.timestamp() if value is not None else float('nan')
+
+
+def roommate_choice_code(value):
+    return ROOMMATE_CHOICE_CODES.get(value, -1)
+
+
+def housing_listing_attributes(listing):
+    distance = listing.distance_to_campus
+    attributes = {
+        'rent_price': float(listing.rent_price),
+        'is_available': bool(listing.is_available),
+        'distance_to_campus': float(distance) if distance is not None else float('nan'),
+        'posted_at': _timestamp(listing.posted_date),
+    }
+    if HOUSING_SHARDS:
+        attributes['shard_code'] = housing_shard_code(housing_listing_shard(listing))
+    return attributes
+
+
+def marketplace_item_attributes(item):
+    return {
+        'price': float(item.price),
+        'is_sold': bool(item.is_sold),
+    }
+
+
+def study_group_attributes(group):
+    return {
+        'is_active': bool(group.is_active),
+        'is_full': bool(group.is_full),
+    }
+
+
+def user_profile_attributes(profile):
+    """Roommate index attributes; needs the profile's roommate_profile joined in."""
+    roommate_profile = getattr(profile, 'roommate_profile', None)
+    attributes = {
+        'joined_at': _timestamp(profile.date_joined),
+        'has_preferences': roommate_profile is not None,
+    }
+    for field in ROOMMATE_PREFERENCE_FIELDS:
+        value = getattr(roommate_profile, field) if roommate_profile else 'no_preference'
+        attributes[field] = roommate_choice_code(value)
+    attributes['cleanliness_level'] = roommate_profile.cleanliness_level if roommate_profile else 0
+    budget = roommate_profile.max_rent_budget if roommate_profile else None
+    attributes['max_rent_budget'] = float(budget) if budget else 0.0
+    return attributes
+
+
+def collect_attributes(rows, attributes_for):
+    """Turn per-row attribute dicts into {column: numpy array} for build_index."""
+    import numpy as np
+
+    columns = {}
+    for row in rows:
+        for column, value in attributes_for(row).items():
+            columns.setdefault(column, []).append(value)
+    return {column: np.array(values) for column, values in columns.items()}
+
+
+# --- Housing shards ---
+# With AI_RECOMMENDATIONS_HOUSING_SHARDS, housing listings are also indexed
+# per city (housing@<city>-<state>) next to the global housing index, and
+# rag_pipeline searches only the shards of the user's market.
+
+HOUSING_SHARDS = getattr(settings, 'AI_RECOMMENDATIONS_HOUSING_SHARDS', False)
+HOUSING_SHARD_FIELDS = ('city', 'state')
+
+
+US_STATE_CODES = {
+    'alabama': 'al', 'alaska': 'ak', 'arizona': 'az', 'arkansas': 'ar', 'california': 'ca',
+    'colorado': 'co', 'connecticut': 'ct', 'delaware': 'de', 'district of columbia': 'dc',
+    'florida': 'fl', 'georgia': 'ga', 'hawaii': 'hi', 'idaho': 'id', 'illinois': 'il',
+    'indiana': 'in', 'iowa': 'ia', 'kansas': 'ks', 'kentucky': 'ky', 'louisiana': 'la',
+    'maine': 'me', 'maryland': 'md', 'massachusetts': 'ma', 'michigan': 'mi', 'minnesota': 'mn',
+    'mississippi': 'ms', 'missouri': 'mo', 'montana': 'mt', 'nebraska': 'ne', 'nevada': 'nv',
+    'new hampshire': 'nh', 'new jersey': 'nj', 'new mexico': 'nm', 'new york': 'ny',
+    'north carolina': 'nc', 'north dakota': 'nd', 'ohio': 'oh', 'oklahoma': 'ok', 'oregon': 'or',
+    'pennsylvania': 'pa', 'rhode island': 'ri', 'south carolina': 'sc', 'south dakota': 'sd',
+    'tennessee': 'tn', 'texas': 'tx', 'utah': 'ut', 'vermont': 'vt', 'virginia': 'va',
+    'washington': 'wa', 'west virginia': 'wv', 'wisconsin': 'wi', 'wyoming': 'wy',
+}
+
+
+def normalize_location(city, state=''):
+    """
+    (city, state) lowercased with whitespace collapsed, a state typed into
+    the city after a comma ('Austin, TX') split off, and US state names
+    turned into postal codes, so listings and profiles agree on shard keys.
+    """
+    city = ' '.join((city or '').split()).lower()
+    state = ' '.join((state or '').split()).lower().rstrip('.')
+    if ',' in city:
+        city, _, typed_state = city.partition(',')
+        city = city.strip()
+        state = state or typed_state.strip()
+    return city, US_STATE_CODES.get(state, state)
+
+
+def housing_shard(city, state=''):
+    """Shard key of a city, e.g. 'austin-tx'; '' if the city is blank."""
+    city, state = normalize_location(city, state)
+    if not city:
+        return ''
+    return slugify(f'{city} {state}')
+
+
+def housing_listing_shard(listing):
+    return housing_shard(listing.city, listing.state)
+
+
+def housing_shard_code(shard):
+    """
+    Integer stored for a shard key in the housing attributes, so a listing's
+    shard can be found once it has moved city or been deleted; 0 for no shard.
+    """
+    return zlib.crc32(shard.encode('utf-8')) if shard else 0
+
+
+def _indexed_housing_shards(listing_id):
+    """
+    Shards the global housing index last placed ``listing_id`` in: its
+    stored shard_code's, none if it is not indexed, or every built shard for
+    indexes built without the column.
+    """
+    from . import faiss_service
+
+    attributes = faiss_service.get_attributes('housing', listing_id)
+    shards = faiss_service.list_shards('housing')
+    if attributes is None:
+        return [] if faiss_service.has_attributes('housing') else shards
+    if 'shard_code' not in attributes:
+        return shards
+    return [shard for shard in shards if housing_shard_code(shard) == attributes['shard_code']]
+
+
+# --- Row sync ---
+# Each sync applies the same eligibility rules as rebuild_faiss_indexes, so an
+# incrementally maintained index matches a freshly rebuilt one. Syncs for an
+# index that was never built return before building texts or attributes.
+
+def sync_housing_listing(listing):
+    # Shards are built together with the global index.
+    if not index_paths.index_exists('housing'):
+        return
+
+    from . import faiss_service
+
+    # Read before the global index is updated with the listing's new shard.
+    old_shards = _indexed_housing_shards(listing.id) if HOUSING_SHARDS else []
+    if not listing.is_available:
+        remove_from_index('housing', [listing.id])
+        if HOUSING_SHARDS:
+            sync_housing_shards(listing, old_shards=old_shards)
+        return
+
+    embedding = _upsert(
+        'housing', listing.id, build_housing_listing_text(listing),
+        housing_listing_attributes(listing),
+    )
+    if not HOUSING_SHARDS:
+        return
+    if embedding is not None:
+        sync_housing_shards(listing, embedding, old_shards)
+    elif housing_listing_shard(listing):
+        # Same text, so the same city and shard; only attributes changed.
+        faiss_service.update_attributes(
+            faiss_service.shard_index_name('housing', housing_listing_shard(listing)),
+            listing.id, housing_listing_attributes(listing),
+        )
+
+
+def sync_housing_shards(listing, embedding=None, old_shards=None):
+    """
+    Index the listing in its city's shard only (none if ``embedding`` is
+    None), dropping it from ``old_shards``, the shards it was in (found from
+    the global index, by default).
+    """
+    from . import faiss_service
+
+    shard = housing_listing_shard(listing) if embedding is not None else ''
+    if old_shards is None:
+        old_shards = _indexed_housing_shards(listing.id)
+    for other in old_shards:
+        if other != shard:
+            faiss_service.remove_ids(faiss_service.shard_index_name('housing', other), [listing.id])
+    if shard:
+        faiss_service.upsert_vector(
+            faiss_service.shard_index_name('housing', shard), listing.id, embedding,
+            housing_listing_attributes(listing), create=True,
+        )
+
+
+def remove_housing_listing(listing_id):
+    from . import faiss_service
+
+    if not HOUSING_SHARDS or not index_paths.index_exists('housing'):
+        remove_from_index('housing', [listing_id])
+        return
+    old_shards = _indexed_housing_shards(listing_id)
+    remove_from_index('housing', [listing_id])
+    for shard in old_shards:
+        faiss_service.remove_ids(faiss_service.shard_index_name('housing', shard), [listing_id])
+
+
+def sync_marketplace_item(item):
+    if not index_paths.index_exists('marketplace'):
+        return
+    if not item.is_sold:
+        _upsert(
+            'marketplace', item.id, build_marketplace_item_text(item),
+            marketplace_item_attributes(item),
+        )
+    else:
+        remove_from_index('marketplace', [item.id])
+
+
+def sync_study_group(group):
+    if not index_paths.index_exists('study_groups'):
+        return
+    if group.is_active:
+        _upsert(
+            'study_groups', group.id, build_study_group_text(group),
+            study_group_attributes(group),
+        )
+    else:
+        remove_from_index('study_groups', [group.id])
+
+
+def sync_study_group_attributes(group_id):
+    if not index_paths.index_exists('study_groups'):
+        return
+
+    from study_groups.models import StudyGroup
+
+    from . import faiss_service
+
+    group = StudyGroup.objects.filter(pk=group_id).first()
+    if group is not None:
+        faiss_service.update_attributes('study_groups', group.id, study_group_attributes(group))
+
+
+def sync_user_profile(profile):
+    if not index_paths.index_exists('roommate'):
+        return
+    roommate_profile = getattr(profile, 'roommate_profile', None)
+    _upsert(
+        'roommate', profile.user_id, build_user_profile_text(profile, roommate_profile),
+        user_profile_attributes(profile),
+    )
+
+
+def sync_user_profile_by_id(profile_id):
+    if not index_paths.index_exists('roommate'):
+        return
+
+    from user_profiles.models import UserProfile
+
+    profile = UserProfile.objects.select_related('roommate_profile').filter(pk=profile_id).first()
+    if profile is not None:
+        sync_user_profile(profile)
+
+
+# --- Signal handlers ---
+
+def housing_listing_saved(sender, instance, **kwargs):
+    _run_on_commit(sync_housing_listing, instance)
+
+
+def housing_listing_deleted(sender, instance, **kwargs):
+    _run_on_commit(remove_housing_listing, instance.pk)
+
+
+def marketplace_item_saved(sender, instance, **kwargs):
+    _run_on_commit(sync_marketplace_item, instance)
+
+
+def marketplace_item_deleted(sender, instance, **kwargs):
+    _run_on_commit(remove_from_index, 'marketplace', [instance.pk])
+
+
+def study_group_saved(sender, instance, **kwargs):
+    _run_on_commit(sync_study_group, instance)
+
+
+def study_group_deleted(sender, instance, **kwargs):
+    _run_on_commit(remove_from_index, 'study_groups', [instance.pk])
+
+
+def group_membership_changed(sender, instance, **kwargs):
+    # Membership changes only affect is_full; no need to re-embed the group.
+    _run_on_commit(sync_study_group_attributes, instance.group_id)
+
+
+def user_profile_saved(sender, instance, **kwargs):
+    _run_on_commit(sync_user_profile, instance)
+
+
+def user_profile_deleted(sender, instance, **kwargs):
+    _run_on_commit(remove_from_index, 'roommate', [instance.user_id])
+
+
+def roommate_profile_changed(sender, instance, **kwargs):
+    # Lifestyle fields are folded into the owner's profile vector.
+    _run_on_commit(sync_user_profile_by_id, instance.user_profile_id)
+
+
+# --- Recorded texts without incremental indexing ---
+# With AI_RECOMMENDATIONS_INCREMENTAL_INDEXING off, indexes change only when
+# rebuilt, but IndexedText must still not vouch for rows deleted, filtered
+# out or re-worded since: forgetting their texts makes
+# ``rebuild_faiss_indexes --if-stale`` pick the index up, and the rebuild
+# re-embeds exactly those rows.
+
+def forget_changed_text(index_name, item_id, text=None):
+    """Forget ``item_id``'s recorded text unless it was embedded from ``text``."""
+    if not index_paths.index_exists(index_name):
+        return
+
+    from . import text_store
+
+    if text is None or not text_store.is_current(index_name, item_id, text):
+        text_store.forget(index_name, [item_id])
+
+
+def _forget_changed_housing_listing_text(listing):
+    text = build_housing_listing_text(listing) if listing.is_available else None
+    forget_changed_text('housing', listing.id, text)
+
+
+def _forget_changed_marketplace_item_text(item):
+    text = build_marketplace_item_text(item) if not item.is_sold else None
+    forget_changed_text('marketplace', item.id, text)
+
+
+def _forget_changed_study_group_text(group):
+    text = build_study_group_text(group) if group.is_active else None
+    forget_changed_text('study_groups', group.id, text)
+
+
+def _forget_changed_user_profile_text(profile_id):
+    from user_profiles.models import UserProfile
+
+    profile = UserProfile.objects.select_related('roommate_profile').filter(pk=profile_id).first()
+    if profile is not None:
+        text = build_user_profile_text(profile, getattr(profile, 'roommate_profile', None))
+        forget_changed_text('roommate', profile.user_id, text)
+
+
+def housing_listing_text_saved(sender, instance, **kwargs):
+    _run_on_commit(_forget_changed_housing_listing_text, instance)
+
+
+def housing_listing_text_deleted(sender, instance, **kwargs):
+    _run_on_commit(forget_changed_text, 'housing', instance.pk)
+
+
+def marketplace_item_text_saved(sender, instance, **kwargs):
+    _run_on_commit(_forget_changed_marketplace_item_text, instance)
+
+
+def marketplace_item_text_deleted(sender, instance, **kwargs):
+    _run_on_commit(forget_changed_text, 'marketplace', instance.pk)
+
+
+def study_group_text_saved(sender, instance, **kwargs):
+    _run_on_commit(_forget_changed_study_group_text, instance)
+
+
+def study_group_text_deleted(sender, instance, **kwargs):
+    _run_on_commit(forget_changed_text, 'study_groups', instance.pk)
+
+
+def user_profile_text_saved(sender, instance, **kwargs):
+    _run_on_commit(_forget_changed_user_profile_text, instance.pk)
+
+
+def user_profile_text_deleted(sender, instance, **kwargs):
+    _run_on_commit(forget_changed_text, 'roommate', instance.user_id)
+
+
+def roommate_profile_text_changed(sender, instance, **kwargs):
+    _run_on_commit(_forget_changed_user_profile_text, instance.user_profile_id)
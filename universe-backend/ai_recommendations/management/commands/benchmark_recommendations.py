@@ -0,0 +1,214 @@
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import faiss
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from ai_recommendations import benchmark
+from ai_recommendations import embeddings as emb
+from ai_recommendations import faiss_service
+from ai_recommendations import index_paths
+from ai_recommendations import query_cache
+from ai_recommendations import rag_pipeline
+from ai_recommendations import result_cache
+
+INDEX_NAMES = list(benchmark.CATALOGS)
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark index builds, search_similar and the recommendation pipelines on '
+        'synthetic catalogs, reporting latency percentiles and recall as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10_000],
+            help='Catalog sizes to benchmark, in rows per index (default: 10000)',
+        )
+        parser.add_argument(
+            '--index',
+            type=str,
+            choices=INDEX_NAMES + ['all'],
+            default='all',
+            help='Which index to benchmark (default: all)',
+        )
+        parser.add_argument(
+            '--index-type',
+            type=str,
+            choices=['auto', 'flat', 'ivf_flat', 'ivf_pq', 'hnsw'],
+            default=None,
+            help='Build every index with this type (default: AI_RECOMMENDATIONS_FAISS_INDEXES)',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='search_similar queries per index (default: 200)',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=50,
+            help='Users to time each get_*_recommendations for; 0 to skip (default: 50)',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=10,
+            help='Results per search; recall is measured at this k (default: 10)',
+        )
+        parser.add_argument(
+            '--encode',
+            action='store_true',
+            help='Embed the synthetic texts with the model instead of generating vectors (slow)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10_000,
+            help='Rows generated and added to an index at a time (default: 10000)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed for the synthetic data (default: 0)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help='Write the JSON report to this file instead of stdout',
+        )
+
+    def handle(self, *args, **options):
+        index_names = INDEX_NAMES if options['index'] == 'all' else [options['index']]
+        if min(options['sizes']) < 1:
+            raise CommandError('--sizes must be positive.')
+        # With the report on stdout, progress goes to stderr.
+        self.progress = self.stdout if options['output'] else self.stderr
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'git_commit': _git_commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'faiss': getattr(faiss, '__version__', None),
+                'numpy': np.__version__,
+                'cpu_count': os.cpu_count(),
+                'embedding_model': emb.MODEL_VERSION,
+            },
+            'options': {
+                name: options[name]
+                for name in ('sizes', 'index_type', 'queries', 'users', 'top_k', 'encode', 'seed')
+            },
+            'runs': [],
+        }
+
+        # Indexes go to a scratch directory, and users are created in a
+        # transaction rolled back at the end, so nothing outlives the run.
+        with tempfile.TemporaryDirectory(prefix='faiss-benchmark-') as faiss_dir, \
+                override_settings(**self._index_settings(options['index_type'])):
+            live_faiss_dir, live_result_cache = index_paths.FAISS_DIR, result_cache.CACHE_ALIAS
+            index_paths.FAISS_DIR = faiss_dir
+            result_cache.CACHE_ALIAS = None
+            faiss_service.invalidate_cache()
+            query_cache.clear()
+            try:
+                with transaction.atomic():
+                    users = []
+                    if options['users'] > 0:
+                        users = benchmark.create_users(
+                            options['users'], benchmark.Topics(options['seed']), options['seed']
+                        )
+                    for size in options['sizes']:
+                        report['runs'].append(self._run(size, index_names, users, options))
+                    transaction.set_rollback(True)
+            finally:
+                index_paths.FAISS_DIR, result_cache.CACHE_ALIAS = live_faiss_dir, live_result_cache
+                faiss_service.invalidate_cache()
+                query_cache.clear()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Benchmark report written to {options['output']}."))
+        else:
+            self.stdout.write(output)
+
+    def _index_settings(self, index_type):
+        if index_type is None:
+            return {}
+        indexes = {
+            name: dict(config)
+            for name, config in getattr(settings, 'AI_RECOMMENDATIONS_FAISS_INDEXES', {}).items()
+        }
+        for name in ['default'] + INDEX_NAMES:
+            indexes.setdefault(name, {})['type'] = index_type
+        return {'AI_RECOMMENDATIONS_FAISS_INDEXES': indexes}
+
+    def _run(self, size, index_names, users, options):
+        topics = benchmark.Topics(options['seed'])
+        queries = benchmark.query_vectors(
+            options['queries'], topics, options['seed'], options['encode']
+        )
+        recall = f"recall@{options['top_k']}"
+        run = {'size': size, 'indexes': {}}
+
+        for index_name in index_names:
+            self.progress.write(f'[{size}] Building {index_name} index...')
+            neighbors = faiss_service.ExactNeighbors(k=options['top_k'], queries=queries)
+            chunks = benchmark.iter_catalog(
+                index_name, size, topics, max(1, options['chunk_size']), options['seed'], options['encode']
+            )
+            result = benchmark.benchmark_build(index_name, chunks, size, neighbors)
+            result.update(benchmark.benchmark_search(
+                index_name, neighbors, benchmark.SEARCH_FILTERS[index_name]
+            ))
+            run['indexes'][index_name] = result
+            search = result['search_similar']
+            self.progress.write(
+                f"  {result['index_type']}: built in {result['build_seconds']:.2f}s, "
+                f"search p50={search['p50_ms']:.2f}ms p99={search['p99_ms']:.2f}ms, "
+                f'{recall}={search[recall]:.3f}'
+            )
+
+        if users:
+            domains = [
+                domain for domain, index_name in rag_pipeline.DOMAIN_INDEXES.items()
+                if index_name in index_names
+            ]
+            if len(domains) == len(rag_pipeline.DOMAIN_INDEXES):
+                domains.append('all')
+            self.progress.write(f'[{size}] Timing recommendations for {len(users)} users...')
+            start = time.perf_counter()
+            run['recommendations'] = benchmark.benchmark_recommendations(
+                users, options['top_k'], domains
+            )
+            self.progress.write(f'  done in {time.perf_counter() - start:.1f}s')
+        return run
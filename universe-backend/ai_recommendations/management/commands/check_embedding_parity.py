@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from ai_recommendations import embeddings as emb
+
+
+class Command(BaseCommand):
+    help = 'Check that an embedding backend scores texts like the full-precision model'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            type=str,
+            choices=sorted(emb.BACKENDS),
+            default=emb.BACKEND,
+            help='Backend to check (default: AI_RECOMMENDATIONS_EMBEDDING_BACKEND)',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.01,
+            help='Largest allowed change in any cosine score (default: 0.01)',
+        )
+        parser.add_argument(
+            '--text',
+            action='append',
+            dest='texts',
+            help='Text to compare on; repeat for several (default: built-in samples)',
+        )
+
+    def handle(self, *args, **options):
+        report = emb.check_parity(options['backend'], options['texts'], options['tolerance'])
+        self.stdout.write(
+            f"{report['backend']}: {report['texts']} texts, "
+            f"min cosine to reference {report['min_self_cosine']:.5f}, "
+            f"max score error {report['max_score_error']:.5f}"
+        )
+        if not report['passed']:
+            raise CommandError(f"Backend {report['backend']} is outside tolerance {options['tolerance']}")
+        self.stdout.write(self.style.SUCCESS('Embedding backend matches the reference model.'))
@@ -0,0 +1,183 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Only the recommendation code paths should import these. numpy is not
+# listed: daphne imports it in every process through autobahn; pass
+# --forbid numpy to check it anyway.
+HEAVY_MODULES = (
+    'faiss',
+    'torch',
+    'transformers',
+    'sentence_transformers',
+    'onnxruntime',
+    'langchain_core',
+)
+
+IMPORTTIME_PREFIX = 'import time:'
+
+# Models whose saves update a FAISS index.
+INDEXED_MODELS = (
+    'housing.HousingListing',
+    'marketplace.MarketplaceItem',
+    'study_groups.StudyGroup',
+    'user_profiles.UserProfile',
+)
+
+# Sends post_save for an unsaved instance of each model, as a save does,
+# with FAISS_DIR pointing at an empty directory, then prints the modules
+# loaded. Nothing is written to the database.
+SAVE_WITHOUT_INDEX_SCRIPT = '''
+import json, sys, tempfile
+import django
+django.setup()
+from django.apps import apps
+from django.db.models.signals import post_save
+from ai_recommendations import index_paths, indexing
+
+index_paths.FAISS_DIR = tempfile.mkdtemp()
+indexing.IN_BACKGROUND = False
+for label in sys.argv[1:]:
+    model = apps.get_model(label)
+    post_save.send(sender=model, instance=model(pk=1), created=False, raw=False, using='default')
+print(json.dumps(sorted(sys.modules)))
+'''
+
+
+def parse_importtime(stderr):
+    """
+    Parse ``python -X importtime`` output.
+
+    Returns:
+        list of (module, depth, cumulative_us, importers) in import order,
+        where ``importers`` is the chain of modules that led to the import
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORTTIME_PREFIX):
+            continue
+        _, cumulative, name = line[len(IMPORTTIME_PREFIX):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # header
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(cumulative)))
+
+    # importtime lists children before their parent; walk it backwards to
+    # know each module's importers.
+    parsed = []
+    stack = []
+    for module, depth, cumulative in reversed(rows):
+        del stack[depth:]
+        parsed.append((module, depth, cumulative, list(stack)))
+        stack.append(module)
+    parsed.reverse()
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the imports of a management command with `python -X importtime` and fail '
+        'if it loads the ML stack or exceeds a budget'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'command',
+            nargs='*',
+            default=['check'],
+            help='Command (and arguments) to measure (default: check)',
+        )
+        parser.add_argument(
+            '--max-ms',
+            type=float,
+            default=None,
+            help='Fail if imports take longer than this many milliseconds',
+        )
+        parser.add_argument(
+            '--allow',
+            action='append',
+            default=[],
+            help='Heavy module the command may import; repeat for several',
+        )
+        parser.add_argument(
+            '--forbid',
+            action='append',
+            default=[],
+            help='Additional module the command must not import; repeat for several',
+        )
+        parser.add_argument(
+            '--skip-save-check',
+            action='store_true',
+            help='Do not check that saving an indexed model with no index built stays light',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Runs to take the fastest import time from (default: 3)',
+        )
+
+    def handle(self, *args, **options):
+        command = options['command']
+        label = f"manage.py {' '.join(command)}"
+        forbidden = (set(HEAVY_MODULES) | set(options['forbid'])) - set(options['allow'])
+
+        totals = []
+        for _ in range(max(1, options['repeat'])):
+            parsed = self._run(command)
+            totals.append(sum(cumulative for _, depth, cumulative, _ in parsed if depth == 0) / 1000)
+        total_ms = min(totals)
+        self.stdout.write(f'{label}: {total_ms:.0f} ms of imports, {len(parsed)} modules')
+
+        offenders = {}
+        for module, _, cumulative, importers in parsed:
+            package = module.split('.')[0]
+            if package in forbidden and package not in offenders and package not in importers:
+                offenders[package] = (cumulative / 1000, importers)
+
+        errors = []
+        for package, (cumulative_ms, importers) in offenders.items():
+            chain = ' -> '.join(importers + [package])
+            errors.append(f'{package} ({cumulative_ms:.0f} ms) imported via {chain}')
+        if options['max_ms'] is not None and total_ms > options['max_ms']:
+            errors.append(f'imports took {total_ms:.0f} ms, budget is {options["max_ms"]:.0f} ms')
+
+        if not options['skip_save_check']:
+            loaded = {module.split('.')[0] for module in self._save_without_index()}
+            for package in sorted(loaded & forbidden):
+                errors.append(f'{package} imported by saving a model with no index built')
+            if not loaded & forbidden:
+                self.stdout.write('Saving indexed models with no index built imports no ML modules.')
+
+        if errors:
+            raise CommandError(f'{label} import regression:\n  ' + '\n  '.join(errors))
+        self.stdout.write(self.style.SUCCESS('Import check passed.'))
+
+    def _run(self, command):
+        manage_py = os.path.join(settings.BASE_DIR, 'manage.py')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', manage_py, *command],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            output = [line for line in result.stderr.splitlines() if not line.startswith(IMPORTTIME_PREFIX)]
+            raise CommandError(f'manage.py {" ".join(command)} failed:\n' + '\n'.join(output[-20:]))
+        return parse_importtime(result.stderr)
+
+    def _save_without_index(self):
+        """Modules loaded by saving each of INDEXED_MODELS with no index built."""
+        result = subprocess.run(
+            [sys.executable, '-c', SAVE_WITHOUT_INDEX_SCRIPT, *INDEXED_MODELS],
+            capture_output=True,
+            text=True,
+            cwd=settings.BASE_DIR,
+            env={'DJANGO_SETTINGS_MODULE': 'universe_backend.settings', **os.environ},
+        )
+        if result.returncode != 0:
+            raise CommandError('Saving models with no index built failed:\n' + result.stderr[-2000:])
+        return json.loads(result.stdout.splitlines()[-1])
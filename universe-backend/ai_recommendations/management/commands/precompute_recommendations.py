@@ -0,0 +1,81 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ai_recommendations import batch_recommendations
+from ai_recommendations import rag_pipeline
+from ai_recommendations import result_cache
+
+
+class Command(BaseCommand):
+    help = 'Precompute cached recommendations for recently active users (run off-peak)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Include users who logged in within this many days (default: 7)',
+        )
+        parser.add_argument(
+            '--domain',
+            type=str,
+            choices=list(rag_pipeline.PIPELINES) + ['all'],
+            default='all',
+            help='Which recommendations to precompute (default: all)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Precompute for at most this many users, most recently active first',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1024,
+            help='Users embedded and searched together (default: 1024)',
+        )
+
+    def handle(self, *args, **options):
+        if not result_cache.is_enabled():
+            raise CommandError('Result caching is disabled (AI_RECOMMENDATIONS_RESULT_CACHE is None).')
+        if isinstance(caches[result_cache.CACHE_ALIAS], LocMemCache):
+            self.stderr.write(self.style.WARNING(
+                f'Cache "{result_cache.CACHE_ALIAS}" is process-local; precomputed results '
+                'will not be visible to the web workers.'
+            ))
+
+        domains = list(rag_pipeline.PIPELINES) if options['domain'] == 'all' else [options['domain']]
+        since = timezone.now() - timedelta(days=options['days'])
+        users = get_user_model().objects.filter(
+            is_active=True, last_login__gte=since
+        ).order_by('-last_login')
+        if options['limit']:
+            users = users[:options['limit']]
+
+        top_k = result_cache.CACHED_TOP_K
+        batch_size = max(1, options['batch_size'])
+        # Read before computing so an index rebuilt meanwhile invalidates the entries.
+        epochs = rag_pipeline.index_epochs(domains)
+        done = 0
+        start = time.perf_counter()
+        recommendations = batch_recommendations.iter_recommendations(
+            users.iterator(chunk_size=batch_size), top_k, domains, batch_size
+        )
+        for user, results in recommendations:
+            result_cache.store(results, user.pk, top_k, epochs)
+            done += 1
+            if done % batch_size == 0:
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'  {done} users ({done / elapsed:.0f}/s)...')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Precomputed {", ".join(domains)} recommendations for {done} users '
+            f'in {time.perf_counter() - start:.1f}s.'
+        ))
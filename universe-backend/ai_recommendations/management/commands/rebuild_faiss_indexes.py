@@ -1,7 +1,37 @@
-from django.core.management.base import BaseCommand
+import io
+import math
+import multiprocessing as mp
+import os
+import sys
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max, Min
 from ai_recommendations import embeddings as emb
+from ai_recommendations import embedding_store
 from ai_recommendations import faiss_service
+from ai_recommendations import text_store
+from ai_recommendations.indexing import (
+    HOUSING_LISTING_ATTRIBUTE_FIELDS,
+    HOUSING_SHARD_FIELDS,
+    HOUSING_SHARDS,
+    MARKETPLACE_ITEM_ATTRIBUTE_FIELDS,
+    STUDY_GROUP_ATTRIBUTE_FIELDS,
+    collect_attributes,
+    housing_listing_attributes,
+    housing_listing_shard,
+    housing_shard,
+    marketplace_item_attributes,
+    study_group_attributes,
+    user_profile_attributes,
+)
 from ai_recommendations.text_builders import (
+    HOUSING_LISTING_TEXT_FIELDS,
+    MARKETPLACE_ITEM_TEXT_FIELDS,
+    STUDY_GROUP_TEXT_FIELDS,
     build_housing_listing_text,
     build_marketplace_item_text,
     build_study_group_text,
@@ -9,6 +39,118 @@ from ai_recommendations.text_builders import (
 )
 
 
+def _housing_rows():
+    from housing.models import HousingListing
+
+    return HousingListing.objects.filter(is_available=True).only(
+        *HOUSING_LISTING_TEXT_FIELDS, *HOUSING_LISTING_ATTRIBUTE_FIELDS
+    )
+
+
+def _marketplace_rows():
+    from marketplace.models import MarketplaceItem
+
+    return MarketplaceItem.objects.filter(is_sold=False).only(
+        *MARKETPLACE_ITEM_TEXT_FIELDS, *MARKETPLACE_ITEM_ATTRIBUTE_FIELDS
+    )
+
+
+def _study_group_rows():
+    from study_groups.models import StudyGroup
+
+    # With chunk_size, iterator() runs the prefetch once per chunk.
+    return StudyGroup.objects.filter(is_active=True).only(
+        *STUDY_GROUP_TEXT_FIELDS, *STUDY_GROUP_ATTRIBUTE_FIELDS
+    ).prefetch_related('memberships')
+
+
+def _roommate_rows():
+    from user_profiles.models import UserProfile
+
+    # One query per chunk: the roommate profile is joined in and the index
+    # is keyed by user_id, so no row needs a related lookup.
+    return UserProfile.objects.select_related('roommate_profile')
+
+
+def _roommate_text(profile):
+    return build_user_profile_text(profile, getattr(profile, 'roommate_profile', None))
+
+
+# shard_for, if set, also builds one index per shard key it returns for a row.
+IndexSource = namedtuple(
+    'IndexSource',
+    ['label', 'rows_label', 'rows', 'text_for', 'id_for', 'attributes_for', 'shard_for'],
+    defaults=[None],
+)
+
+INDEX_SOURCES = {
+    'housing': IndexSource(
+        'Housing', 'housing listings', _housing_rows, build_housing_listing_text,
+        lambda listing: listing.id, housing_listing_attributes,
+        housing_listing_shard if HOUSING_SHARDS else None,
+    ),
+    'marketplace': IndexSource(
+        'Marketplace', 'marketplace items', _marketplace_rows, build_marketplace_item_text,
+        lambda item: item.id, marketplace_item_attributes,
+    ),
+    'study_groups': IndexSource(
+        'Study groups', 'study groups', _study_group_rows, build_study_group_text,
+        lambda group: group.id, study_group_attributes,
+    ),
+    'roommate': IndexSource(
+        'Roommate', 'user profiles', _roommate_rows, _roommate_text,
+        lambda profile: profile.user_id, user_profile_attributes,
+    ),
+}
+
+
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` items."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# --- Worker processes (--workers) ---
+
+def _init_worker(threads):
+    # Spawned workers start without Django set up.
+    import django
+    import faiss
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+    # Share the cores between workers instead of each using all of them.
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    faiss.omp_set_num_threads(threads)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+
+
+def _encode_shard(index_name, low, high, chunk_size):
+    """Encode rows with low <= pk < high into the shared embedding store."""
+    source = INDEX_SOURCES[index_name]
+    rows = source.rows().filter(pk__gte=low, pk__lt=high)
+    store = embedding_store.get_store()
+    misses = store.misses
+    n_rows = 0
+    for chunk in chunked(rows.iterator(chunk_size=chunk_size), chunk_size):
+        store.embed_texts([source.text_for(row) for row in chunk])
+        n_rows += len(chunk)
+    return n_rows, store.misses - misses
+
+
+def _build_index_in_worker(index_name, chunk_size, evaluate_recall):
+    """Build one index; returns the command output."""
+    output = io.StringIO()
+    command = Command(stdout=output)
+    command._set_options(chunk_size, use_embedding_cache=True, evaluate_recall=evaluate_recall)
+    command._build_index(index_name)
+    return output.getvalue()
+
+
 class Command(BaseCommand):
     help = 'Rebuild FAISS indexes for AI recommendations'
 
@@ -16,87 +158,302 @@ class Command(BaseCommand):
         parser.add_argument(
             '--index',
             type=str,
-            choices=['housing', 'marketplace', 'study_groups', 'roommate', 'all'],
+            choices=list(INDEX_SOURCES) + ['all'],
             default='all',
             help='Which index to rebuild (default: all)',
         )
+        parser.add_argument(
+            '--no-embedding-cache',
+            action='store_true',
+            help='Re-encode every row instead of reusing cached embeddings',
+        )
+        parser.add_argument(
+            '--evaluate-recall',
+            action='store_true',
+            help='After building, report recall@10 and search latency against exact search',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows loaded, embedded and added to the index at a time (default: 1000)',
+        )
+        parser.add_argument(
+            '--if-stale',
+            action='store_true',
+            help=(
+                'Only rebuild indexes that are missing, or whose vectors are not all '
+                'from the active embedding model'
+            ),
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help=(
+                'Processes to encode and build with, each loading its own model; large '
+                'indexes are split into shards encoded in parallel (default: 1)'
+            ),
+        )
 
     def handle(self, *args, **options):
         index_name = options['index']
+        self._set_options(
+            options['chunk_size'], not options['no_embedding_cache'], options['evaluate_recall']
+        )
+        index_names = list(INDEX_SOURCES) if index_name == 'all' else [index_name]
+        if options['if_stale']:
+            index_names = [name for name in index_names if self._is_stale(name)]
+            if not index_names:
+                self.stdout.write(self.style.SUCCESS('FAISS indexes are up to date.'))
+                return
 
-        if index_name in ('housing', 'all'):
-            self._build_housing_index()
+        if options['workers'] > 1:
+            if not self.use_embedding_cache:
+                raise CommandError(
+                    '--workers shares encoded rows through the embedding cache; '
+                    'drop --no-embedding-cache.'
+                )
+            self._build_parallel(index_names, options['workers'])
+        else:
+            for name in index_names:
+                self._build_index(name)
 
-        if index_name in ('marketplace', 'all'):
-            self._build_marketplace_index()
+        if self.use_embedding_cache:
+            self._compact_embedding_store()
+        faiss_service.invalidate_cache()
+        self.stdout.write(self.style.SUCCESS('FAISS indexes rebuilt successfully.'))
 
-        if index_name in ('study_groups', 'all'):
-            self._build_study_groups_index()
+    def _set_options(self, chunk_size, use_embedding_cache, evaluate_recall):
+        self.chunk_size = max(1, chunk_size)
+        self.use_embedding_cache = use_embedding_cache
+        self.evaluate_recall = evaluate_recall
 
-        if index_name in ('roommate', 'all'):
-            self._build_roommate_index()
+    def _is_stale(self, index_name):
+        """Whether the index is missing or holds vectors of another model."""
+        if faiss_service.load_index(index_name) is None:
+            self.stdout.write(f'{INDEX_SOURCES[index_name].label} index is missing.')
+            return True
+        stale = text_store.stale_count(index_name)
+        # Rows indexed before texts were recorded have no IndexedText; with
+        # incremental indexing off, deleted rows stay in the index until a
+        # rebuild but lose theirs (see indexing.forget_changed_text).
+        unrecorded = faiss_service.count_vectors(index_name) - text_store.indexed_count(index_name)
+        if stale or unrecorded:
+            self.stdout.write(
+                f'{INDEX_SOURCES[index_name].label} index has {stale} vectors from another '
+                f'model and {max(unrecorded, 0)} without a recorded text.'
+            )
+            return True
+        self.stdout.write(f'{INDEX_SOURCES[index_name].label} index is up to date; skipping.')
+        return False
 
-        faiss_service.invalidate_cache()
-        self.stdout.write(self.style.SUCCESS('FAISS indexes rebuilt successfully.'))
+    def _compact_embedding_store(self):
+        """Drop cached embeddings of texts that no index holds any more."""
+        live_keys = {embedding_store.text_key(text) for text in text_store.current_texts()}
+        dropped = embedding_store.get_store().compact(live_keys)
+        if dropped:
+            self.stdout.write(f'Dropped {dropped} unused cached embeddings.')
 
-    def _build_housing_index(self):
-        from housing.models import HousingListing
+    def _embed(self, texts):
+        if not self.use_embedding_cache:
+            return emb.embed_texts(texts)
+        return embedding_store.embed_texts(texts)
 
-        listings = HousingListing.objects.filter(is_available=True)
-        if not listings.exists():
-            self.stdout.write('No housing listings found. Skipping.')
+    def _build_index(self, index_name):
+        source = INDEX_SOURCES[index_name]
+        rows = source.rows()
+        total = rows.count()
+        if not total:
+            self.stdout.write(f'No {source.rows_label} found. Skipping.')
             return
 
-        texts = [build_housing_listing_text(l) for l in listings]
-        ids = [l.id for l in listings]
-        embeddings = emb.embed_texts(texts)
-        faiss_service.build_index('housing', embeddings, ids)
-        self.stdout.write(f'Housing index built with {len(ids)} entries.')
+        shards = None
+        if source.shard_for is not None:
+            shards = {
+                shard: faiss_service.IndexBuilder(faiss_service.shard_index_name(index_name, shard), n)
+                for shard, n in self._shard_totals(rows).items()
+            }
+        n = self._build(
+            index_name, rows.iterator(chunk_size=self.chunk_size), total,
+            source.text_for, source.id_for, source.attributes_for, shards, source.shard_for,
+        )
+        self.stdout.write(f'{source.label} index built with {n} entries.')
+        if shards is not None:
+            self.stdout.write(f'  Built {len(shards)} {index_name} shards.')
 
-    def _build_marketplace_index(self):
-        from marketplace.models import MarketplaceItem
+    def _shard_totals(self, rows):
+        """{shard key: row count}, for the HOUSING_SHARD_FIELDS of ``rows``."""
+        totals = defaultdict(int)
+        counts = rows.values_list(*HOUSING_SHARD_FIELDS).annotate(n=Count('pk')).order_by()
+        for city, state, n in counts:
+            shard = housing_shard(city, state)
+            if shard:
+                totals[shard] += n
+        return dict(totals)
 
-        items = MarketplaceItem.objects.filter(is_sold=False)
-        if not items.exists():
-            self.stdout.write('No marketplace items found. Skipping.')
-            return
+    def _build(
+        self, index_name, rows, total, text_for, id_for, attributes_for=None,
+        shards=None, shard_for=None,
+    ):
+        """
+        Stream ``rows`` into a new index chunk by chunk, so memory stays flat
+        however large the table is. With ``shards`` ({shard key: IndexBuilder}),
+        each row also goes into the shard ``shard_for`` returns for it; shards
+        left without rows are dropped.
 
-        texts = [build_marketplace_item_text(i) for i in items]
-        ids = [i.id for i in items]
-        embeddings = emb.embed_texts(texts)
-        faiss_service.build_index('marketplace', embeddings, ids)
-        self.stdout.write(f'Marketplace index built with {len(ids)} entries.')
+        Returns:
+            number of rows indexed
+        """
+        builder = faiss_service.IndexBuilder(index_name, total)
+        neighbors = faiss_service.ExactNeighbors() if self.evaluate_recall else None
+        store = embedding_store.get_store()
+        hits, misses = store.hits, store.misses
+        indexed_ids, indexed_texts, reused = [], [], 0
 
-    def _build_study_groups_index(self):
-        from study_groups.models import StudyGroup
+        for chunk in chunked(rows, self.chunk_size):
+            texts = [text_for(row) for row in chunk]
+            ids = [id_for(row) for row in chunk]
+            embeddings, n_reused = self._embed_changed(index_name, ids, texts)
+            reused += n_reused
+            indexed_ids.extend(ids)
+            indexed_texts.extend(texts)
+            attributes = collect_attributes(chunk, attributes_for) if attributes_for else None
+            builder.add(embeddings, ids, attributes)
+            if shards:
+                self._add_to_shards(shards, [shard_for(row) for row in chunk], embeddings, ids, attributes)
+            if neighbors is not None:
+                neighbors.add(embeddings, ids)
+            if total > self.chunk_size:
+                self.stdout.write(f'  {builder.ntotal}/{total} rows embedded...')
 
-        groups = StudyGroup.objects.filter(is_active=True)
-        if not groups.exists():
-            self.stdout.write('No study groups found. Skipping.')
-            return
+        self.stdout.write(f'  Reused {reused} unchanged vectors from the live index.')
+        if self.use_embedding_cache:
+            self.stdout.write(
+                f'  Reused {store.hits - hits} cached embeddings, encoded {store.misses - misses}.'
+            )
+        changed_texts = 0
+
+        def record_texts(carried_ids):
+            # Recorded only once the vectors are live. Rows updated during the
+            # rebuild were recorded by their incremental update, with the
+            # vector carried over in place of the one built here.
+            nonlocal changed_texts
+            for start in range(0, len(indexed_ids), self.chunk_size):
+                rows = [
+                    (item_id, text) for item_id, text in zip(
+                        indexed_ids[start:start + self.chunk_size],
+                        indexed_texts[start:start + self.chunk_size],
+                    )
+                    if item_id not in carried_ids
+                ]
+                if rows:
+                    # Only rows whose text or model changed are written.
+                    changed_texts += text_store.record(index_name, *zip(*rows))
+            text_store.forget_except(index_name, [*indexed_ids, *carried_ids])
 
-        texts = [build_study_group_text(g) for g in groups]
-        ids = [g.id for g in groups]
-        embeddings = emb.embed_texts(texts)
-        faiss_service.build_index('study_groups', embeddings, ids)
-        self.stdout.write(f'Study groups index built with {len(ids)} entries.')
+        builder.publish(on_publish=record_texts)
+        self.stdout.write(f'  Recorded {changed_texts} new or changed texts.')
+        if shards is not None:
+            for shard_builder in shards.values():
+                shard_builder.publish()
+            for shard in faiss_service.list_shards(index_name):
+                if shard not in shards:
+                    faiss_service.drop_index(faiss_service.shard_index_name(index_name, shard))
+        if neighbors is not None:
+            self._report_recall(neighbors.evaluate(index_name))
+        return builder.ntotal
 
-    def _build_roommate_index(self):
-        from user_profiles.models import UserProfile
+    def _embed_changed(self, index_name, ids, texts):
+        """
+        Embeddings of ``texts``, taking the live index's vector for rows whose
+        recorded text and model are unchanged and embedding only the rest.
 
-        profiles = UserProfile.objects.all()
-        if not profiles.exists():
-            self.stdout.write('No user profiles found. Skipping.')
+        Returns:
+            (embeddings, number of vectors reused)
+        """
+        unchanged = text_store.current_ids(index_name, ids, texts)
+        live = faiss_service.reconstruct(index_name, unchanged) if unchanged else {}
+        if not live:
+            return self._embed(texts), 0
+
+        embed_at = [i for i, item_id in enumerate(ids) if item_id not in live]
+        embeddings = np.empty((len(ids), emb.EMBEDDING_DIM), dtype=np.float32)
+        for i, item_id in enumerate(ids):
+            if item_id in live:
+                embeddings[i] = live[item_id]
+        if embed_at:
+            embeddings[embed_at] = self._embed([texts[i] for i in embed_at])
+        return embeddings, len(live)
+
+    def _add_to_shards(self, shards, keys, embeddings, ids, attributes=None):
+        keys = np.array(keys)
+        ids = np.asarray(ids)
+        for shard in np.unique(keys):
+            if shard not in shards:
+                continue  # blank city, or a city first listed after counting
+            mask = keys == shard
+            shards[shard].add(
+                embeddings[mask], ids[mask],
+                {column: values[mask] for column, values in attributes.items()} if attributes else None,
+            )
+
+    def _report_recall(self, report):
+        if report is None:
             return
+        self.stdout.write(
+            f"  {report['index_type']} over {report['ntotal']} vectors: "
+            f"recall@{report['k']}={report['recall']:.3f}, "
+            f"p50={report['p50_ms']:.2f}ms p99={report['p99_ms']:.2f}ms"
+        )
+
+    def _shards(self, index_names, workers):
+        """(index name, low pk, high pk) ranges of roughly equal size across all indexes."""
+        totals = {name: INDEX_SOURCES[name].rows().count() for name in index_names}
+        # A few shards per worker keeps them all busy when indexes differ in size.
+        shard_rows = max(self.chunk_size, math.ceil(sum(totals.values()) / (workers * 4)))
+
+        shards = []
+        for name, total in totals.items():
+            if not total:
+                continue
+            bounds = INDEX_SOURCES[name].rows().aggregate(low=Min('pk'), high=Max('pk'))
+            n_shards = math.ceil(total / shard_rows)
+            span = bounds['high'] + 1 - bounds['low']
+            edges = sorted({bounds['low'] + span * i // n_shards for i in range(n_shards + 1)})
+            shards.extend((name, low, high) for low, high in zip(edges, edges[1:]))
+        return shards
+
+    def _build_parallel(self, index_names, workers):
+        """
+        Encode shards of every index in parallel into the embedding store,
+        then build the indexes in parallel from it.
+        """
+        shards = self._shards(index_names, workers)
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        # Spawned, not forked: a fork would copy this process's database
+        # connections, loaded model and OpenMP/torch thread pools, none of
+        # which are safe to share with a child.
+        with ProcessPoolExecutor(
+            workers, mp_context=mp.get_context('spawn'),
+            initializer=_init_worker, initargs=(threads,),
+        ) as pool:
+            futures = {
+                pool.submit(_encode_shard, name, low, high, self.chunk_size): name
+                for name, low, high in shards
+            }
+            done = 0
+            for future in as_completed(futures):
+                n_rows, encoded = future.result()
+                done += 1
+                self.stdout.write(
+                    f'  Shard {done}/{len(shards)} ({futures[future]}): '
+                    f'{n_rows} rows, encoded {encoded}.'
+                )
 
-        texts = []
-        ids = []
-        for profile in profiles:
-            roommate_profile = getattr(profile, 'roommateprofile', None)
-            text = build_user_profile_text(profile, roommate_profile)
-            texts.append(text)
-            ids.append(profile.user.id)
-
-        embeddings = emb.embed_texts(texts)
-        faiss_service.build_index('roommate', embeddings, ids)
-        self.stdout.write(f'Roommate index built with {len(ids)} entries.')
+            futures = [
+                pool.submit(_build_index_in_worker, name, self.chunk_size, self.evaluate_recall)
+                for name in index_names
+            ]
+            for future in as_completed(futures):
+                self.stdout.write(future.result(), ending='')
@@ -0,0 +1,40 @@
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_recommendations import cold_start
+
+
+class Command(BaseCommand):
+    help = 'Recompute the cached cold-start rankings (run from cron, every few minutes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--domain',
+            type=str,
+            choices=list(cold_start.SOURCES) + ['all'],
+            default='all',
+            help='Which ranking to refresh (default: all)',
+        )
+
+    def handle(self, *args, **options):
+        if cold_start.CACHE_ALIAS is None:
+            raise CommandError(
+                'Cold-start rankings are not cached (AI_RECOMMENDATIONS_COLD_START_CACHE is None).'
+            )
+        if isinstance(caches[cold_start.CACHE_ALIAS], LocMemCache):
+            self.stderr.write(self.style.WARNING(
+                f'Cache "{cold_start.CACHE_ALIAS}" is process-local; refreshed rankings '
+                'will not be visible to the web workers.'
+            ))
+
+        domains = list(cold_start.SOURCES) if options['domain'] == 'all' else [options['domain']]
+        start = time.perf_counter()
+        rankings = cold_start.refresh(domains)
+        for domain, entry in rankings.items():
+            self.stdout.write(f"  {domain}: {len(entry['ids'])} ranked")
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {", ".join(domains)} cold-start rankings in {time.perf_counter() - start:.1f}s.'
+        ))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexedText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index_name', models.CharField(max_length=64)),
+                ('object_id', models.BigIntegerField()),
+                ('text', models.TextField()),
+                ('text_hash', models.CharField(help_text='SHA-1 of the text', max_length=40)),
+                ('model_version', models.CharField(help_text='Embedding model of the indexed vector', max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['index_name', 'model_version'], name='ai_recommen_index_n_befb3c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('index_name', 'object_id'), name='unique_indexed_text')],
+            },
+        ),
+    ]
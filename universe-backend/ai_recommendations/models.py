@@ -0,0 +1,26 @@
+from django.db import models
+
+
+class IndexedText(models.Model):
+    """
+    The text embedded for one row of a FAISS index, and the model that
+    embedded it. Rows are written alongside the index by rebuilds and
+    incremental updates (see text_store.py).
+    """
+    index_name = models.CharField(max_length=64)
+    object_id = models.BigIntegerField()
+    text = models.TextField()
+    text_hash = models.CharField(max_length=40, help_text='SHA-1 of the text')
+    model_version = models.CharField(max_length=255, help_text='Embedding model of the indexed vector')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['index_name', 'object_id'], name='unique_indexed_text'),
+        ]
+        indexes = [
+            models.Index(fields=['index_name', 'model_version']),
+        ]
+
+    def __str__(self):
+        return f'{self.index_name}:{self.object_id}'
@@ -0,0 +1,86 @@
+"""
+Bounded LRU/TTL cache of per-user query embeddings.
+
+A home page view asks for several recommendation domains for the same user;
+caching the embedded profile text means only the first request pays for a
+model forward pass.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+MAX_ENTRIES = getattr(settings, 'AI_RECOMMENDATIONS_QUERY_CACHE_SIZE', 1024)
+TTL_SECONDS = getattr(settings, 'AI_RECOMMENDATIONS_QUERY_CACHE_TTL', 300)
+
+# {user_id: (text_hash, expires_at, embedding)}, least recently used first
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _lookup(user_id, text_hash, now):
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry is not None:
+            cached_hash, expires_at, embedding = entry
+            if cached_hash == text_hash and expires_at > now:
+                _cache.move_to_end(user_id)
+                return embedding
+            del _cache[user_id]
+    return None
+
+
+def _store(user_id, text_hash, now, embedding):
+    # Shared between requests, so guard against in-place modification.
+    embedding.setflags(write=False)
+
+    with _lock:
+        _cache[user_id] = (text_hash, now + TTL_SECONDS, embedding)
+        _cache.move_to_end(user_id)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return embedding
+
+
+def get_query_embedding(user_id, text):
+    """
+    Return the embedding of ``text`` for ``user_id``, encoding it only if the
+    cached entry is missing, expired, or was built from different text.
+    """
+    from . import embedding_service
+
+    text_hash = _text_hash(text)
+    now = time.monotonic()
+    embedding = _lookup(user_id, text_hash, now)
+    if embedding is None:
+        embedding = _store(user_id, text_hash, now, embedding_service.embed_text(text))
+    return embedding
+
+
+async def aget_query_embedding(user_id, text):
+    """get_query_embedding for async callers; encoding does not block the event loop."""
+    from . import embedding_service
+
+    text_hash = _text_hash(text)
+    now = time.monotonic()
+    embedding = _lookup(user_id, text_hash, now)
+    if embedding is None:
+        embedding = _store(user_id, text_hash, now, await embedding_service.aembed_text(text))
+    return embedding
+
+
+def invalidate_user(user_id):
+    """Drop the cached query embedding for a user."""
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def clear():
+    with _lock:
+        _cache.clear()
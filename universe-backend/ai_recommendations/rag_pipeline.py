@@ -1,7 +1,20 @@
-from langchain_core.prompts import PromptTemplate
+import asyncio
+import logging
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-from . import embeddings as emb
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import cold_start
 from . import faiss_service
+from . import index_paths
+from . import query_cache
+from . import ranking
+from . import result_cache
+from . import timing
+from .indexing import HOUSING_SHARDS, housing_shard
 from .text_builders import (
     build_user_profile_text,
     build_housing_listing_text,
@@ -9,45 +22,61 @@ from .text_builders import (
     build_study_group_text,
 )
 
-# --- Prompt Templates ---
+logger = logging.getLogger(__name__)
 
-HOUSING_RECOMMENDATION_PROMPT = PromptTemplate(
-    input_variables=["user_profile", "preferences"],
-    template=(
-        "Based on the following student profile:\n{user_profile}\n\n"
-        "And their housing preferences:\n{preferences}\n\n"
-        "Find the most suitable housing listings that match their needs, "
-        "considering budget, location, amenities, and lifestyle compatibility."
+# --- Prompt Templates ---
+# Built on first access (see __getattr__) so that importing this module does
+# not import langchain.
+
+_PROMPT_TEMPLATES = {
+    'HOUSING_RECOMMENDATION_PROMPT': (
+        ["user_profile", "preferences"],
+        (
+            "Based on the following student profile:\n{user_profile}\n\n"
+            "And their housing preferences:\n{preferences}\n\n"
+            "Find the most suitable housing listings that match their needs, "
+            "considering budget, location, amenities, and lifestyle compatibility."
+        ),
     ),
-)
-
-ROOMMATE_RECOMMENDATION_PROMPT = PromptTemplate(
-    input_variables=["user_profile"],
-    template=(
-        "Based on the following student profile:\n{user_profile}\n\n"
-        "Find the most compatible roommate candidates based on lifestyle preferences, "
-        "study habits, sleep schedules, cleanliness, and budget compatibility."
+    'ROOMMATE_RECOMMENDATION_PROMPT': (
+        ["user_profile"],
+        (
+            "Based on the following student profile:\n{user_profile}\n\n"
+            "Find the most compatible roommate candidates based on lifestyle preferences, "
+            "study habits, sleep schedules, cleanliness, and budget compatibility."
+        ),
     ),
-)
-
-MARKETPLACE_RECOMMENDATION_PROMPT = PromptTemplate(
-    input_variables=["user_profile", "interests"],
-    template=(
-        "Based on the following student profile:\n{user_profile}\n\n"
-        "And their interests:\n{interests}\n\n"
-        "Find marketplace items that this student would likely be interested in purchasing."
+    'MARKETPLACE_RECOMMENDATION_PROMPT': (
+        ["user_profile", "interests"],
+        (
+            "Based on the following student profile:\n{user_profile}\n\n"
+            "And their interests:\n{interests}\n\n"
+            "Find marketplace items that this student would likely be interested in purchasing."
+        ),
     ),
-)
-
-STUDY_GROUP_RECOMMENDATION_PROMPT = PromptTemplate(
-    input_variables=["user_profile", "major"],
-    template=(
-        "Based on the following student profile:\n{user_profile}\n\n"
-        "Studying: {major}\n\n"
-        "Find study groups that would be most beneficial for this student "
-        "based on their major, interests, and study habits."
+    'STUDY_GROUP_RECOMMENDATION_PROMPT': (
+        ["user_profile", "major"],
+        (
+            "Based on the following student profile:\n{user_profile}\n\n"
+            "Studying: {major}\n\n"
+            "Find study groups that would be most beneficial for this student "
+            "based on their major, interests, and study habits."
+        ),
     ),
-)
+}
+
+_prompts = {}
+
+
+def __getattr__(name):
+    if name in _PROMPT_TEMPLATES:
+        if name not in _prompts:
+            from langchain_core.prompts import PromptTemplate
+
+            input_variables, template = _PROMPT_TEMPLATES[name]
+            _prompts[name] = PromptTemplate(input_variables=input_variables, template=template)
+        return _prompts[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 # --- Hybrid Filters ---
@@ -81,6 +110,32 @@ def hybrid_filter_study_groups(groups):
     return [g for g in groups if g.is_active and not g.is_full]
 
 
+# Vectorized equivalents of the filters above, evaluated against the attribute
+# columns stored next to each FAISS index (see indexing.py). They return a
+# boolean mask that faiss_service.search_similar applies inside the search.
+
+def housing_attribute_filter(roommate_profile=None):
+    budget = None
+    if roommate_profile and roommate_profile.max_rent_budget:
+        budget = float(roommate_profile.max_rent_budget)
+
+    def where(attrs):
+        mask = attrs['is_available']
+        if budget:
+            mask = mask & (attrs['rent_price'] <= budget * 1.2)
+        return mask
+
+    return where
+
+
+def marketplace_attribute_filter(attrs):
+    return ~attrs['is_sold']
+
+
+def study_group_attribute_filter(attrs):
+    return attrs['is_active'] & ~attrs['is_full']
+
+
 # --- Cold Start Detection ---
 
 def is_cold_start_user(profile, roommate_profile=None):
@@ -100,41 +155,98 @@ def is_cold_start_user(profile, roommate_profile=None):
     return signals < 2
 
 
-def get_cold_start_recommendations(model_class, limit=10):
-    """Fallback: return most recent items for cold-start users."""
-    return list(model_class.objects.all().order_by('-pk')[:limit])
-
-
-# --- Recommendation Pipelines ---
+# --- Query Embedding ---
 
-def get_housing_recommendations(user, top_k=10):
-    """Full RAG pipeline for housing recommendations."""
-    from user_profiles.models import UserProfile, RoommateProfile
-    from housing.models import HousingListing
+def load_user_profile(user):
+    """Return (profile, roommate_profile), or (None, None) if the user has no profile."""
+    from user_profiles.models import UserProfile
 
     try:
-        profile = UserProfile.objects.get(user=user)
+        profile = UserProfile.objects.select_related('roommate_profile').get(user=user)
     except UserProfile.DoesNotExist:
-        return get_cold_start_recommendations(HousingListing, top_k)
+        return None, None
 
-    roommate_profile = getattr(profile, 'roommateprofile', None)
+    return profile, getattr(profile, 'roommate_profile', None)
 
-    if is_cold_start_user(profile, roommate_profile):
-        listings = get_cold_start_recommendations(HousingListing, top_k)
-        return [(l.id, 0.0) for l in listings]
 
-    # Build query text
-    query_text = build_user_profile_text(profile, roommate_profile)
+def embed_user_query(user, profile, roommate_profile=None):
+    """Build the user's query text and embed it, reusing the cached vector if any."""
+    with timing.stage('text'):
+        query_text = build_user_profile_text(profile, roommate_profile)
+    with timing.stage('embed'):
+        return query_cache.get_query_embedding(user.id, query_text)
 
-    # Semantic search
-    query_embedding = emb.embed_text(query_text)
-    results = faiss_service.search_similar('housing', query_embedding, top_k=top_k * 3)
 
-    if not results:
-        listings = get_cold_start_recommendations(HousingListing, top_k)
-        return [(l.id, 0.0) for l in listings]
+# --- Pipeline Stages ---
+# Each domain is split into a FAISS search (no ORM access, safe to run in a
+# worker thread), a hybrid filter/re-rank over the search results, and a
+# cold-start fallback. When an index carries attribute columns the hybrid
+# filter runs inside the search and re-ranking (ranking.py) needs no ORM
+# query; indexes built without them fall back to over-fetching and filtering
+# model rows, ranked by similarity alone.
+
+def _filtered_search(index_name, query_embedding, top_k, where):
+    """Search with an attribute filter, over-fetching only if FAISS cannot apply it."""
+    search_k = top_k if faiss_service.has_attributes(index_name) else top_k * 3
+    return faiss_service.search_similar(index_name, query_embedding, top_k=search_k, where=where)
+
+
+def _housing_cold_start(user, profile, top_k):
+    return cold_start.recommend('housing', user, profile, top_k)
+
+
+# Shards searched for each market, keyed by the shard of the user's city.
+# Cities without an entry search only their own shard.
+HOUSING_MARKETS = getattr(settings, 'AI_RECOMMENDATIONS_HOUSING_MARKETS', {})
+
+
+# {shard key: searches that found none of the market's shards built}
+shard_misses = Counter()
+
+
+def housing_shards(profile):
+    """
+    Housing index shards to search for a user, from the city of their campus.
+    Markets with no shard built (no listings in the city, or a city spelled
+    differently from the listings') fall back to the global index; each is
+    logged the first time and counted in ``shard_misses``.
+
+    Returns:
+        list of shard keys, or None to search the global housing index
+    """
+    if not HOUSING_SHARDS or profile is None:
+        return None
+    shard = housing_shard(profile.city, profile.state)
+    if not shard:
+        return None
+    shards = list(HOUSING_MARKETS.get(shard, [shard]))
+    if not any(
+        index_paths.current_generation(faiss_service.shard_index_name('housing', key))
+        for key in shards
+    ):
+        if not shard_misses[shard]:
+            logger.warning('No housing shard built for %s; searching the global index', shard)
+        shard_misses[shard] += 1
+        return None
+    return shards
+
+
+def _search_housing(user, profile, roommate_profile, query_embedding, top_k):
+    where = housing_attribute_filter(roommate_profile)
+    shards = housing_shards(profile)
+    if shards is None:
+        return _filtered_search('housing', query_embedding, top_k, where)
+    search_k = top_k if faiss_service.has_attributes('housing') else top_k * 3
+    return faiss_service.search_shards('housing', shards, query_embedding, search_k, where=where)
+
+
+def _rank_housing(results, profile, roommate_profile, top_k):
+    attrs = faiss_service.load_attributes('housing')
+    if attrs is not None:
+        return ranking.rerank('housing', results, attrs, top_k, roommate_profile)
+
+    from housing.models import HousingListing
 
-    # Hybrid filter
     result_ids = [r[0] for r in results]
     score_map = {r[0]: r[1] for r in results}
     listings = HousingListing.objects.filter(id__in=result_ids)
@@ -145,68 +257,36 @@ def get_housing_recommendations(user, top_k=10):
     return [(l.id, score_map.get(l.id, 0.0)) for l in ranked[:top_k]]
 
 
-def get_roommate_recommendations(user, top_k=10):
-    """Full RAG pipeline for roommate recommendations."""
-    from user_profiles.models import UserProfile, RoommateProfile
+def _roommate_cold_start(user, profile, top_k):
+    return cold_start.recommend('roommates', user, profile, top_k)
 
-    try:
-        profile = UserProfile.objects.get(user=user)
-    except UserProfile.DoesNotExist:
-        return []
 
-    roommate_profile = getattr(profile, 'roommateprofile', None)
-
-    if is_cold_start_user(profile, roommate_profile):
-        profiles = UserProfile.objects.exclude(user=user).order_by('-date_joined')[:top_k]
-        return [(p.user.id, 0.0) for p in profiles]
-
-    # Build query text
-    query_text = build_user_profile_text(profile, roommate_profile)
-
-    # Semantic search
-    query_embedding = emb.embed_text(query_text)
-    results = faiss_service.search_similar(
+def _search_roommates(user, profile, roommate_profile, query_embedding, top_k):
+    return faiss_service.search_similar(
         'roommate', query_embedding, top_k=top_k, exclude_ids={user.id}
     )
 
-    if not results:
-        profiles = UserProfile.objects.exclude(user=user).order_by('-date_joined')[:top_k]
-        return [(p.user.id, 0.0) for p in profiles]
 
-    return results[:top_k]
+def _rank_roommates(results, profile, roommate_profile, top_k):
+    return ranking.rerank(
+        'roommates', results, faiss_service.load_attributes('roommate'), top_k, roommate_profile
+    )
 
 
-def get_marketplace_recommendations(user, top_k=10):
-    """Full RAG pipeline for marketplace recommendations."""
-    from user_profiles.models import UserProfile
-    from marketplace.models import MarketplaceItem
+def _marketplace_cold_start(user, profile, top_k):
+    return cold_start.recommend('marketplace', user, profile, top_k)
 
-    try:
-        profile = UserProfile.objects.get(user=user)
-    except UserProfile.DoesNotExist:
-        items = get_cold_start_recommendations(MarketplaceItem, top_k)
-        return [(i.id, 0.0) for i in items]
 
-    roommate_profile = getattr(profile, 'roommateprofile', None)
+def _search_marketplace(user, profile, roommate_profile, query_embedding, top_k):
+    return _filtered_search('marketplace', query_embedding, top_k, marketplace_attribute_filter)
 
-    if is_cold_start_user(profile, roommate_profile):
-        items = get_cold_start_recommendations(MarketplaceItem, top_k)
-        return [(i.id, 0.0) for i in items]
 
-    # Build query text
-    query_text = build_user_profile_text(profile, roommate_profile)
-
-    # Semantic search
-    query_embedding = emb.embed_text(query_text)
-    results = faiss_service.search_similar(
-        'marketplace', query_embedding, top_k=top_k * 3, exclude_ids=set()
-    )
+def _rank_marketplace(results, profile, roommate_profile, top_k):
+    if faiss_service.has_attributes('marketplace'):
+        return results[:top_k]
 
-    if not results:
-        items = get_cold_start_recommendations(MarketplaceItem, top_k)
-        return [(i.id, 0.0) for i in items]
+    from marketplace.models import MarketplaceItem
 
-    # Hybrid filter
     result_ids = [r[0] for r in results]
     score_map = {r[0]: r[1] for r in results}
     items = MarketplaceItem.objects.filter(id__in=result_ids)
@@ -216,41 +296,251 @@ def get_marketplace_recommendations(user, top_k=10):
     return [(i.id, score_map.get(i.id, 0.0)) for i in ranked[:top_k]]
 
 
-def get_study_group_recommendations(user, top_k=10):
-    """Full RAG pipeline for study group recommendations."""
-    from user_profiles.models import UserProfile
-    from study_groups.models import StudyGroup
-
-    try:
-        profile = UserProfile.objects.get(user=user)
-    except UserProfile.DoesNotExist:
-        groups = get_cold_start_recommendations(StudyGroup, top_k)
-        return [(g.id, 0.0) for g in groups]
+def _study_group_cold_start(user, profile, top_k):
+    return cold_start.recommend('study_groups', user, profile, top_k)
 
-    roommate_profile = getattr(profile, 'roommateprofile', None)
 
-    if is_cold_start_user(profile, roommate_profile):
-        groups = get_cold_start_recommendations(StudyGroup, top_k)
-        return [(g.id, 0.0) for g in groups]
+def _search_study_groups(user, profile, roommate_profile, query_embedding, top_k):
+    return _filtered_search('study_groups', query_embedding, top_k, study_group_attribute_filter)
 
-    # Build query text
-    query_text = build_user_profile_text(profile, roommate_profile)
 
-    # Semantic search
-    query_embedding = emb.embed_text(query_text)
-    results = faiss_service.search_similar(
-        'study_groups', query_embedding, top_k=top_k * 3, exclude_ids=set()
-    )
+def _rank_study_groups(results, profile, roommate_profile, top_k):
+    if faiss_service.has_attributes('study_groups'):
+        return results[:top_k]
 
-    if not results:
-        groups = get_cold_start_recommendations(StudyGroup, top_k)
-        return [(g.id, 0.0) for g in groups]
+    from study_groups.models import StudyGroup
 
-    # Hybrid filter
     result_ids = [r[0] for r in results]
     score_map = {r[0]: r[1] for r in results}
-    groups = StudyGroup.objects.filter(id__in=result_ids)
+    groups = StudyGroup.objects.filter(id__in=result_ids).prefetch_related('memberships')
     filtered = hybrid_filter_study_groups(groups)
 
     ranked = sorted(filtered, key=lambda g: score_map.get(g.id, 0), reverse=True)
     return [(g.id, score_map.get(g.id, 0.0)) for g in ranked[:top_k]]
+
+
+# domain -> (search, rank, cold_start)
+PIPELINES = {
+    'housing': (_search_housing, _rank_housing, _housing_cold_start),
+    'roommates': (_search_roommates, _rank_roommates, _roommate_cold_start),
+    'marketplace': (_search_marketplace, _rank_marketplace, _marketplace_cold_start),
+    'study_groups': (_search_study_groups, _rank_study_groups, _study_group_cold_start),
+}
+
+# Shared pool for running the per-domain FAISS searches concurrently.
+_search_executor = ThreadPoolExecutor(max_workers=len(PIPELINES), thread_name_prefix='faiss-search')
+
+
+# Index searched by each domain, whose generation invalidates cached results.
+DOMAIN_INDEXES = {
+    'housing': 'housing',
+    'roommates': 'roommate',
+    'marketplace': 'marketplace',
+    'study_groups': 'study_groups',
+}
+
+
+def candidate_k(domain, top_k):
+    """Results to search for: more than top_k if the domain's index can be re-ranked."""
+    if faiss_service.has_attributes(DOMAIN_INDEXES[domain]):
+        return ranking.candidate_k(domain, top_k)
+    return top_k
+
+
+def _search(domain, user, profile, roommate_profile, query_embedding, top_k):
+    search, _, _ = PIPELINES[domain]
+    with timing.stage('search', domain):
+        return search(user, profile, roommate_profile, query_embedding, candidate_k(domain, top_k))
+
+
+def _cold_start(domain, user, profile, top_k):
+    _, _, cold_start = PIPELINES[domain]
+    with timing.stage('cold_start', domain):
+        return cold_start(user, profile, top_k)
+
+
+def finish_domain(domain, user, profile, roommate_profile, results, top_k):
+    """
+    Rank a domain's search results for the user, or fall back to its
+    cold-start results if the search found nothing.
+
+    Returns:
+        [(id, score), ...], at most top_k; re-ranked results are
+        (id, score, similarity) triples (see ranking.rerank)
+    """
+    _, rank, _ = PIPELINES[domain]
+    if not results:
+        return _cold_start(domain, user, profile, top_k)
+    with timing.stage('rank', domain):
+        return rank(results, profile, roommate_profile, top_k)
+
+
+def _cold_start_all(user, profile, top_k, domains):
+    return {domain: _cold_start(domain, user, profile, top_k) for domain in domains}
+
+
+def _finish_all(user, profile, roommate_profile, results, top_k):
+    return {
+        domain: finish_domain(domain, user, profile, roommate_profile, domain_results, top_k)
+        for domain, domain_results in results.items()
+    }
+
+
+def index_epochs(domains):
+    """Current FAISS index epoch per domain, for result_cache."""
+    return {domain: faiss_service.current_epoch(DOMAIN_INDEXES[domain]) for domain in domains}
+
+
+def compute_recommendations(user, top_k, domains):
+    """
+    Run the pipelines for ``domains``, bypassing the result cache.
+
+    The profile is loaded and embedded once; with several domains the FAISS
+    indexes are searched concurrently and hybrid filtering then runs on the
+    calling thread.
+
+    Returns:
+        {domain: [(id, score), ...]}
+    """
+    with timing.stage('profile'):
+        profile, roommate_profile = load_user_profile(user)
+    if profile is None or is_cold_start_user(profile, roommate_profile):
+        timing.set_path('cold')
+        return _cold_start_all(user, profile, top_k, domains)
+
+    timing.set_path('warm')
+    query_embedding = embed_user_query(user, profile, roommate_profile)
+    if len(domains) == 1:
+        results = {
+            domains[0]: _search(domains[0], user, profile, roommate_profile, query_embedding, top_k)
+        }
+    else:
+        futures = {
+            domain: _search_executor.submit(
+                timing.in_context(_search),
+                domain, user, profile, roommate_profile, query_embedding, top_k,
+            )
+            for domain in domains
+        }
+        results = {domain: future.result() for domain, future in futures.items()}
+    return _finish_all(user, profile, roommate_profile, results, top_k)
+
+
+def _recommend(domains, user, top_k):
+    """Results for ``domains`` from the result cache, computing what is missing."""
+    return result_cache.get_or_compute(
+        domains, user.id, top_k, index_epochs(domains),
+        lambda missing, k: compute_recommendations(user, k, missing),
+    )
+
+
+# --- Recommendation Pipelines ---
+
+def get_housing_recommendations(user, top_k=10):
+    """Full RAG pipeline for housing recommendations."""
+    return _recommend(['housing'], user, top_k)['housing']
+
+
+def get_roommate_recommendations(user, top_k=10):
+    """Full RAG pipeline for roommate recommendations."""
+    return _recommend(['roommates'], user, top_k)['roommates']
+
+
+def get_marketplace_recommendations(user, top_k=10):
+    """Full RAG pipeline for marketplace recommendations."""
+    return _recommend(['marketplace'], user, top_k)['marketplace']
+
+
+def get_study_group_recommendations(user, top_k=10):
+    """Full RAG pipeline for study group recommendations."""
+    return _recommend(['study_groups'], user, top_k)['study_groups']
+
+
+def get_all_recommendations(user, top_k=10):
+    """
+    Run every recommendation pipeline for a user in one pass.
+
+    Returns:
+        {domain: [(id, score), ...]} for each domain in PIPELINES
+    """
+    return _recommend(list(PIPELINES), user, top_k)
+
+
+# --- Async Pipelines ---
+# Used by the async views. ORM stages run through sync_to_async, the query is
+# embedded by the batching embedding service and FAISS searches run on
+# _search_executor, so the event loop is never blocked. At most
+# MAX_INFLIGHT_INFERENCE requests embed and search at once; the rest wait
+# without holding a thread.
+
+MAX_INFLIGHT_INFERENCE = getattr(settings, 'AI_RECOMMENDATIONS_MAX_INFLIGHT_INFERENCE', 8)
+
+# asyncio primitives belong to one event loop: {loop: Semaphore}
+_inference_slots = weakref.WeakKeyDictionary()
+
+
+def _inference_slot():
+    loop = asyncio.get_running_loop()
+    if loop not in _inference_slots:
+        _inference_slots[loop] = asyncio.Semaphore(MAX_INFLIGHT_INFERENCE)
+    return _inference_slots[loop]
+
+
+async def _asearch(domain, user, profile, roommate_profile, query_embedding, top_k):
+    # run_in_executor does not carry over contextvars, which timing needs.
+    return await asyncio.get_running_loop().run_in_executor(
+        _search_executor, timing.in_context(_search),
+        domain, user, profile, roommate_profile, query_embedding, top_k,
+    )
+
+
+async def aembed_user_query(user, profile, roommate_profile=None):
+    with timing.stage('text'):
+        query_text = build_user_profile_text(profile, roommate_profile)
+    with timing.stage('embed'):
+        return await query_cache.aget_query_embedding(user.id, query_text)
+
+
+async def acompute_recommendations(user, top_k, domains):
+    """Async version of compute_recommendations."""
+    with timing.stage('profile'):
+        profile, roommate_profile = await sync_to_async(load_user_profile)(user)
+    if profile is None or is_cold_start_user(profile, roommate_profile):
+        timing.set_path('cold')
+        return await sync_to_async(_cold_start_all)(user, profile, top_k, domains)
+
+    timing.set_path('warm')
+    async with _inference_slot():
+        query_embedding = await aembed_user_query(user, profile, roommate_profile)
+        results = await asyncio.gather(*(
+            _asearch(domain, user, profile, roommate_profile, query_embedding, top_k)
+            for domain in domains
+        ))
+    return await sync_to_async(_finish_all)(
+        user, profile, roommate_profile, dict(zip(domains, results)), top_k
+    )
+
+
+async def _arecommend(domains, user, top_k):
+    epochs = index_epochs(domains)
+    hits, stale, missing = await sync_to_async(result_cache.lookup)(domains, user.id, top_k, epochs)
+    if stale:
+        result_cache.refresh_in_background(
+            stale, user.id, epochs, lambda domains, k: compute_recommendations(user, k, domains),
+        )
+    if missing:
+        cached_top_k = max(top_k, result_cache.CACHED_TOP_K)
+        computed = await acompute_recommendations(user, cached_top_k, missing)
+        await sync_to_async(result_cache.store)(computed, user.id, cached_top_k, epochs)
+        hits.update((domain, results[:top_k]) for domain, results in computed.items())
+    return {domain: hits[domain] for domain in domains}
+
+
+async def aget_recommendations(domain, user, top_k=10):
+    """Async version of the get_*_recommendations pipelines for ``domain``."""
+    return (await _arecommend([domain], user, top_k))[domain]
+
+
+async def aget_all_recommendations(user, top_k=10):
+    """Async version of get_all_recommendations; the four searches run concurrently."""
+    return await _arecommend(list(PIPELINES), user, top_k)
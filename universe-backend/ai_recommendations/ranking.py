@@ -0,0 +1,169 @@
+"""
+Hybrid re-ranking of FAISS candidates.
+
+When a domain weights anything besides similarity, its search fetches
+CANDIDATES results and ``rerank`` scores them in one NumPy pass over the
+attribute columns stored next to the index (see indexing.py):
+
+    score = sum(weight * feature) over the domain's RANKING_WEIGHTS
+
+Every feature is in [0, 1]:
+
+- similarity: the FAISS inner product (cosine, as embeddings are normalized)
+- budget: 1 at or under the user's max_rent_budget, falling to 0 at the
+  120% that housing_attribute_filter allows; 1 if the user has no budget
+- distance: exp(-distance_to_campus / DISTANCE_SCALE_MILES), 0 if unknown
+- recency: halves every RECENCY_HALF_LIFE_DAYS since the listing was posted
+  or the profile joined
+- compatibility: roommate_matching.utils.calculate_compatibility / 100
+
+Candidates missing from the attribute array, or columns missing from an index
+built before they existed, contribute 0 for that feature.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .indexing import ROOMMATE_PREFERENCE_FIELDS, roommate_choice_code
+
+DEFAULT_WEIGHTS = {
+    'housing': {'similarity': 1.0, 'budget': 0.1, 'distance': 0.1, 'recency': 0.05},
+    'roommates': {'similarity': 1.0, 'compatibility': 0.2, 'recency': 0.0},
+}
+
+# {domain: {feature: weight}}, overriding DEFAULT_WEIGHTS per feature.
+RANKING_WEIGHTS = {
+    domain: {**weights, **getattr(settings, 'AI_RECOMMENDATIONS_RANKING_WEIGHTS', {}).get(domain, {})}
+    for domain, weights in DEFAULT_WEIGHTS.items()
+}
+CANDIDATES = getattr(settings, 'AI_RECOMMENDATIONS_RANKING_CANDIDATES', 100)
+DISTANCE_SCALE_MILES = getattr(settings, 'AI_RECOMMENDATIONS_RANKING_DISTANCE_SCALE_MILES', 2.0)
+RECENCY_HALF_LIFE_DAYS = getattr(settings, 'AI_RECOMMENDATIONS_RANKING_RECENCY_HALF_LIFE_DAYS', 30)
+
+# Weights of calculate_compatibility; preferences count only when neither
+# side is 'no_preference', the budget only when both are set.
+COMPATIBILITY_PREFERENCE_WEIGHTS = dict(zip(ROOMMATE_PREFERENCE_FIELDS, (15, 10, 20, 15, 10)))
+COMPATIBILITY_CLEANLINESS_WEIGHT = 20
+COMPATIBILITY_BUDGET_WEIGHT = 10
+
+
+def is_reranked(domain):
+    """Whether ``domain`` weights any feature besides similarity."""
+    weights = RANKING_WEIGHTS.get(domain, {})
+    return any(weight for feature, weight in weights.items() if feature != 'similarity')
+
+
+def candidate_k(domain, top_k):
+    """How many search results to fetch for re-ranking down to ``top_k``."""
+    return max(top_k, CANDIDATES) if is_reranked(domain) else top_k
+
+
+def _graded(differences, steps, credits=(1.0, 0.7, 0.4)):
+    """calculate_compatibility's stepwise credit: credits[i] up to steps[i], else 0."""
+    return np.select([differences <= step for step in steps], credits, 0.0)
+
+
+def budget_fit(rows, roommate_profile):
+    if not roommate_profile or not roommate_profile.max_rent_budget:
+        return np.ones(len(rows))
+    budget = float(roommate_profile.max_rent_budget)
+    over = (rows['rent_price'] - budget) / (budget * 0.2)
+    return np.clip(1.0 - over, 0.0, 1.0)
+
+
+def proximity(rows):
+    return np.nan_to_num(np.exp(-rows['distance_to_campus'] / DISTANCE_SCALE_MILES))
+
+
+def recency(timestamps, now=None):
+    age_days = np.maximum((now or time.time()) - timestamps, 0.0) / 86400
+    return np.nan_to_num(0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS))
+
+
+def compatibility(rows, roommate_profile):
+    """
+    calculate_compatibility(roommate_profile, candidate) / 100 for every row,
+    0.5 for candidates without roommate preferences. Unlike the original, a
+    budget difference of exactly 30% earns its partial credit (there the
+    Decimal ratio compares above the float 0.3).
+    """
+    if roommate_profile is None:
+        return np.full(len(rows), 0.5)
+
+    score = np.zeros(len(rows))
+    total = np.zeros(len(rows))
+    for field, weight in COMPATIBILITY_PREFERENCE_WEIGHTS.items():
+        mine = roommate_choice_code(getattr(roommate_profile, field))
+        if mine == 0:
+            continue
+        theirs = rows[field]
+        counted = theirs != 0
+        total += weight * counted
+        score += weight * (counted & (theirs == mine))
+
+    total += COMPATIBILITY_CLEANLINESS_WEIGHT
+    cleanliness_diff = np.abs(rows['cleanliness_level'] - roommate_profile.cleanliness_level)
+    score += COMPATIBILITY_CLEANLINESS_WEIGHT * _graded(cleanliness_diff, (0, 1, 2))
+
+    if roommate_profile.max_rent_budget:
+        mine = float(roommate_profile.max_rent_budget)
+        theirs = rows['max_rent_budget']
+        counted = theirs > 0
+        budget_diff = np.abs(theirs - mine) / np.maximum(theirs, mine)
+        total += COMPATIBILITY_BUDGET_WEIGHT * counted
+        score += COMPATIBILITY_BUDGET_WEIGHT * counted * _graded(budget_diff, (0.1, 0.2, 0.3))
+
+    return np.where(rows['has_preferences'], score / total, 0.5)
+
+
+def _features(domain, rows, roommate_profile):
+    """{feature: array over rows}, for the features whose columns ``rows`` has."""
+    columns = set(rows.dtype.names)
+    features = {}
+    if domain == 'housing':
+        if 'rent_price' in columns:
+            features['budget'] = budget_fit(rows, roommate_profile)
+        if 'distance_to_campus' in columns:
+            features['distance'] = proximity(rows)
+        if 'posted_at' in columns:
+            features['recency'] = recency(rows['posted_at'])
+    elif domain == 'roommates':
+        if 'has_preferences' in columns:
+            features['compatibility'] = compatibility(rows, roommate_profile)
+        if 'joined_at' in columns:
+            features['recency'] = recency(rows['joined_at'])
+    return features
+
+
+def rerank(domain, results, attrs, top_k, roommate_profile=None):
+    """
+    Re-rank search results by the domain's weighted features.
+
+    Args:
+        results: [(id, similarity), ...] from the FAISS search
+        attrs: the index's attribute array (faiss_service.load_attributes)
+        roommate_profile: the user's RoommateProfile, or None
+
+    Returns:
+        The top_k [(id, blended score, similarity), ...], best first;
+        ``results`` unchanged if the domain is not re-ranked
+    """
+    if not results or attrs is None or not len(attrs) or not is_reranked(domain):
+        return results[:top_k]
+
+    ids = np.fromiter((item_id for item_id, _ in results), dtype=np.int64, count=len(results))
+    similarity = np.fromiter((score for _, score in results), dtype=np.float64, count=len(results))
+    positions = np.searchsorted(attrs['ids'], ids).clip(max=len(attrs) - 1)
+    found = attrs['ids'][positions] == ids
+    rows = attrs[positions]
+
+    weights = RANKING_WEIGHTS[domain]
+    scores = weights.get('similarity', 1.0) * similarity
+    for feature, values in _features(domain, rows, roommate_profile).items():
+        weight = weights.get(feature, 0.0)
+        if weight:
+            scores += weight * np.where(found, values, 0.0)
+
+    order = np.argsort(-scores, kind='stable')[:top_k]
+    return [(int(ids[i]), float(scores[i]), float(similarity[i])) for i in order]
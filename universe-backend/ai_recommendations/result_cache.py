@@ -0,0 +1,162 @@
+"""
+Per-user cache of ranked recommendation results.
+
+Each user and domain gets one entry holding the pipeline's ranked results
+((id, score) pairs, or (id, score, similarity) when re-ranked). Entries are
+fresh for TTL_SECONDS, then served for up to STALE_SECONDS more while a
+background refresh recomputes them. An entry is invalid once the domain's
+FAISS index is rebuilt (a new epoch, see faiss_service.current_epoch), and
+is deleted when the user's profile changes. Incremental index updates do
+not invalidate entries: new and edited items show up in a user's results
+once their entry is refreshed, at most TTL_SECONDS later. Items deleted,
+sold, made unavailable or filled since are dropped when cached results are
+served (see views._hydrate).
+
+Entries live in the Django cache named by AI_RECOMMENDATIONS_RESULT_CACHE.
+Use a shared backend (Redis, Memcached) so that every worker, and the
+``precompute_recommendations`` command, see the same entries.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+# Cache alias, or None to disable result caching.
+CACHE_ALIAS = getattr(settings, 'AI_RECOMMENDATIONS_RESULT_CACHE', 'default')
+TTL_SECONDS = getattr(settings, 'AI_RECOMMENDATIONS_RESULT_CACHE_TTL', 900)
+STALE_SECONDS = getattr(settings, 'AI_RECOMMENDATIONS_RESULT_CACHE_STALE', 3600)
+# Entries hold at least this many results so requests with different
+# ``limit`` values share them.
+CACHED_TOP_K = getattr(settings, 'AI_RECOMMENDATIONS_RESULT_CACHE_TOP_K', 20)
+
+KEY_PREFIX = 'ai_recommendations:results'
+DOMAINS = ('housing', 'roommates', 'marketplace', 'study_groups')
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='recommendation-refresh')
+# (user_id, domain) pairs with a refresh queued or running.
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def is_enabled():
+    return CACHE_ALIAS is not None
+
+
+def _key(domain, user_id):
+    return f'{KEY_PREFIX}:{domain}:{user_id}'
+
+
+def lookup(domains, user_id, top_k, epochs):
+    """
+    Look up cached results for several domains.
+
+    Args:
+        epochs: {domain: current index epoch}
+
+    Returns:
+        (hits, stale, missing): hits is {domain: results} for every fresh or
+        stale entry; stale and missing are lists of domains to recompute
+    """
+    if not is_enabled():
+        return {}, [], list(domains)
+
+    with timing.stage('cache_lookup'):
+        entries = caches[CACHE_ALIAS].get_many([_key(domain, user_id) for domain in domains])
+    now = time.time()
+    hits, stale, missing = {}, [], []
+    for domain in domains:
+        entry = entries.get(_key(domain, user_id))
+        if (
+            entry is None
+            or entry['top_k'] < top_k
+            or entry.get('epoch') != epochs.get(domain)
+        ):
+            missing.append(domain)
+            continue
+        hits[domain] = entry['results'][:top_k]
+        if now - entry['computed_at'] > TTL_SECONDS:
+            stale.append(domain)
+    return hits, stale, missing
+
+
+def store(results, user_id, top_k, epochs):
+    """
+    Cache {domain: results} computed for ``top_k``. ``epochs`` must be read
+    before computing, so that a rebuild during the computation invalidates
+    the entry.
+
+    Empty results are not cached: they come from a cold-start ranking still
+    being computed (see cold_start.get_rankings), or a domain with nothing
+    to recommend, and cost little to recompute.
+    """
+    if not is_enabled():
+        return
+    results = {domain: domain_results for domain, domain_results in results.items() if domain_results}
+    if not results:
+        return
+    now = time.time()
+    entries = {
+        _key(domain, user_id): {
+            'results': domain_results,
+            'top_k': top_k,
+            'computed_at': now,
+            'epoch': epochs.get(domain),
+        }
+        for domain, domain_results in results.items()
+    }
+    with timing.stage('cache_store'):
+        caches[CACHE_ALIAS].set_many(entries, timeout=TTL_SECONDS + STALE_SECONDS)
+
+
+def refresh_in_background(domains, user_id, epochs, compute):
+    """
+    Recompute and store ``domains`` on a background thread, skipping any
+    already being refreshed. ``compute(domains, top_k)`` returns {domain: results}.
+    """
+    with _refreshing_lock:
+        domains = [domain for domain in domains if (user_id, domain) not in _refreshing]
+        _refreshing.update((user_id, domain) for domain in domains)
+    if not domains:
+        return
+
+    def refresh():
+        try:
+            store(compute(domains, CACHED_TOP_K), user_id, CACHED_TOP_K, epochs)
+        except Exception:
+            logger.exception('Refreshing %s recommendations for user %s failed', domains, user_id)
+        finally:
+            with _refreshing_lock:
+                _refreshing.difference_update((user_id, domain) for domain in domains)
+            close_old_connections()
+
+    _refresh_executor.submit(refresh)
+
+
+def get_or_compute(domains, user_id, top_k, epochs, compute):
+    """
+    Return {domain: results} for ``domains``, computing only missing entries
+    and refreshing stale ones in the background.
+    """
+    hits, stale, missing = lookup(domains, user_id, top_k, epochs)
+    if stale:
+        refresh_in_background(stale, user_id, epochs, compute)
+    if missing:
+        cached_top_k = max(top_k, CACHED_TOP_K)
+        computed = compute(missing, cached_top_k)
+        store(computed, user_id, cached_top_k, epochs)
+        hits.update((domain, results[:top_k]) for domain, results in computed.items())
+    return {domain: hits[domain] for domain in domains}
+
+
+def invalidate_user(user_id):
+    """Drop every cached result for a user, e.g. after their profile changed."""
+    if is_enabled():
+        caches[CACHE_ALIAS].delete_many([_key(domain, user_id) for domain in DOMAINS])
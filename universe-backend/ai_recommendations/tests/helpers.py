@@ -0,0 +1,123 @@
+"""Fakes shared by the ai_recommendations tests."""
+import hashlib
+import io
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+
+from housing.models import HousingListing
+from marketplace.models import MarketplaceItem
+from study_groups.models import GroupMembership, StudyGroup
+from user_profiles.models import RoommateProfile, UserProfile
+
+from .. import (
+    cold_start, embedding_service, embedding_store, embeddings as emb, faiss_service, index_paths,
+    indexing, query_cache,
+)
+
+
+def fake_embedding(text, *args, **kwargs):
+    """A normalized vector determined by ``text``, in place of the model."""
+    seed = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(emb.EMBEDDING_DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_embeddings(texts):
+    return np.array([fake_embedding(text) for text in texts], dtype=np.float32).reshape(
+        len(texts), emb.EMBEDDING_DIM
+    )
+
+
+def random_vectors(n, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, emb.EMBEDDING_DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class TemporaryIndexesMixin:
+    """Give each test an empty FAISS directory and the fake embedding model."""
+
+    def setUp(self):
+        super().setUp()
+        faiss_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(faiss_dir.cleanup)
+        patches = [
+            mock.patch.object(index_paths, 'FAISS_DIR', faiss_dir.name),
+            mock.patch.object(emb, 'embed_text', fake_embedding),
+            mock.patch.object(emb, 'embed_texts', fake_embeddings),
+            mock.patch.object(embedding_service, 'embed_text', fake_embedding),
+            mock.patch.object(indexing, 'IN_BACKGROUND', False),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        faiss_service.invalidate_cache()
+        self.addCleanup(faiss_service.invalidate_cache)
+
+    def search_ids(self, index_name, query, top_k=50):
+        return [item_id for item_id, _ in faiss_service.search_similar(index_name, query, top_k)]
+
+
+class CatalogMixin(TemporaryIndexesMixin):
+    """
+    A small catalog in every domain with its indexes built, and ``users``:
+    six with enough profile signal to be searched for, then two cold-start
+    users (one without a profile).
+    """
+
+    def setUp(self):
+        super().setUp()
+        patches = [
+            mock.patch.object(embedding_store, 'embed_texts', fake_embeddings),
+            mock.patch.object(cold_start, 'CACHE_ALIAS', None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        for clear in (caches['default'].clear, query_cache.clear):
+            clear()
+            self.addCleanup(clear)
+
+        self.users = []
+        for i in range(6):
+            user = User.objects.create_user(f'student{i}', password='x')
+            profile = UserProfile.objects.create(
+                user=user, first_name=f'Student {i}', last_name='L', course_major='Computer Science',
+                bio='I enjoy late night coding and hiking', interests='music, hiking',
+            )
+            if i % 2:
+                RoommateProfile.objects.create(
+                    user_profile=profile, max_rent_budget=Decimal(700 + i * 100),
+                    cleanliness_level=1 + i % 5,
+                )
+            self.users.append(user)
+        for i in range(20):
+            owner = self.users[i % 6]
+            HousingListing.objects.create(
+                posted_by=owner, title=f'Apartment {i}', description='Near campus',
+                housing_type='apartment', address='1 Main St', city='Austin', state='TX',
+                zip_code='78701', rent_price=Decimal(600 + i * 40), is_available=i % 7 != 0,
+                distance_to_campus=i * 0.3,
+            )
+            MarketplaceItem.objects.create(
+                seller=owner, title=f'Book {i}', description='Used once', price=Decimal(10 + i),
+                item_type='books', location='campus', is_sold=i % 5 == 0,
+            )
+            group = StudyGroup.objects.create(
+                creator=owner, name=f'Group {i}', subject_area='Math', description='Calculus',
+                max_members=2,
+            )
+            GroupMembership.objects.create(group=group, user=owner)
+            if i % 3 == 0:
+                GroupMembership.objects.create(group=group, user=self.users[(i + 1) % 6])
+        call_command('rebuild_faiss_indexes', no_embedding_cache=True, stdout=io.StringIO())
+
+        self.users.append(User.objects.create_user('newcomer', password='x'))
+        quiet = User.objects.create_user('quiet', password='x')
+        UserProfile.objects.create(user=quiet, first_name='Quiet', last_name='L')
+        self.users.append(quiet)
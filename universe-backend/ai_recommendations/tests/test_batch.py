@@ -0,0 +1,40 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from .. import batch_recommendations, rag_pipeline
+from .helpers import CatalogMixin
+
+
+class BatchRecommendationTests(CatalogMixin, TestCase):
+    def test_batches_match_per_user_results(self):
+        domains = list(rag_pipeline.PIPELINES)
+        expected = {
+            user.id: rag_pipeline.compute_recommendations(user, 5, domains) for user in self.users
+        }
+        self.assertTrue(all(expected[self.users[0].id].values()))
+        for batch_size in (1, 4, 100):
+            batched = batch_recommendations.iter_recommendations(self.users, 5, batch_size=batch_size)
+            for user, results in batched:
+                for domain in domains:
+                    self.assertEqual(
+                        [result[0] for result in results[domain]],
+                        [result[0] for result in expected[user.id][domain]],
+                        f'{user.username} {domain} with batches of {batch_size}',
+                    )
+
+
+class HousingRowMaskTests(SimpleTestCase):
+    def test_budget_applies_only_to_listings_with_attributes(self):
+        attrs = np.array([(1, 500.0), (3, 2000.0)], dtype=[('ids', np.int64), ('rent_price', np.float64)])
+        labels = np.array([[1, 2, 3], [3, 2, 1]], dtype=np.int64)
+        entries = [
+            (None, None, SimpleNamespace(max_rent_budget=Decimal('1000'))),
+            (None, None, None),
+        ]
+        np.testing.assert_array_equal(
+            batch_recommendations._housing_row_mask(labels, attrs, entries),
+            [[True, True, False], [True, True, True]],
+        )
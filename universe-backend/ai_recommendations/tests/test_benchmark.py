@@ -0,0 +1,86 @@
+import io
+import json
+import os
+import tempfile
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from .. import benchmark, index_paths, result_cache
+from .helpers import TemporaryIndexesMixin
+
+
+class SyntheticCatalogTests(SimpleTestCase):
+    def test_catalogs_come_in_chunks(self):
+        topics = benchmark.Topics(seed=1)
+        chunks = list(benchmark.iter_catalog('housing', 25, topics, chunk_size=10, seed=1))
+
+        self.assertEqual([len(ids) for ids, _, _ in chunks], [10, 10, 5])
+        ids = np.concatenate([ids for ids, _, _ in chunks])
+        np.testing.assert_array_equal(ids, np.arange(1, 26))
+        for ids, embeddings, attributes in chunks:
+            self.assertEqual(embeddings.shape, (len(ids), 384))
+            np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1, rtol=1e-5)
+            self.assertEqual({len(values) for values in attributes.values()}, {len(ids)})
+
+    def test_catalogs_are_reproducible(self):
+        def catalog(seed):
+            chunks = benchmark.iter_catalog('marketplace', 8, benchmark.Topics(seed), seed=seed)
+            return np.concatenate([embeddings for _, embeddings, _ in chunks])
+
+        np.testing.assert_array_equal(catalog(3), catalog(3))
+        self.assertFalse(np.array_equal(catalog(3), catalog(4)))
+
+    def test_latency_summary(self):
+        summary = benchmark.latency_summary([0.001] * 99 + [0.1])
+        self.assertEqual(summary['n'], 100)
+        self.assertAlmostEqual(summary['p50_ms'], 1.0)
+        self.assertAlmostEqual(summary['max_ms'], 100.0)
+
+
+class BenchmarkCommandTests(TemporaryIndexesMixin, TestCase):
+    def run_benchmark(self, *args):
+        with tempfile.TemporaryDirectory() as output_dir:
+            output = os.path.join(output_dir, 'report.json')
+            call_command(
+                'benchmark_recommendations', *args, '--output', output,
+                stdout=io.StringIO(), stderr=io.StringIO(),
+            )
+            with open(output) as f:
+                return json.load(f)
+
+    def test_reports_every_index_and_pipeline(self):
+        faiss_dir, users = index_paths.FAISS_DIR, User.objects.count()
+        report = self.run_benchmark('--sizes', '40', '80', '--queries', '5', '--users', '2')
+
+        self.assertEqual([run['size'] for run in report['runs']], [40, 80])
+        run = report['runs'][1]
+        self.assertEqual(set(run['indexes']), set(benchmark.CATALOGS))
+        for result in run['indexes'].values():
+            self.assertEqual(result['ntotal'], 80)
+            self.assertLessEqual(result['search_similar']['recall@10'], 1.0)
+            self.assertEqual(result['search_similar']['n'], 5)
+        self.assertIn('search_similar_filtered', run['indexes']['housing'])
+        self.assertEqual(
+            set(run['recommendations']), {'housing', 'roommates', 'marketplace', 'study_groups', 'all'}
+        )
+        self.assertEqual(run['recommendations']['all']['n'], 2)
+
+        # Nothing outlives the run.
+        self.assertEqual(index_paths.FAISS_DIR, faiss_dir)
+        self.assertEqual(User.objects.count(), users)
+        self.assertFalse(os.listdir(faiss_dir))
+        self.assertIsNotNone(result_cache.CACHE_ALIAS)
+
+    def test_single_index_without_users(self):
+        report = self.run_benchmark(
+            '--sizes', '30', '--index', 'marketplace', '--index-type', 'flat', '--users', '0',
+            '--queries', '3', '--top-k', '5',
+        )
+        [run] = report['runs']
+        self.assertEqual(list(run['indexes']), ['marketplace'])
+        self.assertEqual(run['indexes']['marketplace']['index_type'], 'IndexFlatIP')
+        self.assertEqual(run['indexes']['marketplace']['search_similar']['recall@5'], 1.0)
+        self.assertNotIn('recommendations', run)
@@ -0,0 +1,86 @@
+import io
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase
+
+from marketplace.models import MarketplaceItem, MarketplaceMessage
+from study_groups.models import GroupMembership, StudyGroup
+
+from .. import cold_start
+
+
+class ColdStartRankingTests(TestCase):
+    def setUp(self):
+        patch = mock.patch.object(cold_start, 'CACHE_ALIAS', 'default')
+        patch.start()
+        self.addCleanup(patch.stop)
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.seller = User.objects.create_user('seller', password='x')
+        self.buyer = User.objects.create_user('buyer', password='x')
+        self.items = [self.create_item(f'Desk {i}') for i in range(3)]
+
+    def create_item(self, title, **fields):
+        return MarketplaceItem.objects.create(
+            seller=self.seller, title=title, description='Solid wood', price=Decimal('40.00'),
+            item_type='furniture', location='campus', **fields,
+        )
+
+    def cached_ids(self, domain):
+        return caches['default'].get(cold_start._key(domain))['ids']
+
+    def test_popular_items_rank_first_and_sold_ones_are_left_out(self):
+        popular = self.items[0]
+        MarketplaceMessage.objects.create(
+            item=popular, sender=self.buyer, receiver=self.seller, content='Still available?'
+        )
+        sold = self.create_item('Chair', is_sold=True)
+        ids = cold_start.compute_ranking('marketplace')['ids']
+        self.assertEqual(ids[0], popular.id)
+        self.assertNotIn(sold.id, ids)
+        self.assertEqual(len(ids), 3)
+
+    def test_full_and_inactive_groups_are_left_out(self):
+        open_group, full, _ = [
+            StudyGroup.objects.create(
+                creator=self.seller, name=name, subject_area='Math', description='Calculus',
+                max_members=1, is_active=name != 'Inactive',
+            )
+            for name in ('Open', 'Full', 'Inactive')
+        ]
+        GroupMembership.objects.create(group=full, user=self.buyer)
+        self.assertEqual(cold_start.compute_ranking('study_groups')['ids'], [open_group.id])
+
+    def test_missing_ranking_is_served_empty_and_refreshed_in_the_background(self):
+        with mock.patch.object(cold_start, 'refresh_in_background') as refresh:
+            rankings = cold_start.get_rankings(['marketplace'])
+        self.assertEqual(rankings['marketplace']['ids'], [])
+        refresh.assert_called_once_with(['marketplace'])
+        self.assertIsNone(caches['default'].get(cold_start._key('marketplace')))
+
+    def test_offline_callers_compute_missing_rankings(self):
+        with mock.patch.object(cold_start, 'refresh_in_background') as refresh:
+            rankings = cold_start.get_rankings(['marketplace'], compute_missing=True)
+        self.assertEqual(len(rankings['marketplace']['ids']), 3)
+        refresh.assert_not_called()
+        self.assertEqual(self.cached_ids('marketplace'), rankings['marketplace']['ids'])
+
+    def test_sold_and_deleted_items_leave_the_cached_ranking(self):
+        cold_start.refresh(['marketplace'])
+        sold, deleted, kept = self.items
+        sold.is_sold = True
+        sold.save()
+        deleted.delete()
+        self.assertEqual(self.cached_ids('marketplace'), [kept.id])
+
+    def test_refresh_command_warns_about_process_local_caches(self):
+        stderr = io.StringIO()
+        call_command(
+            'refresh_cold_start_rankings', domain='marketplace', stdout=io.StringIO(), stderr=stderr
+        )
+        self.assertIn('process-local', stderr.getvalue())
+        self.assertEqual(len(self.cached_ids('marketplace')), 3)
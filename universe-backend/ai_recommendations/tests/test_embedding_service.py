@@ -0,0 +1,70 @@
+import asyncio
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from .. import embedding_service, embeddings as emb
+from .helpers import fake_embedding, fake_embeddings
+
+
+class EmbeddingBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+
+        def embed_texts(texts):
+            self.batches.append(list(texts))
+            return fake_embeddings(texts)
+
+        patch = mock.patch.object(emb, 'embed_texts', embed_texts)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_concurrent_texts_share_a_batch(self):
+        batcher = embedding_service.EmbeddingBatcher(window_ms=200, max_batch_size=8)
+        futures = [batcher.submit(f'text {i}') for i in range(5)]
+
+        for i, future in enumerate(futures):
+            np.testing.assert_allclose(future.result(5), fake_embedding(f'text {i}'), rtol=1e-6)
+        self.assertEqual(self.batches, [[f'text {i}' for i in range(5)]])
+
+    def test_batches_are_capped(self):
+        batcher = embedding_service.EmbeddingBatcher(window_ms=200, max_batch_size=2)
+        futures = [batcher.submit(f'text {i}') for i in range(5)]
+        for future in futures:
+            future.result(5)
+        self.assertEqual([len(batch) for batch in self.batches], [2, 2, 1])
+
+    def test_failures_reach_every_caller_in_the_batch(self):
+        batcher = embedding_service.EmbeddingBatcher(window_ms=200)
+        with mock.patch.object(emb, 'embed_texts', side_effect=RuntimeError('model')), \
+                self.assertLogs(embedding_service.logger, 'ERROR'):
+            futures = [batcher.submit('a'), batcher.submit('b')]
+            for future in futures:
+                with self.assertRaisesMessage(RuntimeError, 'model'):
+                    future.result(5)
+        # The worker keeps serving after a failed batch.
+        batcher.submit('c').result(5)
+
+    def test_async_callers_share_a_batch(self):
+        batcher = embedding_service.EmbeddingBatcher(window_ms=200)
+
+        async def embed_all():
+            return await asyncio.gather(*(
+                asyncio.wrap_future(batcher.submit(text)) for text in ('a', 'b', 'c')
+            ))
+
+        with mock.patch.object(embedding_service, '_batcher', batcher):
+            vectors = asyncio.run(embed_all())
+            self.assertEqual(len(vectors), 3)
+            np.testing.assert_allclose(
+                asyncio.run(embedding_service.aembed_text('d')), fake_embedding('d'), rtol=1e-6
+            )
+        self.assertEqual(self.batches, [['a', 'b', 'c'], ['d']])
+
+    def test_batching_can_be_disabled(self):
+        with mock.patch.object(embedding_service, 'BATCHING_ENABLED', False), \
+                mock.patch.object(emb, 'embed_text', fake_embedding) as embed_text:
+            np.testing.assert_allclose(embedding_service.embed_text('a'), embed_text('a'))
+            self.assertEqual(embedding_service.submit('b').result().shape, (emb.EMBEDDING_DIM,))
+        self.assertEqual(self.batches, [])
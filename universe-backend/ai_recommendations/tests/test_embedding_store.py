@@ -0,0 +1,71 @@
+import tempfile
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from .. import embeddings as emb, embedding_store
+from .helpers import fake_embeddings
+
+
+class EmbeddingStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patch = mock.patch.object(emb, 'embed_texts', side_effect=fake_embeddings)
+        self.encode = patch.start()
+        self.addCleanup(patch.stop)
+
+    def store(self):
+        return embedding_store.EmbeddingStore('test-model', directory=self.directory)
+
+    def assertEmbeds(self, store, texts):
+        np.testing.assert_array_equal(store.embed_texts(texts), fake_embeddings(texts))
+
+    def test_stored_texts_are_not_encoded_again(self):
+        store = self.store()
+        self.assertEmbeds(store, ['a', 'b', 'a'])
+        self.assertEmbeds(store, ['b', 'c'])
+        self.assertEqual((store.hits, store.misses), (1, 3))
+        self.assertEqual([call.args[0] for call in self.encode.call_args_list], [['a', 'b'], ['c']])
+
+    def test_stores_pick_up_rows_appended_by_others(self):
+        first, second = self.store(), self.store()
+        self.assertEmbeds(first, ['a'])
+        self.assertEmbeds(second, ['a', 'b'])
+        self.assertEmbeds(first, ['b'])
+        self.assertEqual(first.misses + second.misses, 2)
+
+    def test_interrupted_appends_are_cut_back(self):
+        store = self.store()
+        self.assertEmbeds(store, ['a', 'b'])
+        # A writer died after writing one and a half vectors and half a key.
+        with open(store.vectors_path, 'ab') as f:
+            f.write(b'\0' * (store._row_bytes() * 3 // 2))
+        with open(store.keys_path, 'ab') as f:
+            f.write(b'0' * (embedding_store.KEY_SIZE // 2))
+
+        self.assertEmbeds(self.store(), ['c', 'a'])
+        reopened = self.store()
+        self.assertEmbeds(reopened, ['a', 'b', 'c'])
+        self.assertEqual(reopened.misses, 0)
+
+    def test_compaction_keeps_live_rows(self):
+        store, reader = self.store(), self.store()
+        self.assertEmbeds(store, ['a', 'b', 'c', 'd'])
+        self.assertEmbeds(reader, ['d'])
+
+        live = [embedding_store.text_key(text, 'test-model') for text in ('b', 'd')]
+        self.assertEqual(store.compact(live), 2)
+        self.assertEqual(store.compact(live), 0)
+        # A store that read the old files reloads them.
+        self.assertEmbeds(reader, ['d', 'b'])
+        self.assertEqual(reader.misses, 0)
+
+    def test_compaction_waits_for_enough_garbage(self):
+        store = self.store()
+        self.assertEmbeds(store, ['a', 'b', 'c', 'd'])
+        live = [embedding_store.text_key(text, 'test-model') for text in ('a', 'b', 'c')]
+        self.assertEqual(store.compact(live, min_garbage=0.5), 0)
+        self.assertEqual(store.compact(live), 1)
@@ -0,0 +1,65 @@
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from .. import embeddings as emb
+from .helpers import fake_embeddings
+
+
+class FakeModel:
+    """Stands in for a SentenceTransformer; ``noise`` perturbs its vectors."""
+
+    def __init__(self, noise=0.0):
+        self.noise = noise
+
+    def encode(self, texts, normalize_embeddings=False, batch_size=32):
+        vectors = fake_embeddings([texts] if isinstance(texts, str) else texts)
+        if self.noise:
+            vectors = vectors + np.random.default_rng(0).normal(0, self.noise, vectors.shape)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[0] if isinstance(texts, str) else vectors
+
+
+class EmbeddingBackendTests(SimpleTestCase):
+    def backends(self, **noise):
+        backends = {name: (lambda n=noise.get(name, 0.0): FakeModel(n)) for name in emb.BACKENDS}
+        return mock.patch.dict(emb.BACKENDS, backends)
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'Unknown embedding backend: fp16'):
+            emb.load_model('fp16')
+
+    def test_model_is_loaded_once_with_the_configured_backend(self):
+        loader = mock.Mock(return_value=FakeModel())
+        with mock.patch.dict(emb.BACKENDS, {'onnx_int8': loader}), \
+                mock.patch.object(emb, 'BACKEND', 'onnx_int8'), mock.patch.object(emb, '_model', None):
+            vector = emb.embed_text('desk')
+            emb.embed_texts(['desk', 'lamp'])
+        loader.assert_called_once_with()
+        self.assertEqual(vector.dtype, np.float32)
+        self.assertEqual(vector.shape, (emb.EMBEDDING_DIM,))
+
+    def test_parity_passes_within_tolerance(self):
+        with self.backends(torch_int8=0.0005):
+            report = emb.check_parity('torch_int8')
+        self.assertTrue(report['passed'])
+        self.assertEqual(report['texts'], len(emb.PARITY_SAMPLE_TEXTS))
+        self.assertGreater(report['min_self_cosine'], 0.99)
+
+    def test_parity_fails_outside_tolerance(self):
+        with self.backends(onnx_int8=0.05):
+            report = emb.check_parity('onnx_int8')
+        self.assertFalse(report['passed'])
+        self.assertGreater(report['max_score_error'], 0.01)
+
+    def test_parity_command(self):
+        stdout = StringIO()
+        with self.backends(onnx=0.0005):
+            call_command('check_embedding_parity', '--backend', 'onnx', stdout=stdout)
+        self.assertIn('matches the reference model', stdout.getvalue())
+
+        with self.backends(onnx=0.05), self.assertRaisesMessage(CommandError, 'outside tolerance'):
+            call_command('check_embedding_parity', '--backend', 'onnx', stdout=StringIO())
@@ -0,0 +1,175 @@
+import threading
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from .. import faiss_service, index_paths
+from .helpers import TemporaryIndexesMixin, random_vectors
+
+
+class IndexGenerationTests(TemporaryIndexesMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.vectors = random_vectors(10)
+        faiss_service.build_index('marketplace', self.vectors, list(range(10)))
+
+    def test_concurrent_upserts_all_land(self):
+        vectors = random_vectors(100, seed=1)
+
+        def upsert(offset):
+            for i in range(offset, 100, 4):
+                faiss_service.upsert_vector('marketplace', 100 + i, vectors[i])
+
+        threads = [threading.Thread(target=upsert, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(faiss_service.count_vectors('marketplace'), 110)
+        # The delta log on disk holds every upsert, not only this process's cache.
+        faiss_service.invalidate_cache()
+        self.assertEqual(faiss_service.count_vectors('marketplace'), 110)
+        self.assertEqual(self.search_ids('marketplace', vectors[37], top_k=1), [137])
+
+    def test_removed_and_replaced_vectors_are_hidden(self):
+        faiss_service.remove_ids('marketplace', [3])
+        faiss_service.upsert_vector('marketplace', 4, self.vectors[5])
+        self.assertNotIn(3, self.search_ids('marketplace', self.vectors[3]))
+        self.assertEqual(faiss_service.count_vectors('marketplace'), 9)
+        self.assertEqual(sorted(self.search_ids('marketplace', self.vectors[5], top_k=2)), [4, 5])
+
+    def test_compaction_publishes_a_generation_in_the_same_epoch(self):
+        faiss_service.remove_ids('marketplace', [3])
+        faiss_service.upsert_vector('marketplace', 42, random_vectors(1, seed=2)[0])
+        generation = index_paths.current_generation('marketplace')
+        epoch = faiss_service.current_epoch('marketplace')
+        before = self.search_ids('marketplace', self.vectors[0])
+
+        self.assertTrue(faiss_service.compact('marketplace'))
+        self.assertNotEqual(index_paths.current_generation('marketplace'), generation)
+        self.assertEqual(faiss_service.current_epoch('marketplace'), epoch)
+        self.assertEqual(self.search_ids('marketplace', self.vectors[0]), before)
+
+    def test_rebuild_starts_a_new_epoch_and_old_readers_keep_working(self):
+        old_index = faiss_service.load_index('marketplace')
+        epoch = faiss_service.current_epoch('marketplace')
+        faiss_service.build_index('marketplace', random_vectors(5, seed=3), list(range(50, 55)))
+
+        self.assertNotEqual(faiss_service.current_epoch('marketplace'), epoch)
+        self.assertEqual(old_index.ntotal, 10)
+        self.assertTrue(set(self.search_ids('marketplace', self.vectors[0])) <= set(range(50, 55)))
+
+    def test_updates_during_a_rebuild_are_carried_over(self):
+        vectors = random_vectors(5, seed=5)
+        builder = faiss_service.IndexBuilder('marketplace', 10)
+        builder.add(self.vectors, list(range(10)))
+        faiss_service.upsert_vector('marketplace', 3, vectors[0])
+        faiss_service.upsert_vector('marketplace', 42, vectors[1])
+        faiss_service.remove_ids('marketplace', [7])
+        builder.publish()
+
+        self.assertEqual(faiss_service.count_vectors('marketplace'), 10)
+        self.assertEqual(self.search_ids('marketplace', vectors[0], top_k=1), [3])
+        self.assertEqual(self.search_ids('marketplace', vectors[1], top_k=1), [42])
+        self.assertNotIn(7, self.search_ids('marketplace', self.vectors[7]))
+        # Carried into the new generation's log on disk, not only this process's cache.
+        faiss_service.invalidate_cache()
+        self.assertEqual(self.search_ids('marketplace', vectors[1], top_k=1), [42])
+
+    def test_compaction_waits_for_a_rebuild(self):
+        builder = faiss_service.IndexBuilder('marketplace', 10)
+        builder.add(self.vectors, list(range(10)))
+        faiss_service.upsert_vector('marketplace', 42, random_vectors(1, seed=6)[0])
+        self.assertFalse(faiss_service.compact('marketplace'))
+        builder.publish()
+
+        self.assertEqual(faiss_service.count_vectors('marketplace'), 11)
+        self.assertTrue(faiss_service.compact('marketplace'))
+
+    def test_created_index_is_carried_over(self):
+        vector = random_vectors(1, seed=7)[0]
+        builder = faiss_service.IndexBuilder('marketplace@new', 10)
+        builder.add(self.vectors, list(range(10)))
+        faiss_service.upsert_vector('marketplace@new', 42, vector, create=True)
+        builder.publish()
+
+        self.assertEqual(faiss_service.count_vectors('marketplace@new'), 11)
+        self.assertEqual(self.search_ids('marketplace@new', vector, top_k=1), [42])
+
+
+class FilteredSearchTests(TemporaryIndexesMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.vectors = random_vectors(100)
+        # Only every tenth item is still for sale.
+        is_sold = [i % 10 != 0 for i in range(100)]
+        faiss_service.build_index('marketplace', self.vectors, list(range(100)), {'is_sold': is_sold})
+
+    def search(self, top_k=5, **kwargs):
+        results = faiss_service.search_similar(
+            'marketplace', self.vectors[3], top_k, where=lambda attrs: ~attrs['is_sold'], **kwargs
+        )
+        return [item_id for item_id, _ in results]
+
+    def test_returns_top_k_matching_rows(self):
+        results = self.search()
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(item_id % 10 == 0 for item_id in results))
+
+    def test_returns_every_match_when_fewer_than_top_k(self):
+        self.assertEqual(sorted(self.search(top_k=50)), list(range(0, 100, 10)))
+
+    def test_excluded_ids_do_not_shorten_the_results(self):
+        results = self.search(exclude_ids={0, 10, 20})
+        self.assertEqual(len(results), 5)
+        self.assertFalse({0, 10, 20} & set(results))
+
+    def test_attribute_updates_apply_before_compaction(self):
+        faiss_service.update_attributes('marketplace', 3, {'is_sold': False})
+        faiss_service.update_attributes('marketplace', 0, {'is_sold': True})
+        faiss_service.upsert_vector('marketplace', 200, self.vectors[3], {'is_sold': True})
+
+        results = self.search(top_k=50)
+        self.assertEqual(results[0], 3)
+        self.assertEqual(sorted(results), [3, *range(10, 100, 10)])
+
+    def test_batch_search_applies_the_filter_to_every_query(self):
+        _, ids, _ = faiss_service.search_batch(
+            'marketplace', self.vectors[:4], top_k=3, where=lambda attrs: ~attrs['is_sold']
+        )
+        self.assertEqual(ids.shape, (4, 3))
+        self.assertTrue((ids % 10 == 0).all())
+
+
+class MemoryMappedLoadingTests(TemporaryIndexesMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.vectors = random_vectors(20)
+        faiss_service.build_index(
+            'housing', self.vectors, list(range(20)), {'rent': np.arange(20, dtype=np.float32)}
+        )
+        faiss_service.invalidate_cache()
+
+    def test_attributes_are_mapped_read_only(self):
+        attrs = faiss_service.load_attributes('housing')
+        self.assertIsInstance(attrs, np.memmap)
+        self.assertFalse(attrs.flags.writeable)
+        self.assertEqual(attrs['ids'].dtype, np.int64)
+
+    def test_mapped_and_private_loads_search_alike(self):
+        mapped = faiss_service.search_similar('housing', self.vectors[4], 5)
+        with mock.patch.object(faiss_service, 'MMAP_INDEXES', False):
+            faiss_service.invalidate_cache()
+            self.assertNotIsInstance(faiss_service.load_attributes('housing'), np.memmap)
+            self.assertEqual(faiss_service.search_similar('housing', self.vectors[4], 5), mapped)
+
+    def test_compaction_of_a_mapped_index(self):
+        faiss_service.remove_ids('housing', [4])
+        faiss_service.update_attributes('housing', 5, {'rent': 999})
+        self.assertTrue(faiss_service.compact('housing'))
+
+        self.assertNotIn(4, self.search_ids('housing', self.vectors[4]))
+        self.assertEqual(faiss_service.get_attributes('housing', 5), {'rent': 999})
+        self.assertIsInstance(faiss_service.load_attributes('housing'), np.memmap)
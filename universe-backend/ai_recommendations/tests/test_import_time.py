@@ -0,0 +1,69 @@
+import json
+import subprocess
+import sys
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from ..management.commands import check_import_time
+from ..management.commands.check_import_time import Command, parse_importtime
+
+IMPORTTIME_OUTPUT = '''\
+import time: self [us] | cumulative | imported package
+import time:       300 |        300 |       faiss._swigfaiss
+import time:       200 |        500 |     faiss
+import time:       100 |        600 |   ai_recommendations.faiss_service
+import time:        50 |        650 | ai_recommendations.views
+import time:        40 |         40 | json
+'''
+
+# Imports the app modules every web and management process loads (but not
+# rag_pipeline, which only recommendation requests need), then prints the
+# top-level packages loaded.
+IMPORT_SCRIPT = '''
+import json, sys
+import django
+django.setup()
+import ai_recommendations.urls, ai_recommendations.indexing, ai_recommendations.cold_start
+print(json.dumps(sorted({module.split('.')[0] for module in sys.modules})))
+'''
+
+
+class ParseImportTimeTests(SimpleTestCase):
+    def test_modules_carry_their_importers(self):
+        parsed = parse_importtime(IMPORTTIME_OUTPUT + 'unrelated line\n')
+        importers = ['ai_recommendations.views', 'ai_recommendations.faiss_service']
+        self.assertEqual(parsed[1], ('faiss', 2, 500, importers))
+        self.assertEqual(parsed[3], ('ai_recommendations.views', 0, 650, []))
+        self.assertEqual(parsed[4], ('json', 0, 40, []))
+
+
+class CheckImportTimeTests(SimpleTestCase):
+    def call(self, *args):
+        with mock.patch.object(Command, '_run', return_value=parse_importtime(IMPORTTIME_OUTPUT)):
+            call_command(
+                'check_import_time', *args, '--skip-save-check', '--repeat', '1', stdout=mock.Mock()
+            )
+
+    def test_heavy_imports_fail_with_their_chain(self):
+        message = (
+            'faiss (0 ms) imported via '
+            'ai_recommendations.views -> ai_recommendations.faiss_service -> faiss'
+        )
+        with self.assertRaisesMessage(CommandError, message):
+            self.call()
+
+    def test_allowed_modules_and_budget(self):
+        self.call('--allow', 'faiss')
+        with self.assertRaisesMessage(CommandError, 'imports took 1 ms, budget is 0 ms'):
+            self.call('--allow', 'faiss', '--max-ms', '0.5')
+
+    def test_web_modules_do_not_load_the_ml_stack(self):
+        result = subprocess.run(
+            [sys.executable, '-c', IMPORT_SCRIPT],
+            capture_output=True, text=True, cwd=settings.BASE_DIR, check=True,
+        )
+        loaded = set(json.loads(result.stdout.splitlines()[-1]))
+        self.assertFalse(loaded & set(check_import_time.HEAVY_MODULES))
@@ -0,0 +1,70 @@
+import io
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from marketplace.models import MarketplaceItem
+
+from .. import embedding_service, faiss_service, index_paths
+from ..text_builders import build_marketplace_item_text
+from .helpers import TemporaryIndexesMixin, fake_embedding
+
+
+class IncrementalIndexingTests(TemporaryIndexesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user('seller', password='x')
+        for i in range(3):
+            self.create_item(f'Desk {i}')
+
+    def create_item(self, title, **fields):
+        return MarketplaceItem.objects.create(
+            seller=self.seller, title=title, description='Solid wood', price=Decimal('40.00'),
+            item_type='furniture', location='campus', **fields,
+        )
+
+    def rebuild(self):
+        call_command(
+            'rebuild_faiss_indexes', index='marketplace', no_embedding_cache=True, stdout=io.StringIO()
+        )
+
+    def item_query(self, item):
+        return fake_embedding(build_marketplace_item_text(item))
+
+    def test_saved_item_is_indexed(self):
+        self.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.create_item('Lamp')
+        self.assertEqual(self.search_ids('marketplace', self.item_query(item), top_k=1), [item.id])
+
+    def test_sold_and_deleted_items_are_removed(self):
+        self.rebuild()
+        sold, deleted = MarketplaceItem.objects.all()[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            sold.is_sold = True
+            sold.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted_query = self.item_query(deleted)
+            deleted_id = deleted.id
+            deleted.delete()
+        self.assertNotIn(sold.id, self.search_ids('marketplace', self.item_query(sold)))
+        self.assertNotIn(deleted_id, self.search_ids('marketplace', deleted_query))
+        self.assertEqual(faiss_service.count_vectors('marketplace'), 1)
+
+    def test_unchanged_text_is_not_re_embedded(self):
+        self.rebuild()
+        item = MarketplaceItem.objects.first()
+        with mock.patch.object(embedding_service, 'embed_text', side_effect=fake_embedding) as embed:
+            with self.captureOnCommitCallbacks(execute=True):
+                item.save()
+        embed.assert_not_called()
+
+    def test_saves_before_the_index_is_built_do_nothing(self):
+        with mock.patch.object(embedding_service, 'embed_text', side_effect=fake_embedding) as embed:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_item('Chair')
+        embed.assert_not_called()
+        self.assertFalse(index_paths.index_exists('marketplace'))
@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from user_profiles.models import RoommateProfile, UserProfile
+
+from .. import embedding_service, query_cache
+from .helpers import TemporaryIndexesMixin, fake_embedding
+
+
+class QueryCacheTests(SimpleTestCase):
+    def setUp(self):
+        query_cache.clear()
+        self.addCleanup(query_cache.clear)
+        patch = mock.patch.object(embedding_service, 'embed_text', side_effect=fake_embedding)
+        self.embed = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_unchanged_text_is_encoded_once(self):
+        first = query_cache.get_query_embedding(1, 'likes hiking')
+        second = query_cache.get_query_embedding(1, 'likes hiking')
+        self.assertIs(second, first)
+        self.assertEqual(self.embed.call_count, 1)
+        with self.assertRaises(ValueError):
+            first[0] = 0  # shared between requests
+
+    def test_changed_text_is_encoded_again(self):
+        query_cache.get_query_embedding(1, 'likes hiking')
+        query_cache.get_query_embedding(1, 'likes chess')
+        self.assertEqual(self.embed.call_count, 2)
+
+    def test_entries_expire(self):
+        query_cache.get_query_embedding(1, 'likes hiking')
+        with mock.patch.object(query_cache.time, 'monotonic', return_value=1e12):
+            query_cache.get_query_embedding(1, 'likes hiking')
+        self.assertEqual(self.embed.call_count, 2)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with mock.patch.object(query_cache, 'MAX_ENTRIES', 2):
+            for user_id in (1, 2, 1, 3):
+                query_cache.get_query_embedding(user_id, 'likes hiking')
+            query_cache.get_query_embedding(1, 'likes hiking')
+            self.assertEqual(self.embed.call_count, 3)
+            query_cache.get_query_embedding(2, 'likes hiking')
+        self.assertEqual(self.embed.call_count, 4)
+
+    def test_invalidate_user(self):
+        query_cache.get_query_embedding(1, 'likes hiking')
+        query_cache.invalidate_user(1)
+        query_cache.get_query_embedding(1, 'likes hiking')
+        self.assertEqual(self.embed.call_count, 2)
+
+
+class ProfileChangeTests(TemporaryIndexesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        query_cache.clear()
+        self.addCleanup(query_cache.clear)
+        self.user = User.objects.create_user('student', password='x')
+        self.profile = UserProfile.objects.create(user=self.user, first_name='S', last_name='L')
+
+    def assertInvalidates(self, change):
+        query_cache.get_query_embedding(self.user.id, 'likes hiking')
+        change()
+        self.assertIsNone(query_cache._lookup(self.user.id, query_cache._text_hash('likes hiking'), 0))
+
+    def test_profile_changes_drop_the_cached_embedding(self):
+        self.assertInvalidates(self.profile.save)
+
+    def test_roommate_profile_changes_drop_the_cached_embedding(self):
+        self.assertInvalidates(lambda: RoommateProfile.objects.create(user_profile=self.profile))
@@ -0,0 +1,79 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from roommate_matching.utils import calculate_compatibility
+from user_profiles.models import RoommateProfile
+
+from .. import indexing, ranking
+
+
+class CompatibilityParityTests(SimpleTestCase):
+    """ranking.compatibility must score as calculate_compatibility does."""
+
+    def roommate(self, smoking='no_preference', drinking='no_preference', sleep='average',
+                 study='library', guests='no_preference', cleanliness=3, budget=None):
+        return RoommateProfile(
+            smoking_preference=smoking, drinking_preference=drinking, sleep_habits=sleep,
+            study_habits=study, guests_preference=guests, cleanliness_level=cleanliness,
+            max_rent_budget=Decimal(budget) if budget is not None else None,
+        )
+
+    def candidates(self):
+        # Budget differences from 1000 avoid the exact 10/20/30% boundaries.
+        return [
+            self.roommate(),
+            self.roommate('yes', 'no', 'night_owl', 'in_room', 'yes', 5, '1000'),
+            self.roommate('no', 'sometimes', 'early_riser', 'library', 'no', 4, '950'),
+            self.roommate('yes', 'no_preference', 'average', 'other_places', 'sometimes', 1, '850'),
+            self.roommate('no_preference', 'yes', 'night_owl', 'library', 'no_preference', 2, '760'),
+            self.roommate('sometimes', 'no', 'early_riser', 'in_room', 'yes', 3, '500'),
+            self.roommate('no', 'no', 'average', 'library', 'no', 3, '1400'),
+        ]
+
+    def rows(self, candidates):
+        """Roommate attribute rows of ``candidates``, as rerank() gets them."""
+        profiles = [SimpleNamespace(date_joined=None, roommate_profile=c) for c in candidates]
+        columns = indexing.collect_attributes(profiles, indexing.user_profile_attributes)
+        return np.rec.fromarrays(list(columns.values()), names=list(columns))
+
+    def assertParity(self, mine):
+        candidates = self.candidates()
+        scores = ranking.compatibility(self.rows(candidates), mine) * 100
+        expected = [calculate_compatibility(mine, candidate) for candidate in candidates]
+        # calculate_compatibility rounds to one decimal.
+        np.testing.assert_allclose(scores, expected, atol=0.051)
+
+    def test_matches_calculate_compatibility(self):
+        self.assertParity(self.roommate('yes', 'no', 'night_owl', 'in_room', 'yes', 5, '1000'))
+        self.assertParity(self.roommate('no', 'sometimes', 'early_riser', 'library', 'no', 2, '1000'))
+
+    def test_matches_without_preferences_or_budget(self):
+        self.assertParity(self.roommate())
+        self.assertParity(self.roommate('no', cleanliness=1))
+
+    def test_candidates_without_roommate_profile_score_half(self):
+        rows = self.rows([None])
+        np.testing.assert_allclose(ranking.compatibility(rows, self.roommate('yes')), [0.5])
+
+
+class RerankTests(SimpleTestCase):
+    def attrs(self):
+        return np.array(
+            [(1, 900.0, 5.0), (2, 900.0, 0.1), (3, 2000.0, 0.1)],
+            dtype=[('ids', np.int64), ('rent_price', np.float64), ('distance_to_campus', np.float64)],
+        )
+
+    def test_blended_scores_keep_the_similarity(self):
+        results = [(1, 0.62), (2, 0.6), (3, 0.58), (4, 0.5)]
+        ranked = ranking.rerank('housing', results, self.attrs(), 10, RoommateProfile(max_rent_budget=Decimal('1000')))
+        self.assertEqual([item_id for item_id, _, _ in ranked], [2, 1, 3, 4])
+        self.assertEqual({item_id: similarity for item_id, _, similarity in ranked}, dict(results))
+        # Listing 4 has no attribute row: its features count 0.
+        self.assertAlmostEqual(ranked[-1][1], 0.5)
+
+    def test_domains_without_features_keep_their_results(self):
+        results = [(1, 0.62), (2, 0.6)]
+        self.assertEqual(ranking.rerank('marketplace', results, self.attrs(), 10), results)
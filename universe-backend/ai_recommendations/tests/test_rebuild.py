@@ -0,0 +1,137 @@
+import io
+import tempfile
+from concurrent.futures import Future
+from unittest import mock
+
+import numpy as np
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from .. import embedding_store, embeddings as emb, faiss_service
+from ..management.commands import rebuild_faiss_indexes
+from .helpers import CatalogMixin, fake_embeddings
+
+INDEX_NAMES = ('housing', 'marketplace', 'study_groups', 'roommate')
+
+
+class ChunkedRebuildTests(CatalogMixin, TestCase):
+    def snapshot(self):
+        """{index name: ({id: vector}, attribute array)} of every index."""
+        snapshot = {}
+        for index_name in INDEX_NAMES:
+            attrs = faiss_service.load_attributes(index_name)
+            ids = attrs['ids'].tolist()
+            snapshot[index_name] = (faiss_service.reconstruct(index_name, ids), attrs.copy())
+        return snapshot
+
+    def rebuild(self, chunk_size):
+        # Drop the indexes so every row is embedded again.
+        for index_name in INDEX_NAMES:
+            faiss_service.drop_index(index_name)
+        batches = []
+
+        def embed_texts(texts):
+            batches.append(len(texts))
+            return fake_embeddings(texts)
+
+        stdout = io.StringIO()
+        with mock.patch.object(emb, 'embed_texts', embed_texts):
+            call_command(
+                'rebuild_faiss_indexes', no_embedding_cache=True, chunk_size=chunk_size, stdout=stdout
+            )
+        return batches, stdout.getvalue()
+
+    def test_small_chunks_build_the_same_indexes(self):
+        self.rebuild(chunk_size=1000)
+        expected = self.snapshot()
+        batches, output = self.rebuild(chunk_size=3)
+
+        self.assertLessEqual(max(batches), 3)
+        self.assertIn('3/17 rows embedded', output)
+        for index_name, (vectors, attrs) in self.snapshot().items():
+            expected_vectors, expected_attrs = expected[index_name]
+            self.assertEqual(vectors.keys(), expected_vectors.keys(), index_name)
+            for item_id, vector in vectors.items():
+                np.testing.assert_array_equal(vector, expected_vectors[item_id])
+            np.testing.assert_array_equal(attrs, expected_attrs)
+
+    def test_one_chunk_reports_no_progress(self):
+        _, output = self.rebuild(chunk_size=1000)
+        self.assertNotIn('rows embedded', output)
+        self.assertIn('Housing index built with 17 entries.', output)
+
+
+class InlineExecutor:
+    """ProcessPoolExecutor stand-in running tasks in this process, where the test database is."""
+
+    def __init__(self, max_workers, mp_context=None, initializer=None, initargs=()):
+        self.start_method = mp_context.get_start_method()
+        self.submitted = []
+        InlineExecutor.instance = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args):
+        self.submitted.append((fn.__name__, args))
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class ParallelRebuildTests(CatalogMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        store_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(store_dir.cleanup)
+        store = embedding_store.EmbeddingStore(directory=store_dir.name)
+        patches = [
+            mock.patch.dict(embedding_store._stores, {emb.MODEL_VERSION: store}),
+            # CatalogMixin embeds around the store; index builds read it here.
+            mock.patch.object(embedding_store, 'embed_texts', store.embed_texts),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_shards_cover_every_row_once(self):
+        command = rebuild_faiss_indexes.Command()
+        command._set_options(3, use_embedding_cache=True, evaluate_recall=False)
+        shards = command._shards(INDEX_NAMES, workers=2)
+
+        self.assertGreater(len(shards), len(INDEX_NAMES))
+        for index_name in INDEX_NAMES:
+            ranges = [(low, high) for name, low, high in shards if name == index_name]
+            rows = rebuild_faiss_indexes.INDEX_SOURCES[index_name].rows()
+            covered = sum(rows.filter(pk__gte=low, pk__lt=high).count() for low, high in ranges)
+            self.assertEqual(covered, rows.count())
+
+    def test_workers_encode_shards_then_build_every_index(self):
+        for index_name in INDEX_NAMES:
+            faiss_service.drop_index(index_name)
+
+        stdout = io.StringIO()
+        with mock.patch.object(rebuild_faiss_indexes, 'ProcessPoolExecutor', InlineExecutor):
+            call_command('rebuild_faiss_indexes', workers=2, chunk_size=4, stdout=stdout)
+
+        pool = InlineExecutor.instance
+        # Forked workers would inherit this process's connections and model.
+        self.assertEqual(pool.start_method, 'spawn')
+        tasks = [name for name, _ in pool.submitted]
+        n_shards = tasks.count('_encode_shard')
+        self.assertEqual(tasks, ['_encode_shard'] * n_shards + ['_build_index_in_worker'] * 4)
+        # Indexes are built from the vectors the shards encoded.
+        self.assertEqual(stdout.getvalue().count('cached embeddings, encoded 0.'), 4)
+        self.assertIn('Reused 17 cached embeddings', stdout.getvalue())
+        for index_name in INDEX_NAMES:
+            rows = rebuild_faiss_indexes.INDEX_SOURCES[index_name].rows()
+            self.assertEqual(faiss_service.count_vectors(index_name), rows.count())
+
+    def test_workers_need_the_embedding_cache(self):
+        with self.assertRaisesMessage(CommandError, 'drop --no-embedding-cache'):
+            call_command(
+                'rebuild_faiss_indexes', workers=2, no_embedding_cache=True, stdout=io.StringIO()
+            )
@@ -0,0 +1,109 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase
+
+from housing.models import HousingListing
+from marketplace.models import MarketplaceItem
+from study_groups.models import GroupMembership, StudyGroup
+
+from .. import faiss_service, rag_pipeline, result_cache, views
+from .helpers import TemporaryIndexesMixin, random_vectors
+
+
+class ResultCacheTests(TemporaryIndexesMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        patch = mock.patch.object(result_cache, 'CACHE_ALIAS', 'default')
+        patch.start()
+        self.addCleanup(patch.stop)
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.vectors = random_vectors(10)
+        faiss_service.build_index('marketplace', self.vectors, list(range(10)))
+
+    def epochs(self):
+        return rag_pipeline.index_epochs(['marketplace'])
+
+    def cache(self, results):
+        result_cache.store({'marketplace': results}, 1, 5, self.epochs())
+
+    def test_incremental_updates_keep_entries(self):
+        self.cache([(1, 0.9)])
+        faiss_service.upsert_vector('marketplace', 11, random_vectors(1, seed=4)[0])
+        faiss_service.compact('marketplace')
+        hits, _, missing = result_cache.lookup(['marketplace'], 1, 5, self.epochs())
+        self.assertEqual(hits, {'marketplace': [(1, 0.9)]})
+        self.assertEqual(missing, [])
+
+    def test_rebuild_invalidates_entries(self):
+        self.cache([(1, 0.9)])
+        faiss_service.build_index('marketplace', self.vectors, list(range(10)))
+        hits, _, missing = result_cache.lookup(['marketplace'], 1, 5, self.epochs())
+        self.assertEqual(hits, {})
+        self.assertEqual(missing, ['marketplace'])
+
+    def test_invalidate_user_drops_entries(self):
+        self.cache([(1, 0.9)])
+        result_cache.invalidate_user(1)
+        self.assertEqual(result_cache.lookup(['marketplace'], 1, 5, self.epochs())[2], ['marketplace'])
+
+    def test_empty_results_are_not_cached(self):
+        self.cache([])
+        self.assertEqual(result_cache.lookup(['marketplace'], 1, 5, self.epochs())[2], ['marketplace'])
+
+    def test_larger_limits_miss(self):
+        self.cache([(1, 0.9)])
+        self.assertEqual(result_cache.lookup(['marketplace'], 1, 10, self.epochs())[2], ['marketplace'])
+
+
+class HydrationTests(TemporaryIndexesMixin, TestCase):
+    """Cached results must not serve rows taken since they were ranked."""
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner', password='x')
+
+    def served_ids(self, domain, objects):
+        recommendations = [(obj.id, 0.9 - i / 10) for i, obj in enumerate(objects)]
+        return [result['id'] for result in views._serialize(domain, recommendations, None)]
+
+    def test_unavailable_housing_is_dropped(self):
+        listings = [
+            HousingListing.objects.create(
+                posted_by=self.owner, title=f'Apartment {i}', description='Near campus',
+                housing_type='apartment', address='1 Main St', city='Austin', state='TX',
+                zip_code='78701', rent_price=Decimal('900.00'),
+            )
+            for i in range(3)
+        ]
+        HousingListing.objects.filter(pk=listings[1].pk).update(is_available=False)
+        self.assertEqual(
+            self.served_ids('housing', listings), [listings[0].id, listings[2].id]
+        )
+
+    def test_sold_and_deleted_items_are_dropped(self):
+        items = [
+            MarketplaceItem.objects.create(
+                seller=self.owner, title=f'Desk {i}', description='Solid wood',
+                price=Decimal('40.00'), item_type='furniture', location='campus',
+            )
+            for i in range(3)
+        ]
+        MarketplaceItem.objects.filter(pk=items[0].pk).update(is_sold=True)
+        MarketplaceItem.objects.filter(pk=items[2].pk).delete()
+        self.assertEqual(self.served_ids('marketplace', items), [items[1].id])
+
+    def test_full_and_inactive_groups_are_dropped(self):
+        groups = [
+            StudyGroup.objects.create(
+                creator=self.owner, name=f'Group {i}', subject_area='Math',
+                description='Calculus', max_members=1,
+            )
+            for i in range(3)
+        ]
+        GroupMembership.objects.create(group=groups[0], user=self.owner)
+        StudyGroup.objects.filter(pk=groups[1].pk).update(is_active=False)
+        self.assertEqual(self.served_ids('study_groups', groups), [groups[2].id])
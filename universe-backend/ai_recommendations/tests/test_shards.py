@@ -0,0 +1,94 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from housing.models import HousingListing
+from user_profiles.models import UserProfile
+
+from .. import faiss_service, indexing, rag_pipeline
+from ..text_builders import build_housing_listing_text
+from .helpers import TemporaryIndexesMixin, fake_embedding, fake_embeddings
+
+
+class HousingShardTests(TemporaryIndexesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for module in (indexing, rag_pipeline):
+            patch = mock.patch.object(module, 'HOUSING_SHARDS', True)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.owner = User.objects.create_user('owner', password='x')
+        self.listings = [
+            self.create_listing(f'Apartment {i}', city)
+            for i, city in enumerate(['Austin', 'Austin', 'Dallas'])
+        ]
+        self.build()
+
+    def create_listing(self, title, city):
+        return HousingListing.objects.create(
+            posted_by=self.owner, title=title, description='Near campus', housing_type='apartment',
+            address='1 Main St', city=city, state='TX', zip_code='78701', rent_price=Decimal('900.00'),
+        )
+
+    def build(self):
+        """The global housing index and one shard per city, as the rebuild makes them."""
+        by_shard = {'': self.listings}
+        for listing in self.listings:
+            by_shard.setdefault(indexing.housing_listing_shard(listing), []).append(listing)
+        for shard, listings in by_shard.items():
+            faiss_service.build_index(
+                faiss_service.shard_index_name('housing', shard) if shard else 'housing',
+                fake_embeddings([build_housing_listing_text(listing) for listing in listings]),
+                [listing.id for listing in listings],
+                indexing.collect_attributes(listings, indexing.housing_listing_attributes),
+            )
+
+    def shard_ids(self, shard):
+        attrs = faiss_service.load_attributes(faiss_service.shard_index_name('housing', shard))
+        return set(attrs['ids'].tolist()) if attrs is not None else set()
+
+    def test_locations_are_normalized(self):
+        for city, state in [('Austin', 'TX'), (' austin ', 'tx'), ('Austin, Texas', ''), ('AUSTIN', 'Texas')]:
+            self.assertEqual(indexing.housing_shard(city, state), 'austin-tx')
+        self.assertEqual(indexing.housing_shard('', 'TX'), '')
+
+    def test_profiles_route_to_their_city_shard(self):
+        profile = UserProfile(city='Austin, Texas', state='')
+        self.assertEqual(rag_pipeline.housing_shards(profile), ['austin-tx'])
+        with mock.patch.object(rag_pipeline, 'HOUSING_MARKETS', {'austin-tx': ['austin-tx', 'dallas-tx']}):
+            self.assertEqual(rag_pipeline.housing_shards(profile), ['austin-tx', 'dallas-tx'])
+        self.assertIsNone(rag_pipeline.housing_shards(UserProfile(city='', state='TX')))
+
+    def test_cities_without_a_shard_search_the_global_index(self):
+        misses = rag_pipeline.shard_misses['el-paso-tx']
+        with self.assertLogs('ai_recommendations.rag_pipeline', 'WARNING'):
+            self.assertIsNone(rag_pipeline.housing_shards(UserProfile(city='El Paso', state='TX')))
+        self.assertEqual(rag_pipeline.shard_misses['el-paso-tx'], misses + 1)
+
+    def test_moved_listing_leaves_only_its_old_shard(self):
+        listing = self.listings[0]
+        with mock.patch.object(faiss_service, 'remove_ids', wraps=faiss_service.remove_ids) as remove_ids:
+            with self.captureOnCommitCallbacks(execute=True):
+                listing.city = 'Dallas'
+                listing.description = 'Moved downtown'
+                listing.save()
+        self.assertEqual([call.args[0] for call in remove_ids.call_args_list], ['housing@austin-tx'])
+        self.assertEqual(self.shard_ids('austin-tx'), {self.listings[1].id})
+        self.assertEqual(self.shard_ids('dallas-tx'), {listing.id, self.listings[2].id})
+
+    def test_deleted_listing_leaves_its_shard(self):
+        listing = self.listings[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.delete()
+        self.assertEqual(self.shard_ids('dallas-tx'), set())
+        self.assertEqual(self.shard_ids('austin-tx'), {self.listings[0].id, self.listings[1].id})
+
+    def test_listing_in_a_new_city_starts_its_shard(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = self.create_listing('Apartment 3', 'Houston')
+        self.assertIn('houston-tx', faiss_service.list_shards('housing'))
+        self.assertEqual(self.shard_ids('houston-tx'), {listing.id})
+        query = fake_embedding(build_housing_listing_text(listing))
+        self.assertEqual(self.search_ids('housing@houston-tx', query, top_k=1), [listing.id])
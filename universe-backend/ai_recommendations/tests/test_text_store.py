@@ -0,0 +1,91 @@
+import io
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from marketplace.models import MarketplaceItem
+
+from .. import embeddings as emb, faiss_service, text_store
+from ..management.commands.rebuild_faiss_indexes import Command
+from ..models import IndexedText
+from ..text_builders import build_marketplace_item_text
+from .helpers import TemporaryIndexesMixin, fake_embedding, fake_embeddings
+
+
+class IndexedTextTests(TemporaryIndexesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        seller = User.objects.create_user('seller', password='x')
+        self.items = [
+            MarketplaceItem.objects.create(
+                seller=seller, title=f'Desk {i}', description='Solid wood', price=Decimal('40.00'),
+                item_type='furniture', location='campus',
+            )
+            for i in range(3)
+        ]
+
+    def rebuild(self, **options):
+        stdout = io.StringIO()
+        call_command(
+            'rebuild_faiss_indexes', index='marketplace', no_embedding_cache=True,
+            stdout=stdout, **options,
+        )
+        return stdout.getvalue()
+
+    def recorded_text(self, item):
+        return IndexedText.objects.get(index_name='marketplace', object_id=item.id).text
+
+    def test_rebuild_embeds_only_changed_rows(self):
+        self.rebuild()
+        self.assertEqual(text_store.indexed_count('marketplace'), 3)
+        MarketplaceItem.objects.filter(pk=self.items[0].pk).update(title='Lamp')
+
+        with mock.patch.object(emb, 'embed_texts', side_effect=fake_embeddings) as embed:
+            output = self.rebuild()
+        embed.assert_called_once()
+        self.assertEqual(len(embed.call_args.args[0]), 1)
+        self.assertIn('Reused 2 unchanged vectors', output)
+        self.assertIn('Lamp', self.recorded_text(self.items[0]))
+
+    def test_if_stale_skips_up_to_date_indexes(self):
+        self.rebuild()
+        self.assertIn('up to date', self.rebuild(if_stale=True))
+
+        with mock.patch.object(emb, 'MODEL_VERSION', 'another-model'):
+            self.assertIn('3 vectors from another model', self.rebuild(if_stale=True))
+            self.assertIn('up to date', self.rebuild(if_stale=True))
+
+    def test_if_stale_rebuilds_indexes_with_unrecorded_rows(self):
+        self.rebuild()
+        # As indexing.forget_changed_text does with incremental indexing off.
+        text_store.forget('marketplace', [self.items[0].id])
+        self.assertIn('1 without a recorded text', self.rebuild(if_stale=True))
+        self.assertEqual(text_store.indexed_count('marketplace'), 3)
+
+    def test_texts_are_not_recorded_when_publishing_fails(self):
+        with mock.patch.object(faiss_service, '_publish_generation', side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.rebuild()
+        self.assertEqual(text_store.indexed_count('marketplace'), 0)
+
+    def test_rows_updated_during_a_rebuild_keep_their_text(self):
+        self.rebuild()
+        item = self.items[0]
+        embed_changed = Command._embed_changed
+
+        def save_during_rebuild(command, *args):
+            # The chunk has been read; this save reaches the live index first.
+            with self.captureOnCommitCallbacks(execute=True):
+                item.title = 'Lamp'
+                item.save()
+            return embed_changed(command, *args)
+
+        with mock.patch.object(Command, '_embed_changed', save_during_rebuild):
+            self.rebuild()
+
+        text = build_marketplace_item_text(MarketplaceItem.objects.get(pk=item.pk))
+        self.assertEqual(self.recorded_text(item), text)
+        self.assertEqual(self.search_ids('marketplace', fake_embedding(text), top_k=1), [item.id])
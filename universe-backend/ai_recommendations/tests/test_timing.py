@@ -0,0 +1,106 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .. import result_cache, timing, views
+from .helpers import CatalogMixin
+
+METRICS_URL = reverse('recommendations-metrics')
+
+
+class MetricsAccessTests(TestCase):
+    def get(self, user=None, token=None, configured='s3cret'):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        headers = {'Authorization': f'Bearer {token}'} if token is not None else {}
+        with mock.patch.object(views, 'METRICS_TOKEN', configured):
+            return client.get(METRICS_URL, headers=headers)
+
+    def test_anonymous_requests_are_refused(self):
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_regular_users_are_refused(self):
+        self.assertEqual(self.get(User.objects.create_user('student')).status_code, 403)
+
+    def test_staff_can_read(self):
+        response = self.get(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    def test_scrapers_read_with_the_token(self):
+        self.assertEqual(self.get(token='s3cret').status_code, 200)
+        self.assertEqual(self.get(token='guess').status_code, 401)
+
+    def test_no_token_is_accepted_when_none_is_configured(self):
+        self.assertEqual(self.get(token='', configured='').status_code, 401)
+
+
+class TimingTests(SimpleTestCase):
+    def setUp(self):
+        timing.reset()
+        self.addCleanup(timing.reset)
+
+    def test_stages_outside_a_request_are_not_recorded(self):
+        with timing.stage('embed'):
+            pass
+        self.assertNotIn('_bucket', timing.render_prometheus())
+
+    def test_stages_become_histograms(self):
+        with mock.patch.object(timing.time, 'perf_counter', side_effect=[0.0, 0.0, 0.003, 0.01]):
+            with timing.track('housing'):
+                timing.set_path('warm')
+                with timing.stage('search', 'housing'):
+                    pass
+
+        metrics = timing.render_prometheus()
+        labels = 'endpoint="housing",path="warm",stage="search",domain="housing"'
+        self.assertIn(f'ai_recommendations_stage_seconds_bucket{{{labels},le="0.0025"}} 0', metrics)
+        self.assertIn(f'ai_recommendations_stage_seconds_bucket{{{labels},le="0.005"}} 1', metrics)
+        self.assertIn(f'ai_recommendations_stage_seconds_count{{{labels}}} 1', metrics)
+        self.assertIn('stage="total",domain=""', metrics)
+
+    def test_disabled(self):
+        with mock.patch.object(timing, 'ENABLED', False):
+            with timing.track('housing') as request_timing:
+                with timing.stage('search'):
+                    pass
+        self.assertIsNone(request_timing)
+        self.assertNotIn('_bucket', timing.render_prometheus())
+
+
+class RequestTimingTests(CatalogMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        timing.reset()
+        self.addCleanup(timing.reset)
+        patch = mock.patch.object(result_cache, 'CACHE_ALIAS', None)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def get(self, user, url_name='housing-recommendations'):
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch.object(timing, 'SERVER_TIMING', True), \
+                self.assertLogs(timing.logger, 'INFO') as logs:
+            response = client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_warm_requests_record_each_stage(self):
+        response, logged = self.get(self.users[1])
+        self.assertEqual(logged['endpoint'], 'housing')
+        self.assertEqual(logged['path'], 'warm')
+        for name in ('profile', 'text', 'embed', 'search.housing', 'hydrate.housing', 'total'):
+            self.assertIn(name, logged['stages_ms'])
+        self.assertIn('search-housing;dur=', response['Server-Timing'])
+
+    def test_cold_start_requests_are_labelled(self):
+        _, logged = self.get(self.users[-2])
+        self.assertEqual(logged['path'], 'cold')
+        self.assertNotIn('embed', logged['stages_ms'])
+        self.assertIn('path="cold"', timing.render_prometheus())
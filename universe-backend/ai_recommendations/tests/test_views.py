@@ -0,0 +1,145 @@
+import json
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import permissions, throttling
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from housing.models import HousingListing
+from marketplace.models import MarketplaceItem
+from study_groups.models import StudyGroup
+from user_profiles.models import UserProfile
+
+from .. import embedding_service, rag_pipeline, result_cache, views
+from .helpers import CatalogMixin, fake_embedding
+
+
+class SerializationTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user('seller', password='x')
+        self.item = MarketplaceItem.objects.create(
+            seller=seller, title='Desk', description='Solid wood', price=Decimal('40.00'),
+            item_type='furniture', location='campus',
+        )
+
+    def test_re_ranked_results_keep_their_similarity(self):
+        [result] = views._serialize('marketplace', [(self.item.id, 0.81234, 0.61234)], None)
+        self.assertEqual(result['similarity_score'], 0.6123)
+        self.assertEqual(result['score'], 0.8123)
+        self.assertEqual(result['data']['title'], 'Desk')
+
+    def test_similarity_is_the_score_of_results_not_re_ranked(self):
+        [result] = views._serialize('marketplace', [(self.item.id, 0.5)], None)
+        self.assertEqual(result['similarity_score'], 0.5)
+        self.assertEqual(result['score'], 0.5)
+
+
+class HydrationQueryTests(CatalogMixin, TestCase):
+    def listed_ids(self, domain):
+        return {
+            'housing': [listing.id for listing in HousingListing.objects.filter(is_available=True)],
+            'roommates': [profile.user_id for profile in UserProfile.objects.all()],
+            'marketplace': [item.id for item in MarketplaceItem.objects.filter(is_sold=False)],
+            'study_groups': [
+                group.id for group in StudyGroup.objects.filter(is_active=True) if not group.is_full
+            ],
+        }[domain]
+
+    def queries(self, domain, ids):
+        with CaptureQueriesContext(connection) as queries:
+            results = views._serialize(domain, [(item_id, 0.5) for item_id in ids], None)
+        self.assertEqual([result['id'] for result in results], ids)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_the_results(self):
+        for domain in views.SERIALIZERS:
+            ids = self.listed_ids(domain)
+            with self.subTest(domain):
+                self.assertGreater(len(ids), 2)
+                self.assertEqual(self.queries(domain, ids[:2]), self.queries(domain, ids))
+
+
+class DenyAllThrottle(throttling.BaseThrottle):
+    def allow_request(self, request, view):
+        return False
+
+    def wait(self):
+        return 30
+
+
+class AsyncViewAccessTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='x')
+        self.token = Token.objects.create(user=self.user)
+        patch = mock.patch.object(rag_pipeline, 'aget_recommendations', mock.AsyncMock(return_value=[]))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def get(self, authenticated=True, **view_options):
+        headers = {'Authorization': f'Token {self.token.key}'} if authenticated else {}
+        request = AsyncRequestFactory().get('/api/recommendations/housing/', headers=headers)
+        view = views.AsyncRecommendationView.as_view(domain='housing', **view_options)
+        # Run from this thread, so the view's database queries see the test's rows.
+        return async_to_sync(view)(request)
+
+    def test_authenticated_requests_get_recommendations(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [])
+
+    def test_anonymous_requests_are_challenged(self):
+        response = self.get(authenticated=False)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    def test_permission_classes_apply(self):
+        response = self.get(permission_classes=[permissions.IsAdminUser])
+        self.assertEqual(response.status_code, 403)
+
+    def test_throttle_classes_apply(self):
+        response = self.get(throttle_classes=[DenyAllThrottle])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        rag_pipeline.aget_recommendations.assert_not_called()
+
+
+class AllRecommendationsTests(CatalogMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def get(self, url_name, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse(url_name), {'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_matches_the_single_domain_endpoints(self):
+        url_names = {
+            'housing': 'housing-recommendations',
+            'roommates': 'roommate-recommendations',
+            'marketplace': 'marketplace-recommendations',
+            'study_groups': 'study-group-recommendations',
+        }
+        # Computed each time, rather than read back from the combined request.
+        patch = mock.patch.object(result_cache, 'CACHE_ALIAS', None)
+        patch.start()
+        self.addCleanup(patch.stop)
+        for user in (self.users[1], self.users[-1]):
+            combined = self.get('all-recommendations', user)
+            self.assertEqual(set(combined), set(url_names))
+            for domain, url_name in url_names.items():
+                self.assertEqual(combined[domain], self.get(url_name, user), f'{user} {domain}')
+
+    def test_embeds_the_profile_once(self):
+        with mock.patch.object(embedding_service, 'embed_text', side_effect=fake_embedding) as embed:
+            results = self.get('all-recommendations', self.users[1])
+        embed.assert_called_once()
+        self.assertTrue(all(results.values()))
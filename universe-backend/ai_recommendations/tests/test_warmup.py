@@ -0,0 +1,69 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .. import embeddings as emb, faiss_service, warmup
+from .helpers import TemporaryIndexesMixin, random_vectors
+
+
+class ShouldWarmUpTests(SimpleTestCase):
+    def check(self, argv, environ, enabled=True):
+        with mock.patch.object(warmup, 'WARM_UP_ENABLED', enabled), \
+                mock.patch.object(warmup.sys, 'argv', argv), \
+                mock.patch.dict(warmup.os.environ, environ, clear=True):
+            return warmup.should_warm_up()
+
+    def test_serving_processes_warm_up(self):
+        self.assertTrue(self.check(['gunicorn'], {warmup.SERVING_ENV_VAR: '1'}))
+        self.assertTrue(self.check(['manage.py', 'runserver'], {'RUN_MAIN': 'true'}))
+
+    def test_other_processes_do_not(self):
+        self.assertFalse(self.check(['manage.py', 'runserver'], {}))
+        self.assertFalse(self.check(['manage.py', 'migrate'], {}))
+        self.assertFalse(self.check(['manage.py', 'migrate'], {'RUN_MAIN': 'true'}))
+
+    def test_off_unless_enabled(self):
+        self.assertFalse(self.check(['gunicorn'], {warmup.SERVING_ENV_VAR: '1'}, enabled=False))
+
+
+class WarmUpTests(TemporaryIndexesMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        for patch in [
+            mock.patch.object(warmup, 'WARM_UP_ENABLED', True),
+            mock.patch.object(warmup, '_report', None),
+            mock.patch.object(emb, '_get_model'),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def get_ready(self):
+        return APIClient().get(reverse('recommendations-ready'))
+
+    def test_loads_the_model_and_indexes(self):
+        faiss_service.build_index('housing', random_vectors(3), [1, 2, 3])
+        faiss_service.invalidate_cache()
+
+        with self.assertLogs(warmup.logger, 'WARNING'):
+            report = warmup.warm_up()
+        emb._get_model.assert_called_once_with()
+        self.assertEqual(report['missing_indexes'], ['marketplace', 'study_groups', 'roommate'])
+        self.assertIn('housing', faiss_service._index_cache)
+        self.assertGreaterEqual(report['total'], report['index_load'])
+
+    def test_not_ready_until_warmed_up(self):
+        response = self.get_ready()
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['ready'])
+
+        with self.assertLogs(warmup.logger, 'WARNING'):
+            warmup.warm_up()
+        response = self.get_ready()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('first_encode', response.json()['warm_up'])
+
+    def test_always_ready_without_warm_up(self):
+        with mock.patch.object(warmup, 'WARM_UP_ENABLED', False):
+            self.assertEqual(self.get_ready().status_code, 200)
@@ -36,6 +36,23 @@ def build_user_profile_text(profile, roommate_profile=None):
     return ". ".join(parts) if parts else "Student profile"
 
 
+# Model fields each builder reads, for loading rows with QuerySet.only().
+# Keep these in step with the builders; a missing field costs a query per row.
+HOUSING_LISTING_TEXT_FIELDS = (
+    'id', 'title', 'housing_type', 'address', 'city', 'state', 'rent_price',
+    'bedrooms', 'bathrooms', 'sq_ft', 'lease_type', 'distance_to_campus',
+    'furnished', 'pets_allowed', 'parking', 'laundry', 'wifi_included', 'ac',
+    'utilities_included', 'description',
+)
+MARKETPLACE_ITEM_TEXT_FIELDS = (
+    'id', 'title', 'item_type', 'price', 'condition', 'location', 'description',
+)
+STUDY_GROUP_TEXT_FIELDS = (
+    'id', 'name', 'subject_area', 'course_code', 'meeting_frequency', 'is_online',
+    'meeting_location', 'meeting_schedule', 'description',
+)
+
+
 def build_housing_listing_text(listing):
     """Build a semantic text representation of a housing listing for embedding."""
     parts = [
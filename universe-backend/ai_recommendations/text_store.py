@@ -0,0 +1,125 @@
+"""
+Texts behind the vectors of each FAISS index.
+
+Every indexed row has an IndexedText holding the text that was embedded, its
+hash and the embedding model, written by ``rebuild_faiss_indexes`` and by
+the incremental updates in indexing.py. This lets:
+
+- incremental updates skip re-embedding rows saved without a text change,
+  updating only their attributes;
+- rebuilds reuse the live index's vectors of rows whose text and model did
+  not change, and write only the rows that did;
+- ``rebuild_faiss_indexes --if-stale`` find indexes built with another model
+  with one indexed query, without loading any model instances.
+"""
+import hashlib
+
+from . import embeddings as emb
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def is_current(index_name, item_id, text):
+    """Whether the index holds ``item_id`` embedded from ``text`` by the active model."""
+    from .models import IndexedText
+
+    return IndexedText.objects.filter(
+        index_name=index_name, object_id=item_id,
+        text_hash=text_hash(text), model_version=emb.MODEL_VERSION,
+    ).exists()
+
+
+def _stored_hashes(index_name, item_ids):
+    """{object_id: text_hash} of the rows of ``item_ids`` embedded by the active model."""
+    from .models import IndexedText
+
+    return dict(
+        IndexedText.objects.filter(
+            index_name=index_name, object_id__in=item_ids, model_version=emb.MODEL_VERSION,
+        ).values_list('object_id', 'text_hash')
+    )
+
+
+def current_ids(index_name, item_ids, texts):
+    """The ``item_ids`` that is_current() holds for, in one query."""
+    stored = _stored_hashes(index_name, item_ids)
+    return [
+        item_id for item_id, text in zip(item_ids, texts)
+        if stored.get(item_id) == text_hash(text)
+    ]
+
+
+def record(index_name, item_ids, texts):
+    """
+    Record that ``item_ids`` were embedded from ``texts`` by the active model,
+    writing only rows that changed.
+
+    Returns:
+        number of rows written
+    """
+    from .models import IndexedText
+
+    hashes = [text_hash(text) for text in texts]
+    stored = _stored_hashes(index_name, item_ids)
+    changed = [
+        IndexedText(
+            index_name=index_name, object_id=item_id, text=text,
+            text_hash=hash_, model_version=emb.MODEL_VERSION,
+        )
+        for item_id, text, hash_ in zip(item_ids, texts, hashes)
+        if stored.get(item_id) != hash_
+    ]
+    if changed:
+        IndexedText.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['index_name', 'object_id'],
+            update_fields=['text', 'text_hash', 'model_version', 'updated_at'],
+        )
+    return len(changed)
+
+
+def forget(index_name, item_ids):
+    from .models import IndexedText
+
+    IndexedText.objects.filter(index_name=index_name, object_id__in=list(item_ids)).delete()
+
+
+def forget_except(index_name, item_ids):
+    """Drop the rows of ``index_name`` other than ``item_ids``, e.g. after a rebuild."""
+    from .models import IndexedText
+
+    keep = set(item_ids)
+    gone = [
+        object_id
+        for object_id in IndexedText.objects.filter(index_name=index_name)
+        .values_list('object_id', flat=True).iterator()
+        if object_id not in keep
+    ]
+    # Batched to stay under the database's query parameter limit.
+    for start in range(0, len(gone), 1000):
+        forget(index_name, gone[start:start + 1000])
+
+
+def current_texts():
+    """Iterate over the texts of every indexed row embedded by the active model."""
+    from .models import IndexedText
+
+    return IndexedText.objects.filter(model_version=emb.MODEL_VERSION).values_list(
+        'text', flat=True
+    ).iterator()
+
+
+def stale_count(index_name):
+    """Indexed rows embedded by a model other than the active one."""
+    from .models import IndexedText
+
+    return IndexedText.objects.filter(index_name=index_name).exclude(
+        model_version=emb.MODEL_VERSION
+    ).count()
+
+
+def indexed_count(index_name):
+    from .models import IndexedText
+
+    return IndexedText.objects.filter(index_name=index_name).count()
@@ -0,0 +1,172 @@
+"""
+Per-stage latency of recommendation requests.
+
+Each view wraps its work in ``track(endpoint)``; pipeline code records stages
+(profile load, text build, embedding, FAISS search, ranking, cache, response
+hydration) with ``stage(name, domain)``, which does nothing outside a tracked
+request. When the request finishes its timings are:
+
+- added to this process's histograms, labelled by endpoint, path ('warm',
+  'cold', or 'cached' when nothing was computed), stage and domain, and
+  exposed in Prometheus text format at /api/recommendations/metrics/;
+- logged as one JSON line on the ``ai_recommendations.timing`` logger;
+- returned in a Server-Timing header if AI_RECOMMENDATIONS_SERVER_TIMING is set.
+
+Histograms are per process; with several workers, scrape each one or
+aggregate the log lines instead.
+"""
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ENABLED = getattr(settings, 'AI_RECOMMENDATIONS_TIMING', True)
+SERVER_TIMING = getattr(settings, 'AI_RECOMMENDATIONS_SERVER_TIMING', False)
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_NAME = 'ai_recommendations_stage_seconds'
+
+_current = contextvars.ContextVar('ai_recommendations_timing', default=None)
+
+# {(endpoint, path, stage, domain): [count per bucket..., count above, sum]}
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+class RequestTiming:
+    """Stage timings of one request."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.path = 'cached'
+        self.stages = []  # (stage, domain, seconds); appended from several threads
+        self.start = time.perf_counter()
+
+    def record(self, stage, seconds, domain=''):
+        self.stages.append((stage, domain or '', seconds))
+
+    def totals(self):
+        """{'stage' or 'stage.domain': milliseconds}, summing repeated stages."""
+        totals = {}
+        for stage, domain, seconds in self.stages:
+            name = f'{stage}.{domain}' if domain else stage
+            totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return totals
+
+
+@contextmanager
+def track(endpoint):
+    """Time a request to ``endpoint``; yields its RequestTiming (None if disabled)."""
+    if not ENABLED:
+        yield None
+        return
+
+    request_timing = RequestTiming(endpoint)
+    token = _current.set(request_timing)
+    try:
+        yield request_timing
+    finally:
+        _current.reset(token)
+        request_timing.record('total', time.perf_counter() - request_timing.start)
+        _finish(request_timing)
+
+
+@contextmanager
+def stage(name, domain=''):
+    """Record the time spent in the block as stage ``name`` of the current request."""
+    request_timing = _current.get()
+    if request_timing is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_timing.record(name, time.perf_counter() - start, domain)
+
+
+def set_path(path):
+    """Mark the current request as served by the 'warm' or 'cold' pipeline."""
+    request_timing = _current.get()
+    if request_timing is not None:
+        request_timing.path = path
+
+
+def in_context(func):
+    """
+    Wrap ``func`` to run in a copy of the caller's context, so stages it
+    records on an executor thread count towards the current request. Each
+    wrapper may run only once at a time.
+    """
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def _finish(request_timing):
+    with _histograms_lock:
+        for stage_name, domain, seconds in request_timing.stages:
+            key = (request_timing.endpoint, request_timing.path, stage_name, domain)
+            histogram = _histograms.get(key)
+            if histogram is None:
+                histogram = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({
+            'endpoint': request_timing.endpoint,
+            'path': request_timing.path,
+            'stages_ms': {name: round(ms, 3) for name, ms in request_timing.totals().items()},
+        }))
+
+
+def server_timing(request_timing):
+    """Server-Timing header value for a finished request."""
+    return ', '.join(
+        f'{name.replace(".", "-")};dur={ms:.2f}'
+        for name, ms in request_timing.totals().items()
+    )
+
+
+def add_server_timing(response, request_timing):
+    """Add the Server-Timing header to ``response`` if enabled; returns the response."""
+    if SERVER_TIMING and request_timing is not None:
+        response['Server-Timing'] = server_timing(request_timing)
+    return response
+
+
+def render_prometheus():
+    """This process's histograms in the Prometheus text exposition format."""
+    lines = [
+        f'# HELP {METRIC_NAME} Time spent in each recommendation pipeline stage.',
+        f'# TYPE {METRIC_NAME} histogram',
+    ]
+    with _histograms_lock:
+        histograms = {key: list(values) for key, values in _histograms.items()}
+
+    for (endpoint, path, stage_name, domain), histogram in sorted(histograms.items()):
+        labels = f'endpoint="{endpoint}",path="{path}",stage="{stage_name}",domain="{domain}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram):
+            cumulative += count
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        total = cumulative + histogram[len(BUCKETS)]
+        lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {total}')
+        lines.append(f'{METRIC_NAME}_sum{{{labels}}} {histogram[-1]:.6f}')
+        lines.append(f'{METRIC_NAME}_count{{{labels}}} {total}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
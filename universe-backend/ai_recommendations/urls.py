@@ -1,14 +1,36 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     HousingRecommendationView,
     RoommateRecommendationView,
     MarketplaceRecommendationView,
     StudyGroupRecommendationView,
+    AllRecommendationsView,
+    AsyncRecommendationView,
+    AsyncAllRecommendationsView,
+    ReadinessView,
+    MetricsView,
 )
 
+if getattr(settings, 'AI_RECOMMENDATIONS_ASYNC_VIEWS', False):
+    housing_view = AsyncRecommendationView.as_view(domain='housing')
+    roommate_view = AsyncRecommendationView.as_view(domain='roommates')
+    marketplace_view = AsyncRecommendationView.as_view(domain='marketplace')
+    study_group_view = AsyncRecommendationView.as_view(domain='study_groups')
+    all_view = AsyncAllRecommendationsView.as_view()
+else:
+    housing_view = HousingRecommendationView.as_view()
+    roommate_view = RoommateRecommendationView.as_view()
+    marketplace_view = MarketplaceRecommendationView.as_view()
+    study_group_view = StudyGroupRecommendationView.as_view()
+    all_view = AllRecommendationsView.as_view()
+
 urlpatterns = [
-    path('housing/', HousingRecommendationView.as_view(), name='housing-recommendations'),
-    path('roommates/', RoommateRecommendationView.as_view(), name='roommate-recommendations'),
-    path('marketplace/', MarketplaceRecommendationView.as_view(), name='marketplace-recommendations'),
-    path('study-groups/', StudyGroupRecommendationView.as_view(), name='study-group-recommendations'),
+    path('housing/', housing_view, name='housing-recommendations'),
+    path('roommates/', roommate_view, name='roommate-recommendations'),
+    path('marketplace/', marketplace_view, name='marketplace-recommendations'),
+    path('study-groups/', study_group_view, name='study-group-recommendations'),
+    path('all/', all_view, name='all-recommendations'),
+    path('ready/', ReadinessView.as_view(), name='recommendations-ready'),
+    path('metrics/', MetricsView.as_view(), name='recommendations-metrics'),
 ]
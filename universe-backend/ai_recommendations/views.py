@@ -1,114 +1,318 @@
+import hmac
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views import View
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import permissions
+from rest_framework import exceptions, permissions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import timing
+from . import warmup
+
+# rag_pipeline (and with it faiss) is imported inside the views so that
+# loading the URLconf, e.g. for `manage.py check`, stays cheap.
+
+
+def _hydrate(recommendations, queryset, serializer_class, request, field_name='id', is_listed=None):
+    """
+    Serialize ranked (id, score) pairs, or (id, score, similarity) triples
+    from re-ranking, loading every row in one query. ``similarity_score`` is
+    the FAISS similarity and ``score`` what the results are ranked by.
+
+    Rows that no longer exist, or that ``is_listed`` rejects (sold or taken
+    since cached results were ranked), are skipped; the ranking order is
+    preserved.
+    """
+    objects = queryset.in_bulk([result[0] for result in recommendations], field_name=field_name)
+    ranked = [
+        result for result in recommendations
+        if result[0] in objects and (is_listed is None or is_listed(objects[result[0]]))
+    ]
+    serializer = serializer_class(
+        [objects[result[0]] for result in ranked], many=True, context={'request': request}
+    )
+
+    return [
+        {
+            'id': result[0],
+            'similarity_score': round(result[-1], 4),
+            'score': round(result[1], 4),
+            'data': data,
+        }
+        for result, data in zip(ranked, serializer.data)
+    ]
+
+
+def _serialize_housing(recommendations, request):
+    from housing.models import HousingListing
+    from housing.serializers import HousingListingSerializer
+
+    queryset = HousingListing.objects.select_related('posted_by').prefetch_related('images')
+    return _hydrate(
+        recommendations, queryset, HousingListingSerializer, request,
+        is_listed=lambda listing: listing.is_available,
+    )
+
+
+def _serialize_roommates(recommendations, request):
+    from user_profiles.models import UserProfile
+    from user_profiles.serializers import UserProfileSerializer
+
+    queryset = UserProfile.objects.select_related('user')
+    return _hydrate(recommendations, queryset, UserProfileSerializer, request, field_name='user_id')
+
+
+def _serialize_marketplace(recommendations, request):
+    from marketplace.models import MarketplaceItem
+    from marketplace.serializers import MarketplaceItemSerializer
+
+    queryset = MarketplaceItem.objects.select_related('seller').prefetch_related('images')
+    return _hydrate(
+        recommendations, queryset, MarketplaceItemSerializer, request,
+        is_listed=lambda item: not item.is_sold,
+    )
+
+
+def _serialize_study_groups(recommendations, request):
+    from django.db.models import Prefetch
+    from study_groups.models import StudyGroup, GroupMembership
+    from study_groups.serializers import StudyGroupSerializer
 
-from .rag_pipeline import (
-    get_housing_recommendations,
-    get_roommate_recommendations,
-    get_marketplace_recommendations,
-    get_study_group_recommendations,
-)
+    queryset = StudyGroup.objects.select_related('creator').prefetch_related(
+        Prefetch('memberships', queryset=GroupMembership.objects.select_related('user'))
+    )
+    return _hydrate(
+        recommendations, queryset, StudyGroupSerializer, request,
+        is_listed=lambda group: group.is_active and not group.is_full,
+    )
+
+
+SERIALIZERS = {
+    'housing': _serialize_housing,
+    'roommates': _serialize_roommates,
+    'marketplace': _serialize_marketplace,
+    'study_groups': _serialize_study_groups,
+}
+
+
+def _serialize(domain, recommendations, request):
+    with timing.stage('hydrate', domain):
+        return SERIALIZERS[domain](recommendations, request)
+
+
+def _serialize_all(recommendations, request):
+    return {
+        domain: _serialize(domain, domain_recommendations, request)
+        for domain, domain_recommendations in recommendations.items()
+    }
 
 
 class HousingRecommendationView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        from housing.models import HousingListing
-        from housing.serializers import HousingListingSerializer
+        from .rag_pipeline import get_housing_recommendations
 
         top_k = int(request.query_params.get('limit', 10))
-        recommendations = get_housing_recommendations(request.user, top_k=top_k)
-
-        results = []
-        for item_id, score in recommendations:
-            try:
-                listing = HousingListing.objects.get(id=item_id)
-                serializer = HousingListingSerializer(listing, context={'request': request})
-                results.append({
-                    'id': item_id,
-                    'similarity_score': round(score, 4),
-                    'data': serializer.data,
-                })
-            except HousingListing.DoesNotExist:
-                continue
-
-        return Response(results)
+        with timing.track('housing') as request_timing:
+            recommendations = get_housing_recommendations(request.user, top_k=top_k)
+            data = _serialize('housing', recommendations, request)
+        return timing.add_server_timing(Response(data), request_timing)
 
 
 class RoommateRecommendationView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        from user_profiles.models import UserProfile
-        from user_profiles.serializers import UserProfileSerializer
+        from .rag_pipeline import get_roommate_recommendations
 
         top_k = int(request.query_params.get('limit', 10))
-        recommendations = get_roommate_recommendations(request.user, top_k=top_k)
-
-        results = []
-        for user_id, score in recommendations:
-            try:
-                profile = UserProfile.objects.get(user_id=user_id)
-                serializer = UserProfileSerializer(profile, context={'request': request})
-                results.append({
-                    'id': user_id,
-                    'similarity_score': round(score, 4),
-                    'data': serializer.data,
-                })
-            except UserProfile.DoesNotExist:
-                continue
-
-        return Response(results)
+        with timing.track('roommates') as request_timing:
+            recommendations = get_roommate_recommendations(request.user, top_k=top_k)
+            data = _serialize('roommates', recommendations, request)
+        return timing.add_server_timing(Response(data), request_timing)
 
 
 class MarketplaceRecommendationView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        from marketplace.models import MarketplaceItem
-        from marketplace.serializers import MarketplaceItemSerializer
+        from .rag_pipeline import get_marketplace_recommendations
 
         top_k = int(request.query_params.get('limit', 10))
-        recommendations = get_marketplace_recommendations(request.user, top_k=top_k)
-
-        results = []
-        for item_id, score in recommendations:
-            try:
-                item = MarketplaceItem.objects.get(id=item_id)
-                serializer = MarketplaceItemSerializer(item, context={'request': request})
-                results.append({
-                    'id': item_id,
-                    'similarity_score': round(score, 4),
-                    'data': serializer.data,
-                })
-            except MarketplaceItem.DoesNotExist:
-                continue
-
-        return Response(results)
+        with timing.track('marketplace') as request_timing:
+            recommendations = get_marketplace_recommendations(request.user, top_k=top_k)
+            data = _serialize('marketplace', recommendations, request)
+        return timing.add_server_timing(Response(data), request_timing)
 
 
 class StudyGroupRecommendationView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        from study_groups.models import StudyGroup
-        from study_groups.serializers import StudyGroupSerializer
+        from .rag_pipeline import get_study_group_recommendations
 
         top_k = int(request.query_params.get('limit', 10))
-        recommendations = get_study_group_recommendations(request.user, top_k=top_k)
-
-        results = []
-        for group_id, score in recommendations:
-            try:
-                group = StudyGroup.objects.get(id=group_id)
-                serializer = StudyGroupSerializer(group, context={'request': request})
-                results.append({
-                    'id': group_id,
-                    'similarity_score': round(score, 4),
-                    'data': serializer.data,
-                })
-            except StudyGroup.DoesNotExist:
+        with timing.track('study_groups') as request_timing:
+            recommendations = get_study_group_recommendations(request.user, top_k=top_k)
+            data = _serialize('study_groups', recommendations, request)
+        return timing.add_server_timing(Response(data), request_timing)
+
+
+class AllRecommendationsView(APIView):
+    """Recommendations for every domain, computed with one profile lookup and embedding."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        from .rag_pipeline import get_all_recommendations
+
+        top_k = int(request.query_params.get('limit', 10))
+        with timing.track('all') as request_timing:
+            recommendations = get_all_recommendations(request.user, top_k=top_k)
+            data = _serialize_all(recommendations, request)
+        return timing.add_server_timing(Response(data), request_timing)
+
+
+# --- Async views ---
+# Used instead of the views above when AI_RECOMMENDATIONS_ASYNC_VIEWS is set
+# (see urls.py). DRF's APIView cannot run async handlers, so these are plain
+# Django async views that authenticate, check permissions and throttle with
+# DRF's classes as APIView.initial does, and render with its JSON renderer,
+# returning the same payloads.
+
+def _json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+class AsyncAPIView(View):
+    """Base of the async views, configured with the same attributes as an APIView."""
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+
+    def check_access(self, request):
+        """
+        Authenticate ``request``, then check permissions and throttles.
+
+        Returns:
+            (drf_request, None) on success, (None, error response) otherwise
+        """
+        drf_request = Request(
+            request, authenticators=[auth() for auth in self.authentication_classes]
+        )
+        try:
+            drf_request.user  # authenticates, as APIView.perform_authentication
+            self._check_permissions(drf_request)
+            self._check_throttles(drf_request)
+        except exceptions.APIException as exc:
+            return None, self._error_response(drf_request, exc)
+        return drf_request, None
+
+    def _check_permissions(self, request):
+        for permission in [permission() for permission in self.permission_classes]:
+            if permission.has_permission(request, self):
                 continue
+            if request.authenticators and not request.successful_authenticator:
+                raise exceptions.NotAuthenticated()
+            raise exceptions.PermissionDenied(
+                getattr(permission, 'message', None), getattr(permission, 'code', None)
+            )
+
+    def _check_throttles(self, request):
+        durations = [
+            throttle.wait() for throttle in [throttle() for throttle in self.throttle_classes]
+            if not throttle.allow_request(request, self)
+        ]
+        if durations:
+            durations = [duration for duration in durations if duration is not None]
+            raise exceptions.Throttled(max(durations, default=None))
+
+    def _error_response(self, request, exc):
+        response = _json_response({'detail': exc.detail}, exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            authenticators = request.authenticators
+            challenge = authenticators[0].authenticate_header(request) if authenticators else None
+            if challenge:
+                response['WWW-Authenticate'] = challenge
+            else:
+                # DRF downgrades to 403 when there is no challenge to offer.
+                response.status_code = status.HTTP_403_FORBIDDEN
+        if getattr(exc, 'wait', None):
+            response['Retry-After'] = '%d' % exc.wait
+        return response
+
+
+class AsyncRecommendationView(AsyncAPIView):
+    """Async recommendations for one domain; pass ``domain`` to as_view()."""
+    domain = None
+
+    async def get(self, request):
+        from .rag_pipeline import aget_recommendations
+
+        drf_request, error = await sync_to_async(self.check_access)(request)
+        if error is not None:
+            return error
 
-        return Response(results)
+        top_k = int(request.GET.get('limit', 10))
+        with timing.track(self.domain) as request_timing:
+            recommendations = await aget_recommendations(self.domain, drf_request.user, top_k=top_k)
+            data = await sync_to_async(_serialize)(self.domain, recommendations, drf_request)
+        return timing.add_server_timing(_json_response(data), request_timing)
+
+
+class AsyncAllRecommendationsView(AsyncAPIView):
+    """Async counterpart of AllRecommendationsView."""
+
+    async def get(self, request):
+        from .rag_pipeline import aget_all_recommendations
+
+        drf_request, error = await sync_to_async(self.check_access)(request)
+        if error is not None:
+            return error
+
+        top_k = int(request.GET.get('limit', 10))
+        with timing.track('all') as request_timing:
+            recommendations = await aget_all_recommendations(drf_request.user, top_k=top_k)
+            data = await sync_to_async(_serialize_all)(recommendations, drf_request)
+        return timing.add_server_timing(_json_response(data), request_timing)
+
+
+class ReadinessView(APIView):
+    """503 until this worker has finished its warm-up (AI_RECOMMENDATIONS_WARM_UP)."""
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        ready = warmup.is_ready()
+        return Response(
+            {'ready': ready, 'warm_up': warmup.get_report()},
+            status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+
+# Scrapers read the metrics with "Authorization: Bearer <token>"; staff users
+# can always read them.
+METRICS_TOKEN = getattr(settings, 'AI_RECOMMENDATIONS_METRICS_TOKEN', '')
+
+
+class CanReadMetrics(permissions.BasePermission):
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return bool(METRICS_TOKEN) and hmac.compare_digest(
+            header.encode(), f'Bearer {METRICS_TOKEN}'.encode()
+        )
+
+
+class MetricsView(APIView):
+    """Per-stage latency histograms of this worker process, in Prometheus text format."""
+    permission_classes = [CanReadMetrics]
+
+    def get(self, request):
+        return HttpResponse(timing.render_prometheus(), content_type='text/plain; version=0.0.4')
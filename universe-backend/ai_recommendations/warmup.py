@@ -0,0 +1,89 @@
+"""
+Worker warm-up: load the embedding model and FAISS indexes before serving.
+
+Without it the first recommendation request on each worker pays for
+importing torch, loading the model and reading every index.
+"""
+import logging
+import os
+import sys
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_ENABLED = getattr(settings, 'AI_RECOMMENDATIONS_WARM_UP', False)
+
+# Set by the server entrypoints (universe_backend/wsgi.py and asgi.py) before
+# Django starts; set it yourself for servers started some other way.
+SERVING_ENV_VAR = 'AI_RECOMMENDATIONS_SERVING'
+
+INDEX_NAMES = ('housing', 'marketplace', 'study_groups', 'roommate')
+
+# Seconds per warm-up stage once finished, None before; see get_report().
+_report = None
+
+
+def should_warm_up():
+    """
+    True if warm-up is enabled and this process will serve requests: it was
+    started through the WSGI/ASGI entrypoint, or is runserver's child
+    process (not the autoreloader's parent). Management commands, shells,
+    test runners and workers that only import Django are skipped.
+    """
+    if not WARM_UP_ENABLED:
+        return False
+    if os.environ.get(SERVING_ENV_VAR) == '1':
+        return True
+    return sys.argv[1:2] == ['runserver'] and os.environ.get('RUN_MAIN') == 'true'
+
+
+def warm_up():
+    """
+    Load the embedding model, run one encode and load every FAISS index.
+
+    Returns:
+        dict of seconds spent per stage, plus 'missing_indexes'
+    """
+    global _report
+    from . import embeddings as emb
+    from . import faiss_service
+
+    timings = {}
+    start = time.perf_counter()
+
+    stage = time.perf_counter()
+    emb._get_model()
+    timings['model_load'] = time.perf_counter() - stage
+
+    # The first forward pass allocates buffers and picks kernels.
+    stage = time.perf_counter()
+    emb.embed_text('warm-up')
+    timings['first_encode'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    missing = [name for name in INDEX_NAMES if faiss_service.load_index(name) is None]
+    timings['index_load'] = time.perf_counter() - stage
+
+    timings['total'] = time.perf_counter() - start
+    timings['missing_indexes'] = missing
+
+    logger.info(
+        'AI recommendations warm-up finished in %.2fs (model %.2fs, encode %.2fs, indexes %.2fs)',
+        timings['total'], timings['model_load'], timings['first_encode'], timings['index_load'],
+    )
+    if missing:
+        logger.warning('FAISS indexes not built yet: %s', ', '.join(missing))
+
+    _report = timings
+    return timings
+
+
+def is_ready():
+    """True once warm-up has finished (here or in the parent before a fork), or if it is off."""
+    return not WARM_UP_ENABLED or _report is not None
+
+
+def get_report():
+    return _report
@@ -28,6 +28,9 @@ class StudyGroup(models.Model):
 
     @property
     def member_count(self):
+        # Count in Python when memberships were prefetched to avoid a query per group.
+        if 'memberships' in getattr(self, '_prefetched_objects_cache', {}):
+            return sum(1 for m in self.memberships.all() if m.is_active)
         return self.memberships.filter(is_active=True).count()
 
     @property
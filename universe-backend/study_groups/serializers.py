@@ -52,16 +52,25 @@ class StudyGroupSerializer(serializers.ModelSerializer):
     def get_is_full(self, obj):
         return obj.is_full
 
+    def _get_active_membership(self, obj, user):
+        # Reuse prefetched memberships when available instead of querying per group.
+        if 'memberships' in getattr(obj, '_prefetched_objects_cache', {}):
+            return next(
+                (m for m in obj.memberships.all() if m.user_id == user.id and m.is_active),
+                None,
+            )
+        return obj.memberships.filter(user=user, is_active=True).first()
+
     def get_is_member(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.memberships.filter(user=request.user, is_active=True).exists()
+            return self._get_active_membership(obj, request.user) is not None
         return False
 
     def get_user_role(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            membership = obj.memberships.filter(user=request.user, is_active=True).first()
+            membership = self._get_active_membership(obj, request.user)
             return membership.role if membership else None
         return None
 
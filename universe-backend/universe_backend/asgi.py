@@ -12,6 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'universe_backend.settings')
+# This process serves requests, so AI_RECOMMENDATIONS_WARM_UP applies to it.
+os.environ.setdefault('AI_RECOMMENDATIONS_SERVING', '1')
 
 # Initialize Django ASGI application early to ensure AppRegistry is populated
 # before importing consumers and routing modules.
@@ -197,3 +197,123 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# AI recommendations
+# Re-embed single rows on save and update the live FAISS index in place.
+# Set to False to fall back to dropping the cached index on every save; the
+# changed rows are then picked up by rebuild_faiss_indexes --if-stale.
+AI_RECOMMENDATIONS_INCREMENTAL_INDEXING = True
+# Re-embed on a background thread after the transaction commits, so saves
+# never wait for the model. Set to False to do it in the committing thread.
+AI_RECOMMENDATIONS_INCREMENTAL_INDEXING_IN_BACKGROUND = True
+
+# Per-process LRU cache of embedded user profile text for recommendation queries.
+AI_RECOMMENDATIONS_QUERY_CACHE_SIZE = 1024
+AI_RECOMMENDATIONS_QUERY_CACHE_TTL = 300  # seconds
+
+# FAISS index type per index name ('default' applies to all). Types: 'flat',
+# 'ivf_flat', 'ivf_pq', 'hnsw', or 'auto' (flat below 50k vectors, IVF-Flat
+# below 1M, IVF-PQ above). Search knobs: 'nprobe' (IVF), 'ef_search' (HNSW).
+# See ai_recommendations.faiss_service.DEFAULT_INDEX_CONFIG for every option.
+AI_RECOMMENDATIONS_FAISS_INDEXES = {
+    'default': {'type': 'auto'},
+}
+
+# Memory-map FAISS indexes and their attribute arrays so workers on one host
+# share them through the page cache.
+AI_RECOMMENDATIONS_FAISS_MMAP = True
+
+# Each rebuild publishes a new index generation; this many previous
+# generations are kept for workers still reading them.
+AI_RECOMMENDATIONS_FAISS_KEEP_GENERATIONS = 2
+
+# Incremental updates are appended to the live generation's delta log and
+# searched next to the index; after this many records the log is folded
+# into a new generation in the background.
+AI_RECOMMENDATIONS_FAISS_COMPACT_AFTER = 1000
+
+# Query embeddings from concurrent requests are encoded together: the first
+# request waits up to BATCH_WINDOW_MS for others, up to MAX_BATCH texts.
+AI_RECOMMENDATIONS_EMBEDDING_BATCHING = True
+AI_RECOMMENDATIONS_EMBEDDING_BATCH_WINDOW_MS = 3
+AI_RECOMMENDATIONS_EMBEDDING_MAX_BATCH = 32
+
+# Embedding inference backend: 'torch', 'torch_int8', 'onnx' or 'onnx_int8'.
+# The ONNX backends need `pip install sentence-transformers[onnx]`. Check a
+# backend against the full-precision model with
+# `python manage.py check_embedding_parity --backend onnx_int8`.
+AI_RECOMMENDATIONS_EMBEDDING_BACKEND = 'torch'
+AI_RECOMMENDATIONS_EMBEDDING_ONNX_INT8_FILE = 'onnx/model_quint8_avx2.onnx'
+
+# rebuild_faiss_indexes rewrites its embedding cache without the texts no
+# index holds any more, once they make up this share of the cached rows.
+AI_RECOMMENDATIONS_EMBEDDING_STORE_COMPACT_MIN_GARBAGE = 0.25
+
+# Load the embedding model and FAISS indexes while the app starts instead of
+# on the first request. /api/recommendations/ready/ returns 503 until this
+# is done. With gunicorn --preload the warmed model is shared by the workers.
+# Only processes started through wsgi.py/asgi.py (which set
+# AI_RECOMMENDATIONS_SERVING=1) or runserver warm up.
+AI_RECOMMENDATIONS_WARM_UP = False
+
+# Serve the recommendation endpoints from async views (for Daphne/ASGI). At
+# most MAX_INFLIGHT_INFERENCE requests per worker embed and search at once.
+AI_RECOMMENDATIONS_ASYNC_VIEWS = False
+AI_RECOMMENDATIONS_MAX_INFLIGHT_INFERENCE = 8
+
+# Per-user recommendation results are cached in this Django cache (None to
+# disable). Entries are fresh for RESULT_CACHE_TTL seconds and then served
+# for up to RESULT_CACHE_STALE more while being refreshed in the background.
+# Rebuilding an index invalidates its entries; incremental updates show up
+# as entries are refreshed. Configure a shared cache (Redis, Memcached) in production so that results
+# from `manage.py precompute_recommendations` reach every worker.
+AI_RECOMMENDATIONS_RESULT_CACHE = 'default'
+AI_RECOMMENDATIONS_RESULT_CACHE_TTL = 900  # seconds
+AI_RECOMMENDATIONS_RESULT_CACHE_STALE = 3600  # seconds
+AI_RECOMMENDATIONS_RESULT_CACHE_TOP_K = 20
+
+# Per-stage latency of recommendation requests (profile, embedding, search,
+# ranking, hydration...), kept as histograms served at
+# /api/recommendations/metrics/ and logged as JSON on the
+# ai_recommendations.timing logger. SERVER_TIMING also returns the stages of
+# each request in a Server-Timing response header.
+AI_RECOMMENDATIONS_TIMING = True
+AI_RECOMMENDATIONS_SERVER_TIMING = False
+# The metrics are served to staff users, and to scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>" if a token is set.
+AI_RECOMMENDATIONS_METRICS_TOKEN = os.environ.get('AI_RECOMMENDATIONS_METRICS_TOKEN', '')
+
+# Also index housing listings per city (housing@<city>-<state>) and search
+# only the shards of the user's campus city (UserProfile.city/state) instead
+# of the whole catalog. MARKETS lists the shards searched for a campus city,
+# merged by score, e.g. {'university-town-ca': ['university-town-ca', 'springfield-ca']}.
+# Cities are normalized first, so 'Austin, Texas' and 'austin' + 'TX' are both
+# 'austin-tx'; users whose market has no shard built search the whole catalog.
+# Run `manage.py rebuild_faiss_indexes --index housing` after turning this on.
+AI_RECOMMENDATIONS_HOUSING_SHARDS = False
+AI_RECOMMENDATIONS_HOUSING_MARKETS = {}
+
+# Housing and roommate results are re-ranked by a weighted sum of similarity
+# and structured features (see ai_recommendations/ranking.py): budget fit,
+# distance to campus and recency for housing; calculate_compatibility and
+# recency for roommates. WEIGHTS overrides the defaults per domain and
+# feature, e.g. {'housing': {'distance': 0.3}}; set every feature but
+# similarity to 0 to rank by similarity alone. The search fetches
+# RANKING_CANDIDATES results to re-rank. Run `manage.py rebuild_faiss_indexes`
+# once so the indexes carry the new attribute columns.
+AI_RECOMMENDATIONS_RANKING_WEIGHTS = {}
+AI_RECOMMENDATIONS_RANKING_CANDIDATES = 100
+AI_RECOMMENDATIONS_RANKING_DISTANCE_SCALE_MILES = 2.0
+AI_RECOMMENDATIONS_RANKING_RECENCY_HALF_LIFE_DAYS = 30
+
+# Cold-start users (little profile signal) get a popularity/recency ranking
+# per domain, computed from rows passing the hybrid filters and kept in this
+# Django cache (None to compute it on every request). Rankings older than
+# REFRESH seconds, or missing (served empty until then), are recomputed in
+# the background; or run `manage.py refresh_cold_start_rankings` from cron. SIZE is the most
+# results a cold-start request can return.
+AI_RECOMMENDATIONS_COLD_START_CACHE = 'default'
+AI_RECOMMENDATIONS_COLD_START_REFRESH = 600  # seconds
+AI_RECOMMENDATIONS_COLD_START_SIZE = 100
+AI_RECOMMENDATIONS_COLD_START_POPULARITY_WEIGHT = 0.5
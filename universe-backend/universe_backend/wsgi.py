@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'universe_backend.settings')
+# This process serves requests, so AI_RECOMMENDATIONS_WARM_UP applies to it.
+os.environ.setdefault('AI_RECOMMENDATIONS_SERVING', '1')
 
 application = get_wsgi_application()
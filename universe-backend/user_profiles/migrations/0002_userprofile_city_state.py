@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='city',
+            field=models.CharField(blank=True, help_text='City of the campus the student attends', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='state',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
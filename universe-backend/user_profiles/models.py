@@ -11,6 +11,8 @@ class UserProfile(models.Model):
     interests = models.TextField(blank=True)
     course_major = models.CharField(max_length=100, blank=True)
     bio = models.TextField(blank=True)
+    city = models.CharField(max_length=100, blank=True, help_text='City of the campus the student attends')
+    state = models.CharField(max_length=50, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics', null=True, blank=True)
     date_joined = models.DateTimeField(auto_now_add=True)
 
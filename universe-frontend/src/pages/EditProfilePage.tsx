@@ -27,6 +27,7 @@ import {
   CameraAlt as CameraIcon,
   Save as SaveIcon,
   ArrowBack as ArrowBackIcon,
+  LocationOn as LocationIcon,
 } from '@mui/icons-material';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
@@ -44,6 +45,8 @@ interface UserProfile {
   gender: string;
   interests: string;
   course_major: string;
+  city: string;
+  state: string;
   bio: string;
   profile_picture: string | null;
   date_joined: string;
@@ -66,6 +69,8 @@ const EditProfilePage: React.FC = () => {
     gender: '',
     interests: '',
     course_major: '',
+    city: '',
+    state: '',
     bio: '',
   });
 
@@ -87,6 +92,8 @@ const EditProfilePage: React.FC = () => {
             gender: profile.gender || '',
             interests: profile.interests || '',
             course_major: profile.course_major || '',
+            city: profile.city || '',
+            state: profile.state || '',
             bio: profile.bio || '',
           });
 
@@ -329,6 +336,35 @@ const EditProfilePage: React.FC = () => {
                   />
                 </Grid>
 
+                {/* Campus location */}
+                <Grid item xs={12} sm={8}>
+                  <TextField
+                    fullWidth
+                    name="city"
+                    label="Campus City"
+                    value={formValues.city}
+                    onChange={handleInputChange}
+                    helperText="Housing recommendations are drawn from listings in your campus city."
+                    InputProps={{
+                      startAdornment: (
+                        <InputAdornment position="start">
+                          <LocationIcon sx={{ color: 'text.secondary' }} />
+                        </InputAdornment>
+                      ),
+                    }}
+                  />
+                </Grid>
+                <Grid item xs={12} sm={4}>
+                  <TextField
+                    fullWidth
+                    name="state"
+                    label="State"
+                    value={formValues.state}
+                    onChange={handleInputChange}
+                    placeholder="e.g. TX"
+                  />
+                </Grid>
+
                 {/* Interests */}
                 <Grid item xs={12}>
                   <TextField
@@ -3,6 +3,7 @@ import axios from 'axios';
 export interface Recommendation {
   id: number;
   similarity_score: number;
+  score: number;
   data: any;
 }
 